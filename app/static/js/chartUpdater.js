@@ -4,12 +4,54 @@
 import { calculateFibonacciLevels } from './fibonacciCalculator.js'; // Calculates Fibonacci levels
 import { updateSignalDisplay } from './signalDisplay.js'; // Updates the display of buy/sell signals
 import { updatePlot } from './plotManager.js'; // Updates the chart with new data
-import { updatePerformanceChart } from './performanceChartUpdater.js'; // Import the performance chart updater
+import { updatePerformanceChart, updateAccuracyChart } from './performanceChartUpdater.js'; // Import the performance chart updaters
 
 // Maintain a list of accuracy values and timestamps for performance charting
 let accuracyHistory = [];
 let timeStamps = [];
 
+// Chart currently displayed, rebuilt from the snapshot and deltas sent by the server
+let chartState = null;
+
+// Series with one value per bar (sliced by the deltas) and their binary encoding
+const BAR_SERIES = { times: Float64Array, prices: Float32Array, rsi: Float32Array };
+
+// Decode a binary array sent by the server (ArrayBuffer) into a plain array
+const decode = (buffer, ArrayType) => Array.from(new ArrayType(buffer));
+
+// Sequence number of the chart currently displayed (null before the first snapshot)
+export const chartSequence = () => (chartState ? chartState.seq : null);
+
+// Function to apply an 'update_chart' message (snapshot or delta) and redraw the chart.
+// Returns false if a delta does not follow the displayed chart: a new snapshot is needed
+export const applyChartMessage = (message) => {
+  const data = { ...message, predicted_prices: decode(message.predicted_prices, Float32Array) };
+
+  if (message.type === "delta") {
+    if (!chartState || chartState.symbol !== message.symbol || chartState.timeframe !== message.timeframe) {
+      // Delta of another market (e.g. sent before a switch): ignore it
+      return chartState !== null;
+    }
+    if (message.base_seq !== chartState.seq) {
+      return false;
+    }
+    // Drop the oldest bars, keep the unchanged ones and append the new/replaced bars
+    for (const [name, ArrayType] of Object.entries(BAR_SERIES)) {
+      data[name] = chartState[name]
+        .slice(message.drop, message.drop + message.keep)
+        .concat(decode(message[name], ArrayType));
+    }
+  } else {
+    for (const [name, ArrayType] of Object.entries(BAR_SERIES)) {
+      data[name] = decode(message[name], ArrayType);
+    }
+  }
+
+  chartState = data;
+  updateChart(data);
+  return true;
+};
+
 // Main function to update the chart with the provided data
 export const updateChart = (data) => {
   const DEBUG = false; // Set to true for debugging
@@ -20,9 +62,13 @@ export const updateChart = (data) => {
   const takeProfit = isNaN(data.take_profit) ? 0 : data.take_profit;
   const stopLoss = isNaN(data.stop_loss) ? 0 : data.stop_loss;
 
+  // Bar interval (ms), from the bar times sent by the server
+  const barInterval = data.times && data.times.length > 1 ? data.times[data.times.length - 1] - data.times[data.times.length - 2] : 15 * 60 * 1000;
+  const lastBarTime = data.times && data.times.length ? data.times[data.times.length - 1] : Date.now();
+
   // Prepare real price data points with time values for the x-axis
   const realPrices = data.prices.map((price, i) => ({
-    x: new Date(Date.now() - (data.prices.length - i) * 15 * 60 * 1000), // Create time intervals
+    x: data.times ? new Date(data.times[i]) : new Date(Date.now() - (data.prices.length - i) * barInterval), // Bar times
     y: price, // Price values
   }));
 
@@ -47,7 +93,7 @@ export const updateChart = (data) => {
 
   // Structure the predicted price data for future values
   const predictedPrices = data.predicted_prices.map((price, i) => ({
-    x: new Date(Date.now() + (i + 1) * 15 * 60 * 1000), // Future time intervals
+    x: new Date(lastBarTime + (i + 1) * barInterval), // Future time intervals
     y: price, // Predicted price values
   }));
 
@@ -168,6 +214,11 @@ export const updateChart = (data) => {
 
   // Call the updateSignalDisplay function to update the signal display (e.g., Buy/Sell signals)
   updateSignalDisplay(data);
+
+  // Per-step forecast accuracy of the model
+  if (data.accuracy) {
+    updateAccuracyChart(data.accuracy);
+  }
 };
 
 // Function to handle performance updates
@@ -1,12 +1,22 @@
 // main.js
 
 import { initializeSocket } from './socketHandler.js'; // Handles WebSocket initialization and data fetching
-import { updateChart } from './chartUpdater.js'; // Updates the chart with data
+import { applyChartMessage } from './chartUpdater.js'; // Applies the chart snapshots and deltas
+import { initializeTraining } from './trainModel.js'; // Training controls and progress
 
 // Create a WebSocket connection using Socket.IO
 const socket = io();
 
 window.onload = function () {
   // Initialize WebSocket and start listening for updates
-  initializeSocket(socket, updateChart);
+  const connection = initializeSocket(socket, applyChartMessage);
+
+  // Train the selected model from the dashboard
+  initializeTraining(socket);
+
+  // Switch the chart to the symbol picked in the model selector
+  const modelSelector = document.getElementById('modelSelector');
+  if (modelSelector) {
+    modelSelector.addEventListener('change', () => connection.setMarket(modelSelector.value));
+  }
 };
@@ -25,4 +25,34 @@ export const updatePerformanceChart = (data) => {
       Plotly.newPlot('performanceChart', [performanceData], layout);
     }
   };
-  
\ No newline at end of file
+  
+// Function to plot the forecast error and directional accuracy of each forecast step
+export const updateAccuracyChart = (accuracy) => {
+    const steps = accuracy.mae.map((_, i) => i + 1);
+
+    const maeData = {
+      x: steps,
+      y: accuracy.mae,
+      mode: "lines",
+      name: "MAE",
+      line: { color: "orange" }
+    };
+    const directionData = {
+      x: steps,
+      y: accuracy.directional_accuracy,
+      mode: "lines",
+      name: "Directional accuracy",
+      line: { color: "green" },
+      yaxis: "y2"
+    };
+
+    const layout = {
+      title: 'Forecast Accuracy by Horizon',
+      xaxis: { title: 'Bars ahead' },
+      yaxis: { title: 'MAE (USD)' },
+      yaxis2: { title: 'Directional accuracy', overlaying: 'y', side: 'right', range: [0, 1] },
+      legend: { orientation: "h" },
+    };
+
+    Plotly.react('accuracyChart', [maeData, directionData], layout);
+  };
@@ -57,52 +57,3 @@ export const updateSignalDisplay = (data) => {
   // Update take profit
   updateElementText("take_profit", `Take Profit: ${data.take_profit ? data.take_profit.toFixed(2) : "N/A"}`);
 };
-
-// Function to handle model training progress updates
-export const handleModelTrainingProgress = (socket) => {
-  const trainingProgressBar = document.getElementById('trainingProgressBar');
-  const trainingStatusText = document.getElementById('trainingStatus');
-
-  if (!trainingProgressBar || !trainingStatusText) {
-    console.error('Training progress elements not found in the DOM.');
-    return;
-  }
-
-  // Update progress bar when receiving training progress
-  socket.on('training_progress', (progress) => {
-    trainingProgressBar.value = progress;
-    trainingStatusText.textContent = `Training progress: ${progress.toFixed(2)}%`;
-  });
-
-  // Handle training completion
-  socket.on('training_complete', () => {
-    alert('Model training completed!');
-    trainingProgressBar.value = 100;
-    trainingStatusText.textContent = 'Training complete! 100%';
-  });
-};
-
-// Function to initialize model training when 'train' button is clicked
-export const initializeTrainingButton = (socket) => {
-  const trainButton = document.getElementById('trainButton');
-  const modelSelector = document.getElementById('modelSelector');
-
-  if (!trainButton || !modelSelector) {
-    console.error('Training button or model selector not found in the DOM.');
-    return;
-  }
-
-  // Add event listener to the train button
-  trainButton.addEventListener('click', () => {
-    const selectedModel = modelSelector.value;
-
-    // Show the progress bar
-    const progressContainer = document.getElementById('progressContainer');
-    if (progressContainer) {
-      progressContainer.style.display = 'block';
-    }
-
-    // Emit the event to start training
-    socket.emit('start_training', { model: selectedModel });
-  });
-};
@@ -1,11 +1,35 @@
 // socketHandler.js
 
-// Function to initialize the WebSocket connection and request data every 10 seconds
-export const initializeSocket = (socket, updateChart, interval = 10000) => {
-  // Listen for updates from the server on the "update_chart" event
-  socket.on("update_chart", (data) => {
-    console.log("Received update from server:", data);
-    updateChart(data);
+import { updatePerformanceChart } from './performanceChartUpdater.js'; // Plots the forecast accuracy over time
+import { applyChartMessage, chartSequence } from './chartUpdater.js'; // Applies the chart snapshots and deltas
+
+// Function to initialize the WebSocket connection and request data every 10 seconds.
+// `updateChart` receives each 'update_chart' message (snapshot or delta) and returns false when it needs a new snapshot
+export const initializeSocket = (socket, updateChart = applyChartMessage, interval = 10000, symbol = "ETH-USD", timeframe = "15min") => {
+  // Market currently displayed; the server pushes every new result to its room
+  const market = { symbol, timeframe };
+
+  const subscribe = () => socket.emit("subscribe", market);
+  socket.on("connect", subscribe);
+  if (socket.connected) {
+    subscribe();
+  }
+
+  // Listen for updates from the server on the "update_chart" event: a snapshot, then deltas
+  socket.on("update_chart", (message) => {
+    console.log(`Received ${message.type} #${message.seq} from server`);
+    if (!updateChart(message)) {
+      // A delta was missed: ask for a snapshot
+      socket.emit("request_data", market);
+    }
+  });
+
+  // Directional accuracy of the forecasts, pushed after each compute cycle
+  socket.on("update_performance", updatePerformanceChart);
+
+  // Symbol or timeframe not served by the server
+  socket.on("market_error", (data) => {
+    console.error(`Market ${data.symbol} ${data.timeframe} unavailable:`, data.error);
   });
 
   // Handle connection errors
@@ -17,12 +41,20 @@ export const initializeSocket = (socket, updateChart, interval = 10000) => {
     console.warn("Disconnected from server.");
   });
 
-  // Clear any previous interval to prevent multiple intervals
+  // Fallback polling: the server only answers (with a snapshot) if a newer payload than ours exists
   let requestInterval = setInterval(() => {
-    socket.emit("request_data");
+    socket.emit("request_data", { ...market, seq: chartSequence() });
     console.log("Requesting data from server...");
   }, interval);
 
-  // Return a function to stop the interval if needed
-  return () => clearInterval(requestInterval);
+  return {
+    // Stop the polling interval
+    stop: () => clearInterval(requestInterval),
+    // Switch to another symbol (ticker or slug such as "btc_usd") and/or timeframe
+    setMarket: (newSymbol, newTimeframe = market.timeframe) => {
+      market.symbol = newSymbol;
+      market.timeframe = newTimeframe;
+      subscribe();
+    },
+  };
 };
@@ -1,23 +1,88 @@
-document.getElementById('trainButton').addEventListener('click', function() {
-    const selectedModel = document.getElementById('modelSelector').value;
+// trainModel.js
+
+// Function to wire the training controls: the server trains the selected model in the background
+// and streams its progress to this client only
+export const initializeTraining = (socket) => {
+  const trainButton = document.getElementById('trainButton');
+  const cancelButton = document.getElementById('cancelTrainingButton');
+  const modelSelector = document.getElementById('modelSelector');
+  const timeframeSelector = document.getElementById('trainTimeframe');
+  const progressContainer = document.getElementById('progressContainer');
+  const progressBar = document.getElementById('trainingProgress');
+  const progressPercent = document.getElementById('progressPercent');
+  const statusText = document.getElementById('trainingStatus');
+
+  if (!trainButton || !modelSelector || !progressBar) {
+    console.error('Training controls not found in the DOM.');
+    return;
+  }
+
+  // Model being trained from this page ({ model, timeframe }), null if none
+  let current = null;
+
+  const setRunning = (running) => {
+    trainButton.disabled = running;
+    if (cancelButton) {
+      cancelButton.disabled = !running;
+    }
+  };
+
+  const setProgress = (progress, status) => {
+    progressBar.value = progress;
+    progressPercent.textContent = `${progress.toFixed(1)}%`;
+    if (statusText) {
+      statusText.textContent = status;
+    }
+  };
+
+  trainButton.addEventListener('click', () => {
+    current = { model: modelSelector.value, timeframe: timeframeSelector ? timeframeSelector.value : '15min' };
 
     // Show progress bar
-    document.getElementById('progressContainer').style.display = 'block';
+    progressContainer.style.display = 'block';
+    setProgress(0, 'Starting...');
+    setRunning(true);
 
     // Send request to start training
-    const socket = io();  // Assuming Socket.IO is used for real-time communication
-    socket.emit('start_training', { model: selectedModel });
+    socket.emit('start_training', current);
+  });
 
-    // Update the progress bar
-    socket.on('training_progress', (progress) => {
-        document.getElementById('trainingProgress').value = progress;
-        document.getElementById('progressPercent').textContent = `${progress}%`;
+  if (cancelButton) {
+    cancelButton.addEventListener('click', () => {
+      if (current) {
+        socket.emit('cancel_training', current);
+      }
     });
+  }
 
-    // Handle training completion
-    socket.on('training_complete', () => {
-        alert('Model training completed!');
-        document.getElementById('trainingProgress').value = 100;
-        document.getElementById('progressPercent').textContent = '100%';
-    });
-});
+  // Update the progress bar
+  socket.on('training_progress', (data) => {
+    const labels = {
+      queued: 'Waiting for a free training slot...',
+      loading: 'Loading data...',
+      training: `Epoch ${data.epoch}/${data.epochs}, batch ${data.batch}/${data.batches}, loss ${data.loss !== undefined ? data.loss.toFixed(6) : ''}`,
+      exporting: 'Exporting the model...',
+      published: `Published version ${data.version}`,
+    };
+    setProgress(data.progress || 0, labels[data.status] || data.status);
+  });
+
+  // Handle training completion
+  socket.on('training_complete', (data) => {
+    setProgress(100, `Model training completed (version ${data.version}).`);
+    setRunning(false);
+    current = null;
+  });
+
+  socket.on('training_failed', (data) => {
+    setProgress(progressBar.value, `Training failed: ${data.error}`);
+    setRunning(false);
+    current = null;
+  });
+
+  socket.on('training_cancelled', () => {
+    setProgress(progressBar.value, 'Training cancelled.');
+    setRunning(false);
+    current = null;
+  });
+};
@@ -0,0 +1,3 @@
+# /benchmarks/__init__.py
+#
+# Offline benchmark suite (python -m benchmarks.run), see run.py.
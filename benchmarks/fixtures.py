@@ -0,0 +1,106 @@
+# /benchmarks/fixtures.py
+#
+# Offline inputs of the benchmarks: random-walk OHLCV bars of any size (also written as CSV
+# files for the bar replay), the bars recorded in models/*.csv, and a tiny LSTM forecaster built in-process with onnx.helper (same graph
+# interface as the models exported by models/train_lstm.py).
+
+import os
+import numpy as np
+import pandas as pd
+import onnx
+from onnx import helper, TensorProto
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+RECORDED_DIR = os.path.join(REPO_DIR, 'models')
+# Recorded bar files used by the benchmarks (name -> CSV of models/)
+RECORDED_FILES = {
+    'recorded_15min': 'eth_usd_15min.csv',
+    'recorded_hourly': 'eth_usd_hourly.csv',
+    'recorded_historical': 'eth_usd_historical.csv',
+}
+
+
+# Parse a size like '1k', '100k' or '10M'
+def parse_size(text):
+    units = {'k': 1_000, 'K': 1_000, 'm': 1_000_000, 'M': 1_000_000}
+    return int(float(text[:-1]) * units[text[-1]]) if text[-1] in units else int(text)
+
+
+def random_walk_bars(n, seed=0, freq='15min', start='2020-01-01', price=2500.0, step_volatility=0.002):
+    """
+    OHLCV bars of a geometric random walk: each bar opens at the previous close, and its
+    high/low extend the open/close range by a random fraction.
+    """
+    rng = np.random.default_rng(seed)
+    closes = price * np.exp(np.cumsum(rng.normal(0.0, step_volatility, n)))
+    opens = np.concatenate([[price], closes[:-1]])
+    spread = np.abs(rng.normal(0.0, step_volatility / 2, (2, n)))
+    data = pd.DataFrame({
+        'Open': opens,
+        'High': np.maximum(opens, closes) * (1 + spread[0]),
+        'Low': np.minimum(opens, closes) * (1 - spread[1]),
+        'Close': closes,
+        'Adj Close': closes,
+        'Volume': rng.integers(0, 10_000_000, n).astype(np.float64),
+    }, index=pd.date_range(start, periods=n, freq=freq, tz='UTC', name='Datetime'))
+    return data
+
+
+def write_replay_files(directory, slug, initial_bars, new_bars, seed=0):
+    """
+    Write {slug}_15min.csv and {slug}_hourly.csv for the bar replay (BAR_REPLAY_DIR): the
+    15-minute and hourly bars of one random walk, laid out so that the `initial_bars`-th bar
+    of both files falls at the same time, followed by `new_bars` 15-minute bars to replay.
+    """
+    steps = 4 * (initial_bars - 1)
+    bars = random_walk_bars(steps + 1 + new_bars, seed=seed)
+    hourly = bars.resample('1h').agg({'Open': 'first', 'High': 'max', 'Low': 'min', 'Close': 'last', 'Adj Close': 'last', 'Volume': 'sum'})
+    os.makedirs(directory, exist_ok=True)
+    bars.iloc[steps - (initial_bars - 1):].to_csv(os.path.join(directory, f"{slug}_15min.csv"))
+    hourly.to_csv(os.path.join(directory, f"{slug}_hourly.csv"))
+
+
+# Bars of a recorded CSV of models/ (see RECORDED_FILES)
+def recorded_bars(name):
+    data = pd.read_csv(os.path.join(RECORDED_DIR, RECORDED_FILES[name]), index_col=0)
+    data.index = pd.to_datetime(data.index, utc=True)
+    return data[~data.index.duplicated(keep='last')].sort_index()
+
+
+def build_tiny_lstm(path=None, hidden_size=8, sequence_length=59, seed=0):
+    """
+    One-step forecaster input (B, sequence_length, 1) -> output (B, 1): an LSTM with random
+    weights followed by a linear layer. Saved to `path` if given. Returns the ModelProto.
+    """
+    rng = np.random.default_rng(seed)
+
+    def weights(name, *shape):
+        return helper.make_tensor(name, TensorProto.FLOAT, shape, (rng.normal(0.0, 0.3, shape)).astype(np.float32).ravel().tolist())
+
+    nodes = [
+        # (batch, sequence, 1) -> (sequence, batch, 1), the layout of the ONNX LSTM
+        helper.make_node('Transpose', ['input'], ['lstm/x'], perm=[1, 0, 2]),
+        helper.make_node('LSTM', ['lstm/x', 'lstm/W', 'lstm/R', 'lstm/B'], ['lstm/y', 'lstm/y_h', 'lstm/y_c'], hidden_size=hidden_size),
+        helper.make_node('Squeeze', ['lstm/y_h', 'lstm/axes'], ['lstm/last']),
+        helper.make_node('Gemm', ['lstm/last', 'fc.weight', 'fc.bias'], ['output'], transB=1),
+    ]
+    initializers = [
+        weights('lstm/W', 1, 4 * hidden_size, 1),
+        weights('lstm/R', 1, 4 * hidden_size, hidden_size),
+        weights('lstm/B', 1, 8 * hidden_size),
+        weights('fc.weight', 1, hidden_size),
+        weights('fc.bias', 1),
+        helper.make_tensor('lstm/axes', TensorProto.INT64, [1], [0]),
+    ]
+    graph = helper.make_graph(
+        nodes, 'tiny_lstm',
+        [helper.make_tensor_value_info('input', TensorProto.FLOAT, ['batch', sequence_length, 1])],
+        [helper.make_tensor_value_info('output', TensorProto.FLOAT, ['batch', 1])],
+        initializers,
+    )
+    model = helper.make_model(graph, opset_imports=[helper.make_opsetid('', 17)])
+    model.ir_version = 8
+    onnx.checker.check_model(model)
+    if path:
+        onnx.save(model, path)
+    return model
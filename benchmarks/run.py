@@ -0,0 +1,299 @@
+# /benchmarks/run.py
+#
+# Offline benchmarks of the hot paths: RSI, volatility estimators, Fibonacci levels,
+# scaling, batch signal scoring, model inference, and the end-to-end pipeline (one compute
+# cycle per new bar, replayed from random-walk CSV files, and the request_data answer). No
+# network: bars are random walks or the recorded CSV files, the models are tiny LSTMs built
+# in-process.
+#
+# Each benchmark reports the median time of a call, the throughput (bars/s, or calls/s for
+# the fixed-size ones) and the peak memory allocated by one call (tracemalloc). Results are
+# compared with a baseline file; a slower or larger run than the baseline + tolerance is
+# flagged as a regression and the exit code is 1.
+#
+# Usage:
+#     python -m benchmarks.run                                  (sizes 1k, 100k and 10M)
+#     python -m benchmarks.run --sizes 1k,100k --only rsi,volatility
+#     python -m benchmarks.run --save-baseline                  (write benchmarks/baselines.json)
+#
+# benchmarks/baselines.json is a reference run (1 CPU, x86_64); CI saves its own baseline
+# from the base branch first (see README, Benchmarks).
+
+import os
+import sys
+import json
+import time
+import argparse
+import tempfile
+import platform
+import tracemalloc
+import numpy as np
+from .fixtures import RECORDED_FILES, parse_size, random_walk_bars, recorded_bars, build_tiny_lstm, write_replay_files
+
+DEFAULT_SIZES = '1k,100k,10M'
+DEFAULT_BASELINE = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'baselines.json')
+# Relative slowdown (time) or growth (memory) over the baseline flagged as a regression
+DEFAULT_TOLERANCE = 0.25
+# A benchmark is repeated until it ran for MIN_TIME seconds (at least MIN_REPEATS times)
+MIN_TIME = 1.0
+MIN_REPEATS = 3
+MAX_REPEATS = 50
+
+# Pipeline settings of the end-to-end benchmarks (set before the server package is imported).
+# The replay starts with a full 15-minute window (30d = 2880 bars, more than the hourly
+# window), so the timed cycles take the steady-state path: one new bar per cycle, indicators
+# updated incrementally. 'external' mode keeps the background compute loop of the socket
+# handlers from running during the benchmarks.
+PIPELINE_WINDOW = 2880
+PIPELINE_CYCLES = 20
+# New bars available to the replay: enough for every timed run of the pipeline benchmark
+PIPELINE_NEW_BARS = (MAX_REPEATS + 5) * PIPELINE_CYCLES
+PIPELINE_ENV = {'SYMBOLS': 'ETH-USD', 'TIMEFRAMES': '15min,hourly', 'BAR_SOURCE': 'replay',
+                'BAR_REPLAY_INITIAL': str(PIPELINE_WINDOW), 'COMPUTE_MODE': 'external', 'LOG_LEVEL': 'WARNING'}
+# Windows per call of the batched inference benchmark
+BATCH_WINDOWS = 32
+
+
+# Benchmarks over bar series: name -> function(data) returning the call to time
+def _series_benchmarks():
+    from server.data_processing import calculate_rsi, preprocess
+    from server.volatility import calculate_volatility
+    from server.fibonacci import calculate_fibonacci_levels, determine_trend, fibonacci_level_matrix
+    from server.signal_generation import generate_signals_batch, stop_loss_take_profit_batch
+
+    def signals(data):
+        # One row per bar, as if every bar were a (symbol, timeframe) pair
+        closes = data['Close'].to_numpy()
+        predicted = closes * 1.01
+        rsi = np.full(len(closes), 50.0)
+        volatility = np.full(len(closes), 0.5)
+        high, low = closes * 1.05, closes * 0.95
+
+        def call():
+            directions, _ = generate_signals_batch(closes, predicted, rsi, fibonacci_level_matrix(closes, high, low), volatility)
+            stop_loss_take_profit_batch(closes, directions, volatility)
+        return call
+
+    return {
+        'rsi': lambda data: lambda: calculate_rsi(data['Close'], timeframe='15min'),
+        'volatility_close_to_close': lambda data: lambda: calculate_volatility(data['Close'], 5, '15min', 'close_to_close'),
+        'volatility_ewma': lambda data: lambda: calculate_volatility(data['Close'], 5, '15min', 'ewma'),
+        'volatility_parkinson': lambda data: lambda: calculate_volatility(data, 5, '15min', 'parkinson'),
+        'volatility_garman_klass': lambda data: lambda: calculate_volatility(data, 5, '15min', 'garman_klass'),
+        'fibonacci_levels': lambda data: lambda: calculate_fibonacci_levels(data, determine_trend(data)),
+        'preprocess': lambda data: lambda: preprocess(data, '15min'),
+        'signals_batch': signals,
+    }
+
+
+# Fixed-size benchmarks: name -> function(workdir) returning (call, calls per run)
+def _fixed_benchmarks():
+    def inference(mode):
+        def setup(workdir):
+            from server import model_inference
+            from server.data_processing import preprocess
+            path = os.path.join(workdir, 'tiny_lstm.onnx')
+            if not os.path.exists(path):
+                build_tiny_lstm(path)
+            scaled, scaler = preprocess(random_walk_bars(2000), '15min')
+            previous = model_inference.INFERENCE_MODE
+
+            def call():
+                model_inference.INFERENCE_MODE = mode
+                try:
+                    model_inference.predict_with_model_path(scaled, scaler, path)
+                finally:
+                    model_inference.INFERENCE_MODE = previous
+            return call, 1
+        return setup
+
+    # One session call for BATCH_WINDOWS windows (throughput in windows/s)
+    def batched_inference(workdir):
+        from server import model_inference
+        from server.data_processing import preprocess
+        path = os.path.join(workdir, 'tiny_lstm.onnx')
+        if not os.path.exists(path):
+            build_tiny_lstm(path)
+        windows = np.stack([preprocess(random_walk_bars(200, seed=seed), '15min')[0][-59:] for seed in range(BATCH_WINDOWS)])
+        return lambda: model_inference.forecast_batch(path, 'stateful', windows), BATCH_WINDOWS
+
+    def pipeline(workdir):
+        from server.compute_loop import run_cycle
+        run_cycle()  # cold cycle: bar stores, indicator states and sessions
+
+        def call():
+            for _ in range(PIPELINE_CYCLES):
+                run_cycle()
+        return call, PIPELINE_CYCLES
+
+    def request_data(workdir):
+        from server import app, socketio
+        from server.compute_loop import run_cycle
+        run_cycle()
+        client = socketio.test_client(app)
+        client.get_received()
+
+        def call():
+            client.emit('request_data', {'symbol': 'ETH-USD', 'timeframe': '15min'})
+            client.get_received()
+        return call, 1
+
+    return {
+        'inference_stateful': inference('stateful'),
+        'inference_loop': inference('loop'),
+        'inference_batched': batched_inference,
+        'pipeline_cycle': pipeline,
+        'request_data': request_data,
+    }
+
+
+def measure(call, min_time=MIN_TIME):
+    """
+    Time `call` (after one warm-up call) and measure the peak memory it allocates.
+    Returns (median seconds, peak bytes, repeats).
+    """
+    call()
+    times = []
+    while len(times) < MIN_REPEATS or (sum(times) < min_time and len(times) < MAX_REPEATS):
+        started = time.perf_counter()
+        call()
+        times.append(time.perf_counter() - started)
+
+    tracemalloc.start()
+    try:
+        call()
+        peak = tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+    return float(np.median(times)), peak, len(times)
+
+
+def _setup_pipeline(workdir):
+    """
+    Environment of the end-to-end benchmarks: bar stores, journal and states in `workdir`,
+    random-walk bars replayed from `workdir`/replay, a tiny model per timeframe.
+    """
+    os.environ.update(PIPELINE_ENV)
+    os.environ['MODEL_DIR'] = workdir
+    os.environ['BAR_REPLAY_DIR'] = os.path.join(workdir, 'replay')
+    os.chdir(workdir)
+    write_replay_files(os.environ['BAR_REPLAY_DIR'], 'eth_usd', PIPELINE_WINDOW, PIPELINE_NEW_BARS)
+    from server.markets import ACTIVE_SYMBOLS, ACTIVE_TIMEFRAMES, model_path
+    for symbol in ACTIVE_SYMBOLS:
+        for timeframe in ACTIVE_TIMEFRAMES:
+            build_tiny_lstm(model_path(symbol, timeframe))
+
+
+def run_benchmarks(sizes, only=None, min_time=MIN_TIME):
+    """
+    Run the benchmarks and return their results: {key: {'seconds', 'throughput', 'unit',
+    'peak_bytes', 'size', 'repeats'}}, keyed by 'name[size]'.
+    """
+    workdir = tempfile.mkdtemp(prefix='geotrade-bench-')
+    _setup_pipeline(workdir)
+
+    def selected(name):
+        return not only or any(part in name for part in only)
+
+    results = {}
+
+    # Series benchmarks time one call over `count` bars, fixed ones `count` calls (seconds per call)
+    def record(key, call, count, unit):
+        seconds, peak, repeats = measure(call, min_time)
+        throughput = count / seconds if seconds else float('inf')
+        if unit == 'calls/s':
+            seconds /= count
+        results[key] = {'seconds': seconds, 'throughput': throughput, 'unit': unit, 'peak_bytes': peak, 'size': count, 'repeats': repeats}
+        print(f"{key:<50} {seconds * 1000:>12.3f} ms {results[key]['throughput']:>16,.0f} {unit:<8} {peak / 2 ** 20:>10.2f} MB", flush=True)
+
+    datasets = [(label, lambda size=size: random_walk_bars(size)) for label, size in ((label, parse_size(label)) for label in sizes)]
+    datasets += [(name, lambda name=name: recorded_bars(name)) for name in RECORDED_FILES]
+
+    series = {name: factory for name, factory in _series_benchmarks().items() if selected(name)}
+    for label, load in datasets:
+        if not series:
+            break
+        data = load()
+        for name, factory in series.items():
+            record(f"{name}[{label}]", factory(data), len(data), 'bars/s')
+        del data
+
+    for name, setup in _fixed_benchmarks().items():
+        if selected(name):
+            call, count = setup(workdir)
+            record(name, call, count, 'calls/s')
+    return results
+
+
+def compare(results, baseline, tolerance=DEFAULT_TOLERANCE):
+    """
+    Regressions of `results` against `baseline`: [(key, metric, baseline value, value)]
+    for the runs slower (or allocating more) than the baseline by more than `tolerance`.
+    """
+    regressions = []
+    for key, result in results.items():
+        reference = baseline.get(key)
+        if not reference:
+            continue
+        for metric in ('seconds', 'peak_bytes'):
+            if reference[metric] and result[metric] > reference[metric] * (1 + tolerance):
+                regressions.append((key, metric, reference[metric], result[metric]))
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Offline benchmarks of the geotrade hot paths.")
+    parser.add_argument('--sizes', default=DEFAULT_SIZES, help=f"Random-walk sizes in bars (default {DEFAULT_SIZES})")
+    parser.add_argument('--only', help="Comma-separated benchmark names (substrings) to run")
+    parser.add_argument('--min-time', type=float, default=MIN_TIME, help="Minimum timed seconds per benchmark")
+    parser.add_argument('--baseline', default=DEFAULT_BASELINE, help="Baseline file to compare with or to save")
+    parser.add_argument('--save-baseline', action='store_true', help="Save the results as the new baseline")
+    parser.add_argument('--tolerance', type=float, default=DEFAULT_TOLERANCE, help="Slowdown/memory growth flagged as a regression")
+    parser.add_argument('--output', help="Also write the results to this JSON file")
+    args = parser.parse_args()
+
+    # The benchmarks run from a temporary directory
+    baseline_path = os.path.abspath(args.baseline)
+    output_path = os.path.abspath(args.output) if args.output else None
+    sizes = [size for size in args.sizes.split(',') if size]
+    only = [name for name in (args.only or '').split(',') if name]
+    print(f"{'benchmark':<50} {'median':>15} {'throughput':>16} {'':<8} {'peak':>13}")
+    results = run_benchmarks(sizes, only, args.min_time)
+
+    report = {'python': platform.python_version(), 'machine': platform.machine(), 'cpus': os.cpu_count(),
+              'time': time.strftime('%Y-%m-%dT%H:%M:%S'), 'results': results}
+    if output_path:
+        with open(output_path, 'w') as f:
+            json.dump(report, f, indent=2)
+
+    if args.save_baseline:
+        baseline = {}
+        if os.path.exists(baseline_path):
+            with open(baseline_path) as f:
+                baseline = json.load(f).get('results', {})
+        report['results'] = {**baseline, **results}
+        with open(baseline_path, 'w') as f:
+            json.dump(report, f, indent=2)
+        print(f"Baseline saved to {baseline_path}.")
+        return 0
+
+    if not os.path.exists(baseline_path):
+        print(f"No baseline at {baseline_path} (run with --save-baseline to create it).")
+        return 0
+    with open(baseline_path) as f:
+        saved = json.load(f)
+    baseline = saved.get('results', {})
+    # Timings only compare on the same kind of machine
+    if (saved.get('machine'), saved.get('cpus')) != (report['machine'], report['cpus']):
+        print(f"Baseline recorded on {saved.get('machine')} with {saved.get('cpus')} CPUs, this run on {report['machine']} "
+              f"with {report['cpus']} CPUs: save a baseline on this machine to compare timings.")
+    regressions = compare(results, baseline, args.tolerance)
+    for key, metric, reference, value in regressions:
+        print(f"REGRESSION {key}: {metric} {reference:.6g} -> {value:.6g} ({value / reference - 1:+.0%})")
+    if not regressions:
+        print(f"No regression against {baseline_path} (tolerance {args.tolerance:.0%}).")
+    return 1 if regressions else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,24 @@
+# gunicorn.conf.py
+#
+# Production server: gunicorn -c gunicorn.conf.py server:app
+#
+# Socket.IO needs every request of a client to reach the same process, so each server
+# instance runs one gunicorn worker; use more cores by running several instances behind a
+# load balancer with sticky sessions (see docker-compose.yml and deploy/nginx.conf) and a
+# shared message queue (MESSAGE_QUEUE_URL).
+
+import os
+
+bind = os.getenv('BIND', '0.0.0.0:8080')
+workers = 1
+
+# 'gthread' (default, threading async mode): real threads, so the inference pools run in
+# parallel; WebSocket connections need simple-websocket (without it, clients fall back to
+# long polling). 'gevent' needs gevent and gevent-websocket and SOCKETIO_ASYNC_MODE=gevent
+# (worker class geventwebsocket.gunicorn.workers.GeventWebSocketWorker).
+worker_class = os.getenv('GUNICORN_WORKER_CLASS', 'gthread')
+threads = int(os.getenv('GUNICORN_THREADS', '100'))
+
+# Long-lived WebSocket connections
+timeout = int(os.getenv('GUNICORN_TIMEOUT', '120'))
+keepalive = 5
@@ -0,0 +1,58 @@
+# Build the int8 / fp16 / optimized variants of an existing ONNX model (see server/model_variants.py)
+# and report their accuracy against the float32 model on the last bars of a data file.
+#
+#     python models/build_variants.py --model models/registry/eth_usd_15min/<version>/model.onnx --data models/eth_usd_15min.csv
+#
+# New registry versions get their variants from train_lstm.py directly.
+
+import argparse
+import json
+import os
+import sys
+import numpy as np
+import pandas as pd
+from sklearn.preprocessing import MinMaxScaler
+
+# Same server modules as train_lstm.py
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'server'))
+from columnar_store import ColumnarBarFile
+from model_registry import SCALER_FILE, METADATA_FILE, scaler_from_params
+from model_variants import VARIANTS, build_variants, accuracy_report, save_report, format_report, holdout_start, holdout_windows, price_scale, report_path
+
+# Load the closing prices from a CSV file or a columnar bar directory (*.bars)
+def load_closes(file_path):
+    if os.path.isdir(file_path):
+        return ColumnarBarFile(file_path).read_frame(columns=['Close'])['Close'].to_numpy(dtype=np.float64)
+    return pd.read_csv(file_path, index_col=0)['Close'].to_numpy(dtype=np.float64)
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Build the quantized / optimized variants of an ONNX model and report their accuracy.')
+    parser.add_argument('--model', required=True, help='Float32 ONNX model (model.onnx of a registry version, or an unversioned model)')
+    parser.add_argument('--data', required=True, help='CSV file or *.bars directory; the last --holdout share of its windows is used for the report')
+    parser.add_argument('--variants', default=','.join(VARIANTS), help=f"Comma-separated variants (default {','.join(VARIANTS)})")
+    parser.add_argument('--holdout', type=float, default=0.1, help='Share of the windows used for the report')
+    parser.add_argument('--seq-length', type=int, default=60, help='Training window length (read from the version metadata if present)')
+    args = parser.parse_args()
+
+    closes = load_closes(args.data)
+
+    # Scaler and window length of a registry version, else a scaler fitted on the closes before
+    # the held-out windows (like a training scaler, it never sees them)
+    version_dir = os.path.dirname(os.path.abspath(args.model))
+    seq_length, scaler = args.seq_length, None
+    if os.path.exists(os.path.join(version_dir, SCALER_FILE)):
+        with open(os.path.join(version_dir, SCALER_FILE)) as f:
+            scaler = scaler_from_params(json.load(f))
+        with open(os.path.join(version_dir, METADATA_FILE)) as f:
+            seq_length = json.load(f)['seq_length']
+    scaler = scaler or MinMaxScaler().fit(closes[:holdout_start(len(closes), seq_length - 1, args.holdout)].reshape(-1, 1))
+
+    variants = [variant for variant in args.variants.split(',') if variant]
+    built = build_variants(args.model, variants)
+    print(f"Built {', '.join(f'{variant} ({path})' for variant, path in built.items())}.")
+
+    windows, targets = holdout_windows(closes, seq_length - 1, args.holdout, scaler)
+    report = accuracy_report(args.model, windows, targets, variants, price_scale(scaler))
+    save_report(args.model, report, data=args.data, holdout_windows=len(windows))
+    print(f"Variants on {len(windows)} held-out windows (errors in price units):\n{format_report(report)}")
+    print(f"Report saved to {report_path(args.model)}.")
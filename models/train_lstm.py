@@ -3,9 +3,32 @@ import torch.nn as nn
 import numpy as np
 import pandas as pd
 from sklearn.preprocessing import MinMaxScaler
-from torch.utils.data import DataLoader, TensorDataset
+from numpy.lib.stride_tricks import sliding_window_view
+from concurrent.futures import ProcessPoolExecutor, as_completed
+import multiprocessing
 import argparse
-import threading
+import json
+import random
+import shutil
+import time
+import os
+import sys
+
+# Columnar bar files (*.bars) are read with the server's storage module
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'server'))
+from columnar_store import ColumnarBarFile
+from markets import TIMEFRAMES, resolve_symbol, symbol_slug
+from model_registry import begin_version, publish_version, MODEL_FILE, STEP_MODEL_FILE, KEEP_VERSIONS
+from model_variants import build_variants, accuracy_report, save_report, format_report, price_scale, VARIANTS
+
+# Default directory of the training data, and model registry the trained versions are published to
+DEFAULT_DATA_DIR = os.getenv('TRAINING_DATA_DIR', os.path.dirname(os.path.abspath(__file__)))
+DEFAULT_REGISTRY_DIR = os.getenv('MODEL_REGISTRY_DIR', os.path.join(DEFAULT_DATA_DIR, 'registry'))
+
+# Prefix of the machine-readable progress lines (--progress), parsed by server/training_jobs.py
+PROGRESS_PREFIX = 'PROGRESS '
+# Minimum seconds between two batch progress lines
+PROGRESS_INTERVAL = 0.5
 
 # LSTM Model Definition
 class LSTMModel(nn.Module):
@@ -19,57 +42,173 @@ class LSTMModel(nn.Module):
         predictions = self.fc(lstm_out[:, -1, :])
         return predictions
 
+# Single-step wrapper exported for stateful inference: (x, h, c) -> (prediction, h, c)
+class StepLSTMModel(nn.Module):
+    def __init__(self, model):
+        super(StepLSTMModel, self).__init__()
+        self.model = model
+
+    def forward(self, x, h, c):
+        lstm_out, (h, c) = self.model.lstm(x, (h, c))
+        predictions = self.model.fc(lstm_out[:, -1, :])
+        return predictions, h, c
+
 # Function to create sequences from data
 def create_sequences(data, seq_length):
-    sequences = []
-    for i in range(len(data) - seq_length):
-        sequences.append(data[i:i + seq_length])
-    return np.array(sequences)
+    """
+    Windows of `seq_length` rows of `data` (n, features) as a (n - seq_length, seq_length,
+    features) strided view: no window is copied. The last window is left out, as before.
+    """
+    windows = sliding_window_view(data[:-1], seq_length, axis=0, writeable=True)
+    return np.moveaxis(windows, -1, 1)
+
+# Seed every random generator used by a training run
+def set_seed(seed):
+    random.seed(seed)
+    np.random.seed(seed)
+    torch.manual_seed(seed)
+
+# Shuffled mini-batches of (X, y), drawn from a seeded generator
+def iterate_batches(X, y, batch_size, generator):
+    order = torch.randperm(len(X), generator=generator)
+    for start in range(0, len(X), batch_size):
+        index = order[start:start + batch_size]
+        yield X[index], y[index]
+
+# Print a progress line as JSON (one line per event, flushed for the reading process)
+def report_progress(status, **values):
+    print(PROGRESS_PREFIX + json.dumps({'status': status, **values}), flush=True)
 
 # Function to train a model
-def train_model(model, train_loader, epochs=10):
+def train_model(model, X, y, epochs=10, batch_size=32, seed=0, label='', progress=False):
     criterion = nn.MSELoss()
     optimizer = torch.optim.Adam(model.parameters(), lr=0.001)
+    generator = torch.Generator().manual_seed(seed)
+    batches = (len(X) + batch_size - 1) // batch_size
+    last_report = 0.0
 
     for epoch in range(epochs):
-        for inputs, labels in train_loader:
+        started = time.time()
+        for batch, (inputs, labels) in enumerate(iterate_batches(X, y, batch_size, generator)):
             optimizer.zero_grad()
             outputs = model(inputs)
             loss = criterion(outputs, labels)
             loss.backward()
             optimizer.step()
 
-        print(f'Epoch {epoch+1}, Loss: {loss.item()}')
+            # Batch progress, throttled (the last batch of the epoch is reported below)
+            if progress and batch + 1 < batches and time.time() - last_report >= PROGRESS_INTERVAL:
+                last_report = time.time()
+                report_progress('training', epoch=epoch + 1, epochs=epochs, batch=batch + 1, batches=batches,
+                                loss=loss.item(), progress=100 * (epoch * batches + batch + 1) / (epochs * batches))
+
+        print(f'{label}Epoch {epoch+1}, Loss: {loss.item()} ({time.time() - started:.1f}s)')
+        if progress:
+            report_progress('training', epoch=epoch + 1, epochs=epochs, batch=batches, batches=batches,
+                            loss=loss.item(), progress=100 * (epoch + 1) / epochs)
+    return loss.item()
 
-# Function to save a model to ONNX format
+# Function to save a model to ONNX format, with a dynamic batch axis (several windows per call)
 def save_model_to_onnx(model, seq_length, filename):
     dummy_input = torch.randn(1, seq_length - 1, 1)  # Adjust shape as needed
-    torch.onnx.export(model, dummy_input, filename, input_names=['input'], output_names=['output'])
+    torch.onnx.export(model, dummy_input, filename, input_names=['input'], output_names=['output'],
+                      dynamic_axes={'input': {0: 'batch'}, 'output': {0: 'batch'}})
+
+# Function to save the stateful single-step variant of a model to ONNX format
+def save_step_model_to_onnx(model, filename):
+    """
+    Export (input, h0, c0) -> (output, hn, cn) with dynamic batch and sequence axes, so the
+    server can warm the LSTM state once over the window and then advance it one step at a time.
+    """
+    hidden_size = model.lstm.hidden_size
+    dummy_input = (torch.randn(1, 1, 1), torch.zeros(1, 1, hidden_size), torch.zeros(1, 1, hidden_size))
+    torch.onnx.export(
+        StepLSTMModel(model), dummy_input, filename,
+        input_names=['input', 'h0', 'c0'], output_names=['output', 'hn', 'cn'],
+        dynamic_axes={'input': {0: 'batch', 1: 'sequence'}, 'h0': {1: 'batch'}, 'c0': {1: 'batch'},
+                      'output': {0: 'batch'}, 'hn': {1: 'batch'}, 'cn': {1: 'batch'}},
+    )
+
+# Load the closing prices (Series indexed by bar time) from a CSV file or a columnar bar directory (*.bars)
+def load_close_prices(file_path, start=None, end=None):
+    if os.path.isdir(file_path):
+        # Only the requested timestamp range of the memory-mapped Close column is read
+        bar_file = ColumnarBarFile(file_path)
+        return bar_file.read_frame(start, end, columns=['Close'])['Close']
+
+    df = pd.read_csv(file_path, index_col=0)
+    df.index = pd.to_datetime(df.index, utc=True)
+    if start is not None or end is not None:
+        df = df.loc[start:end]
+    return df['Close']
 
 # Load and preprocess data
-def load_and_preprocess_data(file_path, seq_length):
+def load_and_preprocess_data(file_path, seq_length, start=None, end=None, holdout=0.0):
+    """
+    Training windows (X, y) of the closes and the scaler fitted on them, plus the last
+    `holdout` share of the windows kept out of sample (X_holdout, y_holdout): the closes are
+    split first, the scaler only sees the training part, and `seq_length` closes are left
+    out between the two so that no held-out window shares a close with a training window.
+    Returns X, y, X_holdout, y_holdout, scaler, (first, last training bar time).
+    """
     print(f"Loading data from {file_path}")
-    df = pd.read_csv(file_path)
-    print(f"Data loaded. First few rows:\n{df.head()}")
+    closes = load_close_prices(file_path, start, end)
+    prices = closes.values
+    print(f"Data loaded. {len(prices)} closing prices, first few: {prices[:5]}")
+
+    held_out = int((len(prices) - seq_length) * holdout)
+    train_end = len(prices) - (held_out + seq_length - 1) - seq_length if held_out else len(prices)
     scaler = MinMaxScaler()
-    scaled_data = scaler.fit_transform(df['Close'].values.reshape(-1, 1))
+    # Scaled once to float32: the windows below are views of this array
+    scaled_data = scaler.fit_transform(prices[:train_end].reshape(-1, 1)).astype(np.float32)
 
     # Create sequences
     data_sequences = create_sequences(scaled_data, seq_length)
-    X = torch.tensor(data_sequences[:, :-1]).float()
-    y = torch.tensor(data_sequences[:, -1]).float()
+    X = torch.from_numpy(data_sequences[:, :-1])
+    y = torch.from_numpy(data_sequences[:, -1])
 
-    # Prepare data for training
-    train_data = TensorDataset(X, y)
-    train_loader = DataLoader(train_data, batch_size=32, shuffle=True)
+    # Held-out windows, scaled with the training scaler
+    holdout_sequences = np.empty((0, seq_length, 1), dtype=np.float32)
+    if held_out:
+        scaled_holdout = scaler.transform(prices[len(prices) - (held_out + seq_length - 1):].reshape(-1, 1)).astype(np.float32)
+        holdout_sequences = np.moveaxis(sliding_window_view(scaled_holdout, seq_length, axis=0), -1, 1)
+    X_holdout = torch.from_numpy(np.ascontiguousarray(holdout_sequences[:, :-1]))
+    y_holdout = torch.from_numpy(np.ascontiguousarray(holdout_sequences[:, -1]))
 
-    return train_loader, scaler
+    return X, y, X_holdout, y_holdout, scaler, (closes.index[0], closes.index[train_end - 1])
+
+# Data file of a symbol/timeframe: the columnar bar store if present, else the CSV export
+def find_data_path(data_dir, symbol, timeframe):
+    stem = os.path.join(data_dir, f"{symbol_slug(symbol)}_{timeframe}")
+    for path in (stem + '.bars', stem + '.csv'):
+        if os.path.exists(path):
+            return path
+    return None
 
 # Function to start model training
-def start_training(model_type, csv_path, model_name, seq_length=60):
+def start_training(job, seq_length=60, epochs=10, batch_size=32, seed=0, start=None, end=None, keep_versions=KEEP_VERSIONS, progress=False,
+                   holdout=0.1, variants=VARIANTS):
+    """
+    Train the model of one job ({'symbol', 'timeframe', 'data_path', 'model_dir'}) and
+    publish it as a new version of its registry directory (ONNX graphs, fitted scaler,
+    metadata). Runs the same way in the main process or in a pool worker, returns a summary.
+    With `progress`, JSON progress lines are printed along the way (report_progress).
+
+    The last `holdout` share of the windows is left out of the training (and of the
+    scaler, see load_and_preprocess_data); the `variants`
+    (int8, fp16, optimized, see server/model_variants.py) are built with the version and
+    their accuracy against the float32 model on those windows is saved with it.
+    """
+    started = time.time()
+    label = f"[{job['symbol']} {job['timeframe']}] "
+    set_seed(seed)
+
     # Load and preprocess data
-    print(f"Training LSTM model on {model_type} interval data...")
-    train_loader, _ = load_and_preprocess_data(csv_path, seq_length)
+    print(f"{label}Training LSTM model on {TIMEFRAMES[job['timeframe']]['label']} interval data...")
+    if progress:
+        report_progress('loading', progress=0)
+    X, y, X_holdout, y_holdout, scaler, (first_bar, last_bar) = load_and_preprocess_data(job['data_path'], seq_length, start, end, holdout)
+    held_out = len(X_holdout)
 
     # Define the LSTM model
     input_size = 1
@@ -78,43 +217,148 @@ def start_training(model_type, csv_path, model_name, seq_length=60):
     model = LSTMModel(input_size, hidden_size, output_size)
 
     # Train the model
-    train_model(model, train_loader, epochs=10)
+    loss = train_model(model, X, y, epochs=epochs, batch_size=batch_size, seed=seed, label=label, progress=progress)
 
-    # Save the model to ONNX format
-    save_model_to_onnx(model, seq_length, f"{model_name}.onnx")
-    print(f"{model_name} has been trained and saved.")
+    # Save the model to ONNX format and publish it with its scaler (the server picks it up on its next cycle)
+    if progress:
+        report_progress('exporting', progress=100, loss=loss)
+    staging = begin_version(job['model_dir'])
+    try:
+        save_model_to_onnx(model, seq_length, os.path.join(staging, MODEL_FILE))
+        save_step_model_to_onnx(model, os.path.join(staging, STEP_MODEL_FILE))
 
-# Main function to handle command-line arguments and run both models simultaneously
-if __name__ == "__main__":
-    # Parse command-line arguments
-    parser = argparse.ArgumentParser(description='Train LSTM models for 15min and hourly ETH-USD data.')
-    parser.add_argument('--run_both', action='store_true', help='Run both 15min and hourly models simultaneously')
-    
-    args = parser.parse_args()
+        # Quantized / optimized variants, and their accuracy on the held-out windows
+        if variants:
+            if progress:
+                report_progress('optimizing', progress=100, loss=loss)
+            build_variants(os.path.join(staging, MODEL_FILE), variants)
+            if held_out:
+                report = accuracy_report(os.path.join(staging, MODEL_FILE), X_holdout.numpy(), y_holdout.numpy(), variants, price_scale(scaler))
+                save_report(os.path.join(staging, MODEL_FILE), report, holdout_windows=held_out)
+                print(f"{label}Variants on {held_out} held-out windows (errors in price units):\n{format_report(report)}")
+    except Exception:
+        shutil.rmtree(staging, ignore_errors=True)
+        raise
+    metadata = {
+        'symbol': job['symbol'], 'timeframe': job['timeframe'], 'interval': TIMEFRAMES[job['timeframe']]['interval'],
+        'seq_length': seq_length, 'train_start': first_bar.isoformat(), 'train_end': last_bar.isoformat(),
+        'data_path': job['data_path'], 'samples': len(X), 'epochs': epochs, 'batch_size': batch_size,
+        'seed': seed, 'loss': loss, 'created': pd.Timestamp.now(tz='UTC').isoformat(),
+        'holdout_samples': held_out, 'variants': list(variants),
+    }
+    path = publish_version(job['model_dir'], staging, scaler, metadata, keep_versions)
+    print(f"{label}Model has been trained and published as {path}.")
+    if progress:
+        report_progress('published', progress=100, loss=loss, version=os.path.basename(path))
+    return {'symbol': job['symbol'], 'timeframe': job['timeframe'], 'model': path,
+            'loss': loss, 'samples': len(X), 'seconds': time.time() - started}
+
+# Cap the torch/BLAS threads of a process so that parallel jobs do not oversubscribe the cores
+def limit_threads(threads):
+    for name in ('OMP_NUM_THREADS', 'MKL_NUM_THREADS', 'OPENBLAS_NUM_THREADS'):
+        os.environ[name] = str(threads)
+    torch.set_num_threads(threads)
+    try:
+        torch.set_num_interop_threads(1)
+    except RuntimeError:
+        # Already set once the inter-op pool is running (main process)
+        pass
 
-    # Paths for the data files
-    csv_path_15min = 'D:/trading_scripts/geotrade/models/eth_usd_15min.csv'
-    csv_path_hourly = 'D:/trading_scripts/geotrade/models/eth_usd_hourly.csv'
+# Build the jobs of every requested symbol/timeframe pair
+def build_jobs(symbols, timeframes, data_dir, registry_dir, data_path=None):
+    jobs = []
+    for symbol in symbols:
+        symbol = resolve_symbol(symbol)
+        for timeframe in timeframes:
+            if timeframe not in TIMEFRAMES:
+                raise ValueError(f"Unknown timeframe {timeframe} (expected one of {', '.join(TIMEFRAMES)}).")
+            path = data_path or find_data_path(data_dir, symbol, timeframe)
+            if path is None:
+                print(f"No data for {symbol} {timeframe} in {data_dir}, skipping.")
+                continue
+            jobs.append({
+                'symbol': symbol, 'timeframe': timeframe, 'data_path': path,
+                # Same layout as markets.registry_path
+                'model_dir': os.path.join(registry_dir, f"{symbol_slug(symbol)}_{timeframe}"),
+            })
+    return jobs
 
-    # Run both models simultaneously
-    if args.run_both:
-        print("Running both 15min and hourly models...")
+# Run the jobs, `processes` at a time, each process limited to `threads` torch threads
+def run_jobs(jobs, processes=1, threads=None, **training_args):
+    threads = threads or max(1, (os.cpu_count() or 1) // max(processes, 1))
+    results, failed = [], []
 
-        # Thread for 15min model
-        thread_15min = threading.Thread(target=start_training, args=("15-minute", csv_path_15min, "eth_usd_lstm_15min"))
+    if processes <= 1:
+        limit_threads(threads)
+        for job in jobs:
+            try:
+                results.append(start_training(job, **training_args))
+            except Exception as e:
+                print(f"Training {job['symbol']} {job['timeframe']} failed: {e}")
+                if training_args.get('progress'):
+                    report_progress('failed', error=str(e))
+                failed.append(job)
+        return results, failed
+
+    # Spawned (not forked) workers: torch's thread pools are not fork-safe
+    context = multiprocessing.get_context('spawn')
+    with ProcessPoolExecutor(max_workers=processes, mp_context=context,
+                             initializer=limit_threads, initargs=(threads,)) as pool:
+        futures = {pool.submit(start_training, job, **training_args): job for job in jobs}
+        for future in as_completed(futures):
+            job = futures[future]
+            try:
+                results.append(future.result())
+            except Exception as e:
+                print(f"Training {job['symbol']} {job['timeframe']} failed: {e}")
+                failed.append(job)
+    return results, failed
+
+# Main function to handle command-line arguments and train the requested models
+if __name__ == "__main__":
+    # Parse command-line arguments
+    parser = argparse.ArgumentParser(description='Train LSTM models for every symbol/timeframe pair.')
+    parser.add_argument('--symbols', default='ETH-USD', help='Comma-separated tickers or slugs (default: ETH-USD)')
+    parser.add_argument('--timeframes', default='15min', help=f"Comma-separated timeframes among {', '.join(TIMEFRAMES)} (default: 15min)")
+    parser.add_argument('--run_both', action='store_true', help='Train the 15min and hourly models (same as --timeframes 15min,hourly)')
+    parser.add_argument('--data-dir', default=DEFAULT_DATA_DIR, help='Directory of the {slug}_{timeframe}.bars / .csv files')
+    parser.add_argument('--data', help='Data file to use instead (single symbol/timeframe)')
+    parser.add_argument('--registry-dir', default=DEFAULT_REGISTRY_DIR, help='Model registry the versions are published to')
+    parser.add_argument('--keep-versions', type=int, default=KEEP_VERSIONS, help='Versions kept per model')
+    parser.add_argument('--start', help='First bar used for training (e.g. 2024-01-01)')
+    parser.add_argument('--end', help='Last bar used for training')
+    parser.add_argument('--epochs', type=int, default=10)
+    parser.add_argument('--batch-size', type=int, default=32)
+    parser.add_argument('--seq-length', type=int, default=60)
+    parser.add_argument('--seed', type=int, default=0, help='Seed of the weights and of the batch order')
+    parser.add_argument('--processes', type=int, default=1, help='Jobs trained in parallel, one process each')
+    parser.add_argument('--threads', type=int, help='Torch threads per process (default: cores / processes)')
+    parser.add_argument('--progress', action='store_true', help='Print JSON progress lines (used by the server training queue)')
+    parser.add_argument('--holdout', type=float, default=0.1, help='Share of the last windows left out of training, for the variant report')
+    parser.add_argument('--variants', default=','.join(VARIANTS), help=f"Model variants to build, comma-separated ('' for none, default {','.join(VARIANTS)})")
+
+    args = parser.parse_args()
 
-        # Thread for hourly model
-        thread_hourly = threading.Thread(target=start_training, args=("hourly", csv_path_hourly, "eth_usd_lstm_hourly"))
+    symbols = [s for s in args.symbols.split(',') if s]
+    timeframes = ['15min', 'hourly'] if args.run_both else [t for t in args.timeframes.split(',') if t]
+    if args.data and len(symbols) * len(timeframes) != 1:
+        parser.error('--data needs a single symbol and timeframe.')
 
-        # Start both threads
-        thread_15min.start()
-        thread_hourly.start()
+    jobs = build_jobs(symbols, timeframes, args.data_dir, args.registry_dir, args.data)
+    for job in jobs:
+        os.makedirs(job['model_dir'], exist_ok=True)
+    print(f"Training {len(jobs)} model(s) with {args.processes} process(es)...")
 
-        # Wait for both threads to finish
-        thread_15min.join()
-        thread_hourly.join()
+    started = time.time()
+    results, failed = run_jobs(
+        jobs, processes=min(args.processes, max(len(jobs), 1)), threads=args.threads,
+        seq_length=args.seq_length, epochs=args.epochs, batch_size=args.batch_size,
+        seed=args.seed, start=args.start, end=args.end, keep_versions=args.keep_versions, progress=args.progress,
+        holdout=args.holdout, variants=[variant for variant in args.variants.split(',') if variant],
+    )
 
-        print("Both models have been trained.")
-    else:
-        # Default: Run one model (you can choose which one)
-        start_training("15-minute", csv_path_15min, "eth_usd_lstm_15min")
+    for result in sorted(results, key=lambda r: (r['symbol'], r['timeframe'])):
+        print(f"{result['symbol']} {result['timeframe']}: loss {result['loss']:.6f}, "
+              f"{result['samples']} samples, {result['seconds']:.0f}s -> {result['model']}")
+    print(f"{len(results)} model(s) trained in {time.time() - started:.0f}s, {len(failed)} failed.")
+    sys.exit(1 if failed or not results else 0)
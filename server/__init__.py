@@ -4,15 +4,29 @@ from flask import Flask
 from flask_socketio import SocketIO
 from dotenv import load_dotenv
 import os
+import logging
+
+load_dotenv()
+
+# Level of the server logs: DEBUG adds the details of every cycle (scaled data, RSI, signals)
+LOG_LEVEL = os.getenv('LOG_LEVEL', 'INFO').upper()
+logging.basicConfig(level=LOG_LEVEL, format='%(asctime)s %(levelname)s %(name)s: %(message)s')
+logger = logging.getLogger(__name__)
+
+# Message queue shared by all the server processes (e.g. redis://redis:6379/0): emits made by
+# any process, including the compute service, reach the clients connected to every process
+MESSAGE_QUEUE_URL = os.getenv('MESSAGE_QUEUE_URL') or None
+# Socket.IO async mode ('threading', 'eventlet', 'gevent'), detected from the installed packages if empty
+SOCKETIO_ASYNC_MODE = os.getenv('SOCKETIO_ASYNC_MODE') or None
 
 # Initialize Flask app and SocketIO
 app = Flask(__name__, static_folder='../app/static', template_folder='../app/templates')
-socketio = SocketIO(app)
+socketio = SocketIO(app, message_queue=MESSAGE_QUEUE_URL, async_mode=SOCKETIO_ASYNC_MODE)
 
 # Import routes
 from . import routes
 
-# Function to start the server
+# Function to start the development server (see gunicorn.conf.py for production)
 def run_server():
-    print("Starting the Flask app...")
+    logger.info("Starting the Flask app...")
     socketio.run(app, port=8080, debug=True)
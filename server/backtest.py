@@ -0,0 +1,278 @@
+# /server/backtest.py
+#
+# Vectorized backtest of the live strategy over a price history: every bar is treated as
+# "now", with the same window, scaling, forecast, indicators, signal and stop-loss/take-profit
+# rules as the compute loop, but computed for all the bars at once with NumPy arrays and
+# batched model calls instead of a per-bar loop.
+#
+# Usage:
+#     python -m server.backtest --data models/eth_usd_historical.csv --timeframe hourly
+#     python -m server.backtest --symbol ETH-USD --timeframe 15min   (bar store of the symbol)
+
+import os
+import argparse
+import time
+import numpy as np
+import pandas as pd
+from numpy.lib.stride_tricks import sliding_window_view
+from .columnar_store import ColumnarBarFile
+from .bar_store import period_to_bars
+from .data_processing import calculate_rsi
+from .fibonacci import fibonacci_level_matrix
+from .signal_generation import generate_signals_batch, stop_loss_take_profit_batch
+from .volatility import periods_per_year, ewma_weights
+from .model_inference import FORECAST_HORIZON, step_model_path, serving_model
+from .onnx_rollout import build_stateful_rollout_model, derive_step_model, STEPS_INPUT
+from .session_registry import get_session
+from . import markets
+
+VOLATILITY_WINDOW = 5
+# Recent prices searched for the volatility returns once the outliers are dropped
+VOLATILITY_TAIL = 4 * (VOLATILITY_WINDOW + 1)
+
+
+# Load bars from a CSV file or a columnar .bars directory
+def load_bars(path, start=None, end=None):
+    if os.path.isdir(path):
+        return ColumnarBarFile(path).read_frame(start, end)
+    data = pd.read_csv(path, index_col=0)
+    data.index = pd.to_datetime(data.index, utc=True)
+    data = data[~data.index.duplicated(keep='last')].sort_index()
+    return data.loc[start:end]
+
+
+# Stateful forecast graph of a model; its batch axis is dynamic, so all the windows of a chunk go in one call
+def get_backtest_session(model_path):
+    step_path = step_model_path(model_path)
+
+    def build(path):
+        return build_stateful_rollout_model(step_path if os.path.exists(step_path) else derive_step_model(path))
+
+    return get_session(model_path, 'stateful', build, depends_on=[step_path])
+
+
+def forecast_last_step(closes, lookback, model_path, sequence_length=59, horizon=FORECAST_HORIZON, batch_size=2048, scaler=None):
+    """
+    Forecast, for every bar t >= lookback - 1, the price `horizon` bars ahead, the way the
+    live pipeline does: Min-Max scaling fitted on the last `lookback` closes (or the
+    `scaler` the model was trained with), the last `sequence_length` scaled closes as model
+    input, inverse scaling of the last step.
+    Returns an array aligned with `closes` (NaN where the window is incomplete).
+    """
+    session = get_backtest_session(model_path)
+    closes = np.asarray(closes, dtype=np.float64)
+    if scaler is None:
+        windows = sliding_window_view(closes, lookback)
+        low, high = windows.min(axis=1), windows.max(axis=1)
+    else:
+        # Fixed training range, mapped to the scaler's feature range
+        count = len(closes) - lookback + 1
+        scale, offset = scaler.scale_[0], scaler.min_[0]
+        low, high = np.full(count, -offset / scale), np.full(count, (1 - offset) / scale)
+    span = np.where(high > low, high - low, 1.0)
+    inputs = sliding_window_view(closes, sequence_length)[lookback - sequence_length:]
+
+    predicted = np.full(len(closes), np.nan)
+    steps = np.array(horizon, dtype=np.int64)
+    for i in range(0, len(inputs), batch_size):
+        scaled = ((inputs[i:i + batch_size] - low[i:i + batch_size, None]) / span[i:i + batch_size, None]).astype(np.float32)
+        outputs = session.run(None, {'input': scaled[:, :, None], STEPS_INPUT: steps})[0]
+        predicted[lookback - 1 + i:lookback - 1 + i + len(scaled)] = outputs[-1, :, 0] * span[i:i + batch_size] + low[i:i + batch_size]
+    return predicted
+
+
+# Last VOLATILITY_WINDOW + 1 closes of each window that are not z-score outliers, oldest first
+def _clean_tails(closes, lookback):
+    series = pd.Series(closes)
+    mean = series.rolling(lookback).mean().to_numpy()
+    std = series.rolling(lookback).std(ddof=0).to_numpy()
+
+    tails = np.full((len(closes), VOLATILITY_TAIL), np.nan)
+    tails[VOLATILITY_TAIL - 1:] = sliding_window_view(closes, VOLATILITY_TAIL)
+    keep = np.abs(tails - mean[:, None]) < 3 * std[:, None]
+    keep |= (std == 0)[:, None]
+
+    # Newest first: the first VOLATILITY_WINDOW + 1 kept prices of each row
+    newest_first, keep = tails[:, ::-1], keep[:, ::-1]
+    order = np.argsort(~keep, axis=1, kind='stable')[:, :VOLATILITY_WINDOW + 1]
+    kept = np.take_along_axis(newest_first, order, axis=1)[:, ::-1]
+
+    # Too many recent outliers: fall back to the raw last prices
+    enough = keep.sum(axis=1) >= VOLATILITY_WINDOW + 1
+    kept[~enough] = tails[~enough, -(VOLATILITY_WINDOW + 1):]
+    return kept
+
+
+def rolling_volatility(closes, lookback, timeframe):
+    """
+    The close_to_close estimator of volatility.py for every window of `lookback` closes:
+    annualized std of the last 5 log returns after dropping the prices with a z-score of 3
+    or more.
+    """
+    log_returns = np.diff(np.log(_clean_tails(np.asarray(closes, dtype=np.float64), lookback)), axis=1)
+    return log_returns.std(axis=1) * np.sqrt(periods_per_year(timeframe))
+
+
+def signal_volatility(closes, lookback, timeframe):
+    """
+    The ewma estimator of volatility.py (signal tolerance) for every window of `lookback`
+    closes: annualized exponentially weighted RMS of the last 5 log returns.
+    """
+    log_returns = np.diff(np.log(_clean_tails(np.asarray(closes, dtype=np.float64), lookback)), axis=1)
+    return np.sqrt((ewma_weights(VOLATILITY_WINDOW) * log_returns ** 2).sum(axis=1) * periods_per_year(timeframe))
+
+
+def simulate_exits(data, entries, direction, stop_loss, take_profit, hold_bars):
+    """
+    Exit of each trade opened at the close of bar `entries[i]`: the first later bar whose
+    range reaches the stop loss or the take profit (the stop loss first if both), else the
+    close `hold_bars` bars later. Returns (exit index, exit price, reason).
+    """
+    highs = data['High'].to_numpy(dtype=np.float64)
+    lows = data['Low'].to_numpy(dtype=np.float64)
+    closes = data['Close'].to_numpy(dtype=np.float64)
+    last = len(closes) - 1
+
+    # Bars t+1 .. t+hold_bars of every entry (padded past the end of the data)
+    pad = np.full(hold_bars, np.nan)
+    future_highs = sliding_window_view(np.concatenate([highs[1:], pad]), hold_bars)[entries]
+    future_lows = sliding_window_view(np.concatenate([lows[1:], pad]), hold_bars)[entries]
+
+    is_long = (direction == 1)[:, None]
+    stop_hit = np.where(is_long, future_lows <= stop_loss[:, None], future_highs >= stop_loss[:, None])
+    target_hit = np.where(is_long, future_highs >= take_profit[:, None], future_lows <= take_profit[:, None])
+    hit = stop_hit | target_hit
+
+    any_hit = hit.any(axis=1)
+    first = np.where(any_hit, hit.argmax(axis=1), hold_bars - 1)
+    exit_index = np.minimum(entries + 1 + first, last)
+    stopped = any_hit & stop_hit[np.arange(len(entries)), first]
+    exit_price = np.where(stopped, stop_loss, np.where(any_hit, take_profit, closes[exit_index]))
+    reason = np.where(stopped, 'stop_loss', np.where(any_hit, 'take_profit', 'timeout'))
+    return exit_index, exit_price, reason
+
+
+# Keep the trades that do not overlap a previous one (one position at a time)
+def _sequential(entries, exit_index):
+    taken = []
+    i = 0
+    while i < len(entries):
+        taken.append(i)
+        i = int(np.searchsorted(entries, exit_index[i], side='right'))
+    return np.array(taken, dtype=np.int64)
+
+
+def max_drawdown(equity):
+    peaks = np.maximum.accumulate(equity)
+    return float(((equity - peaks) / peaks).min()) if len(equity) else 0.0
+
+
+def run_backtest(data, model_path, timeframe='15min', lookback=None, sequence_length=59, horizon=FORECAST_HORIZON, hold_bars=None, fee=0.0, scaler=None):
+    """
+    Backtest the strategy of one symbol/timeframe over `data` (OHLC bars).
+
+    - `lookback`: bars of the served window (scaling, volatility), the bar store window by default.
+    - `hold_bars`: maximum holding time of a trade, `horizon` bars by default.
+    - `fee`: proportional cost paid on entry and on exit.
+    - `scaler`: scaler the model was trained with (registry versions), None to fit it per window.
+
+    Returns (summary dict, DataFrame of the trades).
+    """
+    spec = markets.TIMEFRAMES[timeframe]
+    lookback = min(lookback or period_to_bars(spec['period'], spec['interval']), len(data))
+    hold_bars = hold_bars or horizon
+    if lookback < max(sequence_length, VOLATILITY_TAIL):
+        raise ValueError(f"Not enough bars to backtest: {len(data)}.")
+
+    closes = data['Close'].ffill().bfill().to_numpy(dtype=np.float64)
+    series = pd.Series(closes)
+
+    started = time.time()
+    predicted = forecast_last_step(closes, lookback, model_path, sequence_length, horizon, scaler=scaler)
+    forecast_time = time.time() - started
+
+    rsi = calculate_rsi(series, timeframe=timeframe).to_numpy()
+    fibonacci_bars = min(spec['fibonacci_days'] * spec['bars_per_day'], lookback)
+    high = series.rolling(fibonacci_bars, min_periods=1).max().to_numpy()
+    low = series.rolling(fibonacci_bars, min_periods=1).min().to_numpy()
+    volatility = rolling_volatility(closes, lookback, timeframe)
+
+    levels = fibonacci_level_matrix(closes, high, low)
+    direction, confidence = generate_signals_batch(closes, predicted, rsi, levels, signal_volatility(closes, lookback, timeframe))
+    direction[:lookback - 1] = 0
+    direction[-1] = 0  # No bar left to exit
+
+    entries = np.flatnonzero(direction)
+    entry_direction = direction[entries]
+    entry_price = closes[entries]
+    stop_loss, take_profit = stop_loss_take_profit_batch(entry_price, entry_direction, volatility[entries])
+    exit_index, exit_price, reason = simulate_exits(data, entries, entry_direction, stop_loss, take_profit, hold_bars)
+    returns = entry_direction * (exit_price / entry_price - 1) - 2 * fee
+
+    trades = pd.DataFrame({
+        'entry_time': data.index[entries],
+        'exit_time': data.index[exit_index],
+        'direction': np.where(entry_direction == 1, 'Buy', 'Sell'),
+        'confidence': confidence[entries],
+        'entry_price': entry_price,
+        'stop_loss': stop_loss,
+        'take_profit': take_profit,
+        'exit_price': exit_price,
+        'exit_reason': reason,
+        'return': returns,
+    })
+
+    # Equity of one position at a time, compounding each trade
+    taken = _sequential(entries, exit_index) if len(entries) else np.array([], dtype=np.int64)
+    trades['taken'] = np.isin(np.arange(len(trades)), taken)
+    equity = np.cumprod(1 + returns[taken])
+
+    summary = {
+        'bars': len(data),
+        'evaluated_bars': len(data) - lookback,
+        'signals': int(len(entries)),
+        'signal_hit_rate': float((returns > 0).mean()) if len(entries) else 0.0,
+        'signal_mean_return': float(returns.mean()) if len(entries) else 0.0,
+        'trades': int(len(taken)),
+        'hit_rate': float((returns[taken] > 0).mean()) if len(taken) else 0.0,
+        'total_return': float(equity[-1] - 1) if len(taken) else 0.0,
+        'max_drawdown': max_drawdown(np.concatenate([[1.0], equity])),
+        'forecast_seconds': forecast_time,
+        'total_seconds': time.time() - started,
+    }
+    return summary, trades
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Backtest the trading signals over a price history.")
+    parser.add_argument('--data', help="CSV file or .bars directory (default: the bar store of --symbol/--timeframe)")
+    parser.add_argument('--symbol', default='ETH-USD')
+    parser.add_argument('--timeframe', default='15min', choices=list(markets.TIMEFRAMES))
+    parser.add_argument('--model', help="ONNX model (default: the served model of --symbol/--timeframe)")
+    parser.add_argument('--start')
+    parser.add_argument('--end')
+    parser.add_argument('--lookback', type=int, help="Bars of the served window")
+    parser.add_argument('--horizon', type=int, default=FORECAST_HORIZON)
+    parser.add_argument('--hold_bars', type=int, help="Maximum holding time in bars (default: the horizon)")
+    parser.add_argument('--fee', type=float, default=0.0, help="Proportional fee per side")
+    parser.add_argument('--trades', help="CSV file to write the trades to")
+    args = parser.parse_args()
+
+    symbol = markets.resolve_symbol(args.symbol)
+    data_path = args.data or markets.bars_path(symbol, args.timeframe)
+    model = {'path': args.model, 'scaler': None, 'sequence_length': 59} if args.model else serving_model(symbol, args.timeframe)
+    data = load_bars(data_path, args.start, args.end)
+    print(f"Backtesting {model['path']} over {len(data)} bars of {data_path}...")
+
+    summary, trades = run_backtest(data, model['path'], args.timeframe, args.lookback, model['sequence_length'], horizon=args.horizon,
+                                   hold_bars=args.hold_bars, fee=args.fee, scaler=model['scaler'])
+    for name, value in summary.items():
+        print(f"{name}: {value:.4f}" if isinstance(value, float) else f"{name}: {value}")
+
+    if args.trades:
+        trades.to_csv(args.trades, index=False)
+        print(f"Trades saved to {args.trades}")
+
+
+if __name__ == '__main__':
+    main()
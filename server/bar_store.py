@@ -0,0 +1,322 @@
+# /server/bar_store.py
+
+import os
+import threading
+import logging
+import pandas as pd
+import yfinance as yf
+from .columnar_store import ColumnarBarFile, convert_csv
+
+logger = logging.getLogger(__name__)
+
+OHLCV_COLUMNS = ['Open', 'High', 'Low', 'Close', 'Adj Close', 'Volume']
+
+# Bar duration for each yfinance interval
+INTERVAL_DURATIONS = {
+    '1m': pd.Timedelta(minutes=1),
+    '5m': pd.Timedelta(minutes=5),
+    '15m': pd.Timedelta(minutes=15),
+    '30m': pd.Timedelta(minutes=30),
+    '1h': pd.Timedelta(hours=1),
+    '4h': pd.Timedelta(hours=4),
+    '1d': pd.Timedelta(days=1),
+}
+
+
+# Convert a yfinance period ('30d', '3mo', '1y') to a duration
+def period_to_timedelta(period):
+    units = {'d': 1, 'wk': 7, 'mo': 30, 'y': 365}
+    for unit, days in units.items():
+        if period.endswith(unit) and period[:-len(unit)].isdigit():
+            return pd.Timedelta(days=int(period[:-len(unit)]) * days)
+    raise ValueError(f"Unsupported period: {period}")
+
+
+# Number of bars of `interval` covering `period`
+def period_to_bars(period, interval):
+    return int(period_to_timedelta(period) / INTERVAL_DURATIONS[interval])
+
+
+# Bring a downloaded/loaded frame to the store layout: UTC index on the bar grid, OHLCV columns
+def normalize_bars(data, interval):
+    if data is None or data.empty:
+        return pd.DataFrame(columns=OHLCV_COLUMNS, index=pd.DatetimeIndex([], tz='UTC', name='Datetime'))
+
+    data = data.copy()
+
+    # Recent yfinance versions return (field, ticker) columns even for a single ticker
+    if isinstance(data.columns, pd.MultiIndex):
+        data.columns = data.columns.get_level_values(0)
+
+    if 'Adj Close' not in data.columns and 'Close' in data.columns:
+        data['Adj Close'] = data['Close']
+    data = data[[c for c in OHLCV_COLUMNS if c in data.columns]]
+
+    index = pd.DatetimeIndex(pd.to_datetime(data.index, utc=True))
+    # The live bar comes back with an off-grid timestamp (e.g. 18:16 for the 18:15 bar)
+    data.index = index.floor(INTERVAL_DURATIONS[interval])
+    data.index.name = 'Datetime'
+
+    # Keep the most recent version of each bar
+    data = data[~data.index.duplicated(keep='last')]
+    return data.sort_index()
+
+
+# Aggregate bars to a coarser interval (e.g. 15m -> 1h), bars aligned on the UTC interval grid
+def resample_bars(data, interval):
+    if data is None or data.empty:
+        return normalize_bars(None, interval)
+
+    groups = data.groupby(data.index.floor(INTERVAL_DURATIONS[interval]))
+    resampled = groups.agg({'Open': 'first', 'High': 'max', 'Low': 'min', 'Close': 'last', 'Adj Close': 'last', 'Volume': 'sum'})
+    resampled.index.name = 'Datetime'
+    return resampled
+
+
+# Fill missing bars on the interval grid with flat bars at the previous close
+def repair_gaps(data, interval):
+    if len(data) < 2:
+        return data
+
+    grid = pd.date_range(data.index[0], data.index[-1], freq=INTERVAL_DURATIONS[interval], name='Datetime')
+    if len(grid) == len(data):
+        return data
+
+    logger.info("Repairing %d missing %s bars.", len(grid) - len(data), interval)
+    repaired = data.reindex(grid)
+    missing = repaired['Close'].isna()
+    repaired['Close'] = repaired['Close'].ffill()
+    repaired['Adj Close'] = repaired['Adj Close'].fillna(repaired['Close'])
+    for column in ('Open', 'High', 'Low'):
+        repaired.loc[missing, column] = repaired.loc[missing, 'Close']
+    repaired['Volume'] = repaired['Volume'].fillna(0)
+    return repaired
+
+
+class YFinanceSource:
+    """
+    Live bar source backed by yfinance.
+    """
+
+    # yf.download collects its results in module-level globals: one download at a time
+    _download_lock = threading.Lock()
+
+    # Timestamp of the latest bar the source can serve
+    def now(self, ticker=None, interval=None):
+        return pd.Timestamp.now(tz='UTC')
+
+    def fetch(self, ticker, interval, start=None, period=None):
+        return self.fetch_many([ticker], interval, start, period).get(ticker)
+
+    def fetch_many(self, tickers, interval, start=None, period=None):
+        """
+        Download several tickers in one request and return {ticker: DataFrame}.
+        """
+        with self._download_lock:
+            if start is not None:
+                data = yf.download(tickers=tickers, start=start, interval=interval, group_by='ticker', progress=False)
+            else:
+                data = yf.download(tickers=tickers, period=period, interval=interval, group_by='ticker', progress=False)
+
+        # Single-ticker downloads may come back without the ticker column level
+        downloaded = set(data.columns.get_level_values(0)) if isinstance(data.columns, pd.MultiIndex) else set()
+        if len(tickers) == 1 and tickers[0] not in downloaded:
+            return {tickers[0]: data}
+        return {ticker: data[ticker].dropna(how='all') for ticker in tickers if ticker in downloaded}
+
+
+class CsvReplaySource:
+    """
+    Offline stand-in for a live source: replays the bars of CSV files, releasing
+    `bars_per_fetch` new bars on each delta fetch as if they had just been published.
+
+    - `resolve`: function (ticker, interval) -> path of the CSV file to replay.
+    """
+
+    def __init__(self, resolve, initial_bars=None, bars_per_fetch=1):
+        self.resolve = resolve
+        self.initial_bars = initial_bars
+        self.bars_per_fetch = bars_per_fetch
+        self._files = {}
+
+    # Replayed bars and number of bars released so far for a ticker/interval
+    def _replay(self, ticker, interval):
+        key = (ticker, interval)
+        if key not in self._files:
+            path = self.resolve(ticker, interval)
+            logger.info("Replaying %s %s bars from %s", ticker, interval, path)
+            data = pd.read_csv(path, index_col=0)
+            data.index = pd.to_datetime(data.index, utc=True)
+            released = len(data) if self.initial_bars is None else min(self.initial_bars, len(data))
+            self._files[key] = [data, released]
+        return self._files[key]
+
+    def now(self, ticker=None, interval=None):
+        data, released = self._replay(ticker, interval)
+        return data.index[released - 1]
+
+    def fetch(self, ticker, interval, start=None, period=None):
+        replay = self._replay(ticker, interval)
+        data = replay[0]
+        if start is None:
+            return data.iloc[:replay[1]]
+
+        replay[1] = min(replay[1] + self.bars_per_fetch, len(data))
+        released = data.iloc[:replay[1]]
+        return released[released.index >= start]
+
+    def fetch_many(self, tickers, interval, start=None, period=None):
+        return {ticker: self.fetch(ticker, interval, start, period) for ticker in tickers}
+
+
+class BarStore:
+    """
+    Local OHLCV history for one ticker/interval.
+
+    The first update downloads `period` of history (or reloads it from `path`); later
+    updates only ask the source for bars from the last stored bar onwards, merge them
+    (the last bar is replaced while it is still forming), repair gaps (`fill_gaps`) and append the
+    newly closed bars to the columnar bar directory at `path` (see columnar_store).
+    """
+
+    def __init__(self, ticker, interval, source, period='30d', path=None, max_bars=None, fetch_interval=None, fill_gaps=True):
+        self.ticker = ticker
+        self.interval = interval
+        # Interval downloaded from the source, resampled to `interval` if finer
+        self.fetch_interval = fetch_interval or interval
+        self.source = source
+        self.period = period
+        self.path = path
+        # Bars kept in memory (the file keeps the whole history)
+        self.max_bars = max_bars or period_to_bars(period, interval)
+        # Fill missing bars with flat ones: only for markets trading around the clock, a
+        # session market (futures, FX) has no bars while it is closed
+        self.fill_gaps = fill_gaps
+        self.data = None
+        self._bar_file = None
+        self._persisted_until = None
+
+    # Reload the persisted history, if any
+    def _load(self):
+        if not self.path:
+            return normalize_bars(None, self.interval)
+
+        # Migrate the CSV file previously written next to the store
+        # (not from a replay: the CSV may be the replayed file itself, whose bars are released one by one)
+        legacy_csv = os.path.splitext(self.path)[0] + '.csv'
+        if not os.path.exists(self.path) and os.path.exists(legacy_csv) and not isinstance(self.source, CsvReplaySource):
+            convert_csv(legacy_csv, self.path)
+
+        self._bar_file = ColumnarBarFile(self.path).open_for_append()
+        logger.info("Loading the last %d stored %s %s bars from %s", self.max_bars, self.ticker, self.interval, self.path)
+        data = normalize_bars(self._bar_file.read_frame(last=self.max_bars), self.interval)
+        if not data.empty:
+            self._persisted_until = data.index[-1]
+        return data
+
+    # Append the closed bars (all but the forming one) that are not on disk yet
+    def _persist(self):
+        if not self.path or len(self.data) < 2:
+            return
+
+        closed = self.data.iloc[:-1]
+        if self._persisted_until is not None:
+            closed = closed[closed.index > self._persisted_until]
+        if closed.empty:
+            return
+
+        self._bar_file.append_frame(closed)
+        self._persisted_until = closed.index[-1]
+
+    def pending_request(self):
+        """
+        Describe the fetch this store needs: ('period', period) for a full download,
+        or ('start', timestamp) for the bars from the last stored one onwards.
+        """
+        if self.data is None:
+            self.data = self._load()
+
+        # History older than the download window cannot be bridged with a delta fetch
+        if not self.data.empty and self.source.now(self.ticker, self.fetch_interval) - self.data.index[-1] > period_to_timedelta(self.period):
+            logger.info("Stored %s %s bars are too old, downloading the full window again.", self.ticker, self.interval)
+            self.data = normalize_bars(None, self.interval)
+
+        if self.data.empty:
+            return 'period', self.period
+        return 'start', self.data.index[-1]
+
+    def merge(self, fetched):
+        """
+        Merge freshly fetched bars into the store and return the stored window (None if empty).
+        """
+        if self.fetch_interval != self.interval:
+            fetched = resample_bars(normalize_bars(fetched, self.fetch_interval), self.interval)
+        fetched = normalize_bars(fetched, self.interval)
+        if fetched.empty and self.data.empty:
+            return None
+
+        if not fetched.empty:
+            merged = pd.concat([self.data, fetched])
+            merged = merged[~merged.index.duplicated(keep='last')].sort_index()
+            self.data = repair_gaps(merged, self.interval) if self.fill_gaps else merged
+            self._persist()
+            self.data = self.data.iloc[-self.max_bars:]
+
+        return self.data
+
+    def update(self):
+        """
+        Fetch the bars newer than the last stored one and return the full stored history.
+        """
+        kind, value = self.pending_request()
+        if kind == 'period':
+            logger.info("Fetching %s history for %s (%s interval)...", self.ticker, self.period, self.interval)
+            fetched = self.source.fetch(self.ticker, self.fetch_interval, period=value)
+        else:
+            fetched = self.source.fetch(self.ticker, self.fetch_interval, start=value)
+        return self.merge(fetched)
+
+    def merge_from_base(self, base):
+        """
+        Extend a store of derived bars from the bars of a finer timeframe held in memory.
+        Only the base bars from the start of the last stored (still open) bar onwards are
+        aggregated, so a new base bar only rebuilds the current higher-timeframe bar.
+        """
+        if base is None or base.empty:
+            return self.data
+        if self.data is not None and not self.data.empty:
+            base = base[base.index >= self.data.index[-1]]
+        return self.merge(resample_bars(base, self.interval))
+
+    # Return the last `count` stored bars (all of them if count is None)
+    def bars(self, count=None):
+        if self.data is None:
+            return None
+        return self.data if count is None else self.data.iloc[-count:]
+
+
+def update_stores(stores):
+    """
+    Update several stores sharing the same source and interval with as few requests as
+    possible: one download for all the stores needing their full window, and one delta
+    download (from the oldest last bar) for all the others. Returns {ticker: bars or None}.
+    """
+    groups = {}
+    for store in stores:
+        kind, value = store.pending_request()
+        groups.setdefault((id(store.source), store.fetch_interval, kind), []).append((store, value))
+
+    results = {}
+    for (_, interval, kind), members in groups.items():
+        source = members[0][0].source
+        tickers = [store.ticker for store, _ in members]
+        if kind == 'period':
+            period = max((value for _, value in members), key=period_to_timedelta)
+            logger.info("Fetching %s history for %s (%s interval)...", ', '.join(tickers), period, interval)
+            fetched = source.fetch_many(tickers, interval, period=period)
+        else:
+            fetched = source.fetch_many(tickers, interval, start=min(value for _, value in members))
+
+        for store, _ in members:
+            results[store.ticker] = store.merge(fetched.get(store.ticker))
+    return results
@@ -0,0 +1,74 @@
+# /server/chart_protocol.py
+#
+# Chart messages sent to the dashboards ('update_chart'). A client receives a full snapshot
+# when it subscribes, then deltas only: the number of bars dropped from the front of the
+# window, the number of bars kept after them, and the bars appended or replaced at the end.
+# Every payload of a room carries a sequence number and a delta names the one it applies to
+# (`base_seq`), so a client that missed a message asks for a new snapshot.
+#
+# Series are sent as binary arrays (Socket.IO attachments): float64 for the bar times in
+# milliseconds, float32 for the prices, the RSI and the forecast.
+
+import json
+import numpy as np
+
+# Series with one value per bar (what a delta slices), and their encoding
+BAR_SERIES = {'times': np.float64, 'prices': np.float32, 'rsi': np.float32}
+# Other arrays, always sent whole
+ARRAYS = {'predicted_prices': np.float32}
+
+
+def _pack(values, dtype):
+    return np.asarray(values, dtype=dtype).tobytes()
+
+
+# Fields sent as they are (signal, levels, accuracy...)
+def _fields(payload):
+    return {name: value for name, value in payload.items() if name not in BAR_SERIES and name not in ARRAYS}
+
+
+def snapshot_message(payload):
+    message = _fields(payload)
+    message['type'] = 'snapshot'
+    for name, dtype in {**BAR_SERIES, **ARRAYS}.items():
+        message[name] = _pack(payload[name], dtype)
+    return message
+
+
+# Size of a message on the wire: its binary arrays plus the JSON of the other fields
+def message_size(message):
+    binary = sum(len(value) for value in message.values() if isinstance(value, bytes))
+    fields = {name: value for name, value in message.items() if not isinstance(value, bytes)}
+    return binary + len(json.dumps(fields, default=str))
+
+
+def delta_message(previous, payload):
+    """
+    Message turning the chart of `previous` into the chart of `payload`, or a snapshot if
+    the new window does not start inside the previous one.
+    """
+    if previous is None or previous.get('seq') is None:
+        return snapshot_message(payload)
+
+    old_times, new_times = np.asarray(previous['times'], dtype=np.int64), np.asarray(payload['times'], dtype=np.int64)
+    if not len(old_times) or not len(new_times):
+        return snapshot_message(payload)
+    drop = int(np.searchsorted(old_times, new_times[0]))
+    if drop >= len(old_times) or old_times[drop] != new_times[0]:
+        return snapshot_message(payload)
+
+    # Bars kept: the longest run of identical bars (time and values) after the dropped ones
+    overlap = min(len(old_times) - drop, len(new_times))
+    same = old_times[drop:drop + overlap] == new_times[:overlap]
+    for name in BAR_SERIES:
+        if name != 'times':
+            same &= np.asarray(previous[name], dtype=np.float64)[drop:drop + overlap] == np.asarray(payload[name], dtype=np.float64)[:overlap]
+    keep = overlap if same.all() else int(np.argmin(same))
+
+    message = _fields(payload)
+    message.update({'type': 'delta', 'base_seq': previous['seq'], 'drop': drop, 'keep': keep})
+    for name, dtype in BAR_SERIES.items():
+        message[name] = _pack(payload[name][keep:], dtype)
+    for name, dtype in ARRAYS.items():
+        message[name] = _pack(payload[name], dtype)
+    return message
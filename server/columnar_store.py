@@ -0,0 +1,210 @@
+# /server/columnar_store.py
+#
+# Binary columnar storage: one fixed-width little-endian file per column plus a meta.json
+# describing the schema. Rows are appended at the end of every column file; reads memory-map
+# the files and slice them, so only the pages of the requested rows are ever loaded.
+#
+# This module only depends on numpy/pandas so that it can also be run as a script:
+#     python server/columnar_store.py models/eth_usd_15min.csv models/eth_usd_hourly.csv
+
+import os
+import re
+import sys
+import json
+import logging
+import numpy as np
+import pandas as pd
+
+logger = logging.getLogger(__name__)
+
+BAR_COLUMNS = ['Open', 'High', 'Low', 'Close', 'Adj Close', 'Volume']
+
+# Schema of a bar file: nanosecond UTC timestamps plus float64 OHLCV columns
+BAR_SCHEMA = [('timestamp', '<i8', ())] + [(name, '<f8', ()) for name in BAR_COLUMNS]
+
+
+def _file_name(column, dtype):
+    return re.sub(r'[^a-z0-9]+', '_', column.lower()).strip('_') + '.' + np.dtype(dtype).str[1:]
+
+
+class ColumnarStore:
+    """
+    Append-only columnar table stored in a directory.
+
+    - `schema`: list of (column, dtype, shape) tuples; `shape` is the per-row shape
+      (e.g. (60,) for a fixed-length array column), () for scalars.
+    - `key`: sorted int64 column used for range reads. It is written last on append, so
+      its length is the number of committed rows.
+
+    Opening a store never modifies it: readers only see the committed rows, even while
+    another process is appending. A writer calls `open_for_append()` first.
+    """
+
+    def __init__(self, path, schema=None, key='timestamp'):
+        self.path = path
+        self.key = key
+        meta_path = os.path.join(path, 'meta.json')
+
+        if os.path.exists(meta_path):
+            with open(meta_path) as f:
+                meta = json.load(f)
+            self.columns = meta['columns']
+            self.key = meta.get('key', key)
+        elif schema is not None:
+            os.makedirs(path, exist_ok=True)
+            self.columns = [
+                {'name': name, 'file': _file_name(name, dtype), 'dtype': np.dtype(dtype).str, 'shape': list(shape)}
+                for name, dtype, shape in schema
+            ]
+            with open(meta_path, 'w') as f:
+                json.dump({'key': self.key, 'columns': self.columns}, f, indent=2)
+        else:
+            raise FileNotFoundError(f"No columnar store at {path}")
+
+        self._by_name = {column['name']: column for column in self.columns}
+
+    def _column_path(self, column):
+        return os.path.join(self.path, column['file'])
+
+    def _row_bytes(self, column):
+        return np.dtype(column['dtype']).itemsize * int(np.prod(column['shape'], dtype=np.int64))
+
+    def __len__(self):
+        key = self._by_name[self.key]
+        path = self._column_path(key)
+        return os.path.getsize(path) // self._row_bytes(key) if os.path.exists(path) else 0
+
+    def open_for_append(self):
+        """
+        Prepare the store for appends by its (single) writer and return it: drop the partial
+        rows left by an interrupted append (value columns written, key not yet).
+        """
+        self._repair()
+        return self
+
+    def _repair(self):
+        rows = len(self)
+        for column in self.columns:
+            path = self._column_path(column)
+            expected = rows * self._row_bytes(column)
+            if os.path.exists(path) and os.path.getsize(path) > expected:
+                with open(path, 'r+b') as f:
+                    f.truncate(expected)
+
+    def append(self, columns):
+        """
+        Append rows given as a dict {column: array}; every column of the schema must be present.
+        Key values must be greater than the last stored key.
+        """
+        rows = len(columns[self.key])
+        if rows == 0:
+            return
+
+        last = self.last_key()
+        if last is not None and np.asarray(columns[self.key])[0] <= last:
+            raise ValueError(f"Appended rows must come after the last stored {self.key} ({last}).")
+
+        ordered = [c for c in self.columns if c['name'] != self.key] + [self._by_name[self.key]]
+        for column in ordered:
+            values = np.ascontiguousarray(columns[column['name']], dtype=column['dtype'])
+            if values.shape != (rows, *column['shape']):
+                raise ValueError(f"Column {column['name']} has shape {values.shape}, expected {(rows, *column['shape'])}.")
+            with open(self._column_path(column), 'ab') as f:
+                f.write(values.tobytes())
+
+    # Memory-mapped, read-only view of a whole column
+    def column(self, name, rows=None):
+        column = self._by_name[name]
+        rows = len(self) if rows is None else rows
+        shape = (rows, *column['shape'])
+        if rows == 0:
+            return np.empty(shape, dtype=column['dtype'])
+        return np.memmap(self._column_path(column), dtype=column['dtype'], mode='r', shape=shape)
+
+    def last_key(self):
+        rows = len(self)
+        return int(self.column(self.key, rows)[rows - 1]) if rows else None
+
+    # Row range [start, end) of the keys between `start` and `end` (inclusive), or of the last `last` rows
+    def row_range(self, start=None, end=None, last=None):
+        rows = len(self)
+        if last is not None:
+            return max(rows - last, 0), rows
+
+        keys = self.column(self.key, rows)
+        i0 = int(np.searchsorted(keys, start, side='left')) if start is not None else 0
+        i1 = int(np.searchsorted(keys, end, side='right')) if end is not None else rows
+        return i0, i1
+
+    def read(self, start=None, end=None, last=None, columns=None):
+        """
+        Return {column: array} for the requested key range. The arrays are zero-copy
+        slices of the memory-mapped files.
+        """
+        rows = len(self)
+        i0, i1 = self.row_range(start, end, last)
+        names = columns or [c['name'] for c in self.columns]
+        return {name: self.column(name, rows)[i0:i1] for name in names}
+
+
+# Nanoseconds since the epoch of a timestamp (naive timestamps are taken as UTC)
+def to_nanoseconds(value):
+    if value is None:
+        return None
+    value = pd.Timestamp(value)
+    if value.tzinfo is None:
+        value = value.tz_localize('UTC')
+    return value.value
+
+
+class ColumnarBarFile(ColumnarStore):
+    """
+    OHLCV bars indexed by timestamp, with DataFrame helpers.
+    """
+
+    def __init__(self, path):
+        super().__init__(path, BAR_SCHEMA, key='timestamp')
+
+    def append_frame(self, data):
+        index = pd.DatetimeIndex(pd.to_datetime(data.index, utc=True))
+        columns = {'timestamp': index.tz_localize(None).values.astype('datetime64[ns]').view(np.int64)}
+        for name in BAR_COLUMNS:
+            columns[name] = data[name].to_numpy(dtype=np.float64) if name in data.columns else np.full(len(data), np.nan)
+        self.append(columns)
+
+    def read_frame(self, start=None, end=None, last=None, columns=None):
+        """
+        Return the bars between two timestamps (or the last `last` bars) as a DataFrame.
+        """
+        arrays = self.read(to_nanoseconds(start), to_nanoseconds(end), last, ['timestamp'] + (columns or BAR_COLUMNS))
+        index = pd.DatetimeIndex(pd.to_datetime(np.asarray(arrays.pop('timestamp')), utc=True), name='Datetime')
+        return pd.DataFrame({name: np.asarray(values) for name, values in arrays.items()}, index=index)
+
+
+# One-shot conversion of a price CSV to a columnar bar directory (same name, .bars suffix)
+def convert_csv(csv_path, out_path=None):
+    out_path = out_path or os.path.splitext(csv_path)[0] + '.bars'
+    logger.info("Converting %s to %s...", csv_path, out_path)
+
+    data = pd.read_csv(csv_path, index_col=0)
+    data.index = pd.to_datetime(data.index, utc=True)
+    data = data[~data.index.duplicated(keep='last')].sort_index()
+
+    bar_file = ColumnarBarFile(out_path).open_for_append()
+    last = bar_file.last_key()
+    if last is not None:
+        data = data[data.index > pd.to_datetime(last, utc=True)]
+    bar_file.append_frame(data)
+
+    logger.info("%d bars written, %d bars in %s.", len(data), len(bar_file), out_path)
+    return out_path
+
+
+if __name__ == '__main__':
+    logging.basicConfig(level=logging.INFO, format='%(message)s')
+    if len(sys.argv) < 2:
+        print("Usage: python server/columnar_store.py <file.csv> [<file.csv> ...]")
+        sys.exit(1)
+
+    for csv_path in sys.argv[1:]:
+        convert_csv(csv_path)
@@ -0,0 +1,134 @@
+# /server/compute_loop.py
+
+import os
+import json
+import threading
+import logging
+from . import socketio, MESSAGE_QUEUE_URL
+from .markets import ACTIVE_SYMBOLS, PRIMARY_TIMEFRAME
+from .chart_protocol import delta_message, message_size
+from .metrics import timed, increment
+
+logger = logging.getLogger(__name__)
+
+# Default market served to dashboards that do not subscribe explicitly
+DEFAULT_SYMBOL = ACTIVE_SYMBOLS[0]
+DEFAULT_TIMEFRAME = PRIMARY_TIMEFRAME
+
+# Seconds between two compute cycles (same cadence the dashboards used to poll at)
+COMPUTE_INTERVAL = float(os.getenv('COMPUTE_INTERVAL', '10'))
+
+# 'inline': each server process runs the compute loop (single process deployments)
+# 'external': the loop runs in the compute service (python -m server.compute_service) and the
+# server processes only relay its emits and read its results from Redis
+COMPUTE_MODE = os.getenv('COMPUTE_MODE', 'inline')
+
+# Redis holding the latest payloads for the other processes (the message queue by default)
+RESULT_CACHE_URL = os.getenv('RESULT_CACHE_URL') or (MESSAGE_QUEUE_URL if (MESSAGE_QUEUE_URL or '').startswith('redis') else '')
+RESULT_KEY_PREFIX = 'geotrade:latest:'
+
+# Latest payload per Socket.IO room, shared by every connected client
+_latest_results = {}
+_results_lock = threading.Lock()
+_cycle_lock = threading.Lock()
+
+_loop_started = False
+_loop_lock = threading.Lock()
+
+_redis = None
+
+
+# Redis client of the result cache (None if not configured)
+def _result_cache():
+    global _redis
+    if RESULT_CACHE_URL and _redis is None:
+        import redis
+        _redis = redis.Redis.from_url(RESULT_CACHE_URL)
+    return _redis
+
+
+# Name of the Socket.IO room holding the subscribers of a symbol/timeframe
+def room_name(symbol=DEFAULT_SYMBOL, timeframe=DEFAULT_TIMEFRAME):
+    return f"{symbol}:{timeframe}"
+
+
+# Return the latest computed payload for a room, or None if nothing was computed yet
+def get_latest(room):
+    with _results_lock:
+        payload = _latest_results.get(room)
+    if payload is None and COMPUTE_MODE == 'external' and _result_cache() is not None:
+        cached = _result_cache().get(RESULT_KEY_PREFIX + room)
+        payload = json.loads(cached) if cached else None
+    return payload
+
+
+# Publish the latest payloads for the server processes of an external compute service
+def _publish_results(payloads):
+    cache = _result_cache()
+    if cache is None or not payloads:
+        return
+    try:
+        cache.mset({RESULT_KEY_PREFIX + room: json.dumps(payload) for room, payload in payloads.items()})
+    except Exception as e:
+        logger.error("Publishing the results to %s failed: %s", RESULT_CACHE_URL, e)
+
+
+def run_cycle(symbols=None):
+    """
+    Run the data pipeline once for every active symbol (or only `symbols`), cache the
+    results and push each new one to the subscribers of its symbol/timeframe room, as a
+    delta from the previous payload of the room (see chart_protocol).
+    Returns {room: payload}.
+    """
+    from .data_request import compute_updates
+
+    # Only one cycle at a time: a cold request_data arriving while the loop is
+    # computing waits for that result instead of starting a second pipeline
+    with _cycle_lock, timed('cycle'):
+        payloads = {room_name(symbol, timeframe): payload for (symbol, timeframe), payload in compute_updates(symbols).items()}
+        with _results_lock:
+            # Symbols without a new bar return the payload they already pushed
+            changed = {room: payload for room, payload in payloads.items() if _latest_results.get(room) is not payload}
+            previous = {room: _latest_results.get(room) for room in changed}
+            for room, payload in changed.items():
+                payload['seq'] = (previous[room] or {}).get('seq', 0) + 1
+            _latest_results.update(payloads)
+
+    with timed('emit'):
+        _publish_results(changed)
+        for room, payload in changed.items():
+            message = delta_message(previous[room], payload)
+            socketio.emit('update_chart', message, to=room)
+            increment('emitted_messages')
+            increment('emitted_bytes', message_size(message))
+    return payloads
+
+
+# Background loop: one pipeline run per interval, whatever the number of clients
+def _compute_loop():
+    while True:
+        try:
+            run_cycle()
+        except Exception as e:
+            logger.error("Compute cycle failed: %s", e)
+        socketio.sleep(COMPUTE_INTERVAL)
+
+
+# Run the compute loop in the current thread (compute service)
+def run_compute_loop():
+    logger.info("Running compute loop (every %s s)...", COMPUTE_INTERVAL)
+    _compute_loop()
+
+
+# Start the shared compute loop (only once per process, and only in inline mode)
+def start_compute_loop():
+    global _loop_started
+    if COMPUTE_MODE == 'external':
+        return
+    with _loop_lock:
+        if _loop_started:
+            return
+        _loop_started = True
+
+    logger.info("Starting shared compute loop (every %s s)...", COMPUTE_INTERVAL)
+    socketio.start_background_task(_compute_loop)
@@ -0,0 +1,29 @@
+# /server/compute_service.py
+#
+# Standalone compute service for multi-process deployments: runs the data pipeline and the
+# performance evaluation once for all the server processes, which run with
+# COMPUTE_MODE=external. Results reach the clients through the message queue
+# (MESSAGE_QUEUE_URL) and the latest payloads are kept in Redis for new subscribers.
+#
+#     MESSAGE_QUEUE_URL=redis://localhost:6379/0 python -m server.compute_service
+#
+# The pipeline metrics of the service are served on COMPUTE_METRICS_PORT (/metrics), if set.
+
+import os
+import logging
+from . import MESSAGE_QUEUE_URL
+from .metrics import serve_metrics
+from .compute_loop import run_compute_loop
+from .performance_evaluation import start_background_performance_saving
+
+logger = logging.getLogger(__name__)
+
+COMPUTE_METRICS_PORT = int(os.getenv('COMPUTE_METRICS_PORT', '0'))
+
+if __name__ == '__main__':
+    if not MESSAGE_QUEUE_URL:
+        logger.warning("MESSAGE_QUEUE_URL is not set: results will only be computed, not delivered to clients.")
+    if COMPUTE_METRICS_PORT:
+        serve_metrics(COMPUTE_METRICS_PORT)
+    start_background_performance_saving()
+    run_compute_loop()
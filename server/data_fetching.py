@@ -1,46 +1,125 @@
+import os
+import logging
 import yfinance as yf
 import pandas as pd
+from .bar_store import BarStore, YFinanceSource, CsvReplaySource, update_stores
+from .markets import TIMEFRAMES, symbol_slug, bars_path, ALWAYS_OPEN_SYMBOLS
+from .workers import io_pool
+from .metrics import increment
 
-# Function to fetch ETH-USD data for the past 30 days at 15-minute intervals
-def fetch_eth_data_15min():
-    print("Fetching ETH-USD data for 30 days (15-minute interval)...")
-    data_15min = yf.download(tickers='ETH-USD', period='30d', interval='15m')
+logger = logging.getLogger(__name__)
 
-    if data_15min.empty:
-        print("No data fetched for 15-minute interval.")
-        return None
+# Bar source: 'yfinance' (live) or 'replay' (offline replay of the CSV files in BAR_REPLAY_DIR)
+BAR_SOURCE = os.getenv('BAR_SOURCE', 'yfinance')
+BAR_REPLAY_DIR = os.getenv('BAR_REPLAY_DIR', './models')
 
-    # Optionally, save the data to CSV
-    data_15min.to_csv('/models/eth_usd_15min.csv', index=True)
+# CSV replayed for a ticker/interval in offline mode (e.g. ./models/eth_usd_15min.csv)
+def replay_file(ticker, interval):
+    timeframe = next(name for name, spec in TIMEFRAMES.items() if spec['interval'] == interval)
+    return os.path.join(BAR_REPLAY_DIR, f"{symbol_slug(ticker)}_{timeframe}.csv")
 
-    print(f"Fetched 15-minute interval data: {data_15min.tail()}")
-    return data_15min
+# Build the bar source shared by all the stores
+def make_source():
+    if BAR_SOURCE == 'replay':
+        logger.info("Replaying bars from %s", BAR_REPLAY_DIR)
+        return CsvReplaySource(replay_file, initial_bars=int(os.getenv('BAR_REPLAY_INITIAL', '2000')))
+    return YFinanceSource()
 
+source = make_source()
 
-# Function to fetch ETH-USD data for the past 3 months at hourly intervals
-def fetch_eth_data_hourly():
-    print("Fetching ETH-USD data for 3 months (hourly interval)...")
-    data_hourly = yf.download(tickers='ETH-USD', period='3mo', interval='1h')
+# Local bar stores per (symbol, timeframe): full history is downloaded once, then only new bars are fetched
+_stores = {}
 
-    if data_hourly.empty:
-        print("No data fetched for hourly interval.")
-        return None
+def get_store(symbol, timeframe):
+    key = (symbol, timeframe)
+    if key not in _stores:
+        spec = TIMEFRAMES[timeframe]
+        _stores[key] = BarStore(symbol, spec['interval'], source, period=spec['period'], path=bars_path(symbol, timeframe),
+                                fetch_interval=spec.get('fetch_interval'),
+                                fill_gaps=symbol in ALWAYS_OPEN_SYMBOLS)
+    return _stores[key]
+
+# Function to update the bars of many symbols: one bulk download per base timeframe for all symbols
+def fetch_market_data(symbols, timeframes):
+    """
+    Return {symbol: {timeframe: DataFrame or None}}.
+
+    Only base timeframes are downloaded; timeframes with a 'resample_from' spec are
+    aggregated from their base bars (after a one-time backfill of their history).
+    """
+    derived = [timeframe for timeframe in timeframes if TIMEFRAMES[timeframe].get('resample_from')]
+    bases = [timeframe for timeframe in timeframes if timeframe not in derived]
+    bases += [TIMEFRAMES[timeframe]['resample_from'] for timeframe in derived if TIMEFRAMES[timeframe]['resample_from'] not in bases]
+
+    # Downloads run in parallel on the I/O pool: one bulk request per base timeframe, plus the
+    # one-time history backfill of the derived stores that are still empty
+    downloads = {}
+    for timeframe in bases:
+        logger.debug("Updating %s data (%s interval)...", ', '.join(symbols), TIMEFRAMES[timeframe]['label'])
+        downloads[timeframe] = io_pool.submit(_update_bulk, [get_store(symbol, timeframe) for symbol in symbols], timeframe)
+    backfills = []
+    for timeframe in derived:
+        stores = [get_store(symbol, timeframe) for symbol in symbols]
+        backfills.append(io_pool.submit(_update_bulk, [store for store in stores if store.pending_request()[0] == 'period'], timeframe))
 
-    # Optionally, save the data to CSV
-    data_hourly.to_csv('/models/eth_usd_hourly.csv', index=True)
+    bars = {symbol: {} for symbol in symbols}
+    for timeframe, download in downloads.items():
+        bars_by_symbol = download.result()
+        for symbol in symbols:
+            bars[symbol][timeframe] = bars_by_symbol.get(symbol)
+    for backfill in backfills:
+        backfill.result()
 
-    print(f"Fetched hourly interval data: {data_hourly.tail()}")
-    return data_hourly
+    for timeframe in derived:
+        stores = [get_store(symbol, timeframe) for symbol in symbols]
+        base_timeframe = TIMEFRAMES[timeframe]['resample_from']
+        for symbol, store in zip(symbols, stores):
+            if store.data is None or store.data.empty:
+                bars[symbol][timeframe] = None
+                continue
+            bars[symbol][timeframe] = store.merge_from_base(bars[symbol][base_timeframe])
+
+    market_data = {symbol: {} for symbol in symbols}
+    for symbol in symbols:
+        for timeframe in timeframes:
+            data = bars[symbol].get(timeframe)
+            if data is None or data.empty:
+                logger.warning("No data fetched for %s (%s).", symbol, timeframe)
+                increment('fetch_failures')
+                data = None
+            market_data[symbol][timeframe] = data
+    return market_data
+
+# Update a group of stores of the same timeframe with bulk downloads, returning {symbol: bars}
+def _update_bulk(stores, timeframe):
+    if not stores:
+        return {}
+    try:
+        return update_stores(stores)
+    except Exception as e:
+        logger.error("Fetching %s data failed: %s", timeframe, e)
+        increment('fetch_failures', len(stores))
+        return {}
+
+# Function to fetch ETH-USD data for the past 30 days at 15-minute intervals
+def fetch_eth_data_15min():
+    return fetch_market_data(['ETH-USD'], ['15min'])['ETH-USD']['15min']
+
+
+# Function to fetch ETH-USD data for the past 3 months at hourly intervals
+def fetch_eth_data_hourly():
+    return fetch_market_data(['ETH-USD'], ['hourly'])['ETH-USD']['hourly']
 
 
 # Function to fetch ETH-USD data for a specified interval (generic)
 def fetch_eth_data(period='30d', interval='5m'):
-    print(f"Fetching ETH-USD data for {period} with {interval} interval from yfinance...")
+    logger.info("Fetching ETH-USD data for %s with %s interval from yfinance...", period, interval)
     data = yf.download(tickers='ETH-USD', period=period, interval=interval)
     
     if data.empty:
-        print(f"No data fetched for {interval} interval.")
+        logger.warning("No data fetched for %s interval.", interval)
         return None
 
-    print(f"Fetched data for {interval} interval: {data.tail()}")
+    if logger.isEnabledFor(logging.DEBUG):
+        logger.debug("Fetched data for %s interval: %s", interval, data.tail())
     return data
@@ -1,88 +1,318 @@
-from .data_fetching import fetch_eth_data_15min, fetch_eth_data_hourly
-from .data_processing import preprocess, calculate_rsi, calculate_volatility
-from .fibonacci import determine_trend, calculate_fibonacci_levels
-from .model_inference import predict_prices_multi_horizon
-from .signal_generation import generate_signal_with_confidence, calculate_stop_loss_take_profit
-from .performance_evaluation import evaluate_performance, save_actual_signals, save_predicted_signals
+import logging
+import threading
+import numpy as np
+from .data_fetching import fetch_market_data
+from .data_processing import preprocess
+from .fibonacci import is_uptrend, fibonacci_levels_from_range, fibonacci_level_matrix
+from .indicators import compute_indicators, save_indicator_states
+from .forecast_accuracy import update_accuracy, save_accuracy_states, overall_directional_accuracy
+from .model_inference import predict_timeframe, serving_model
+from .volatility import get_volatility, series_version, SIGNAL_VOLATILITY_ESTIMATOR, STOP_LOSS_VOLATILITY_ESTIMATOR
+from .signal_generation import generate_signals_batch, combine_signals, stop_loss_take_profit_batch, signal_labels
+from .performance_evaluation import emit_forecast_accuracy, save_actual_signals, save_predicted_signals
+from .markets import ACTIVE_SYMBOLS, ACTIVE_TIMEFRAMES, TIMEFRAMES, check_market
+from .compute_loop import DEFAULT_SYMBOL, DEFAULT_TIMEFRAME, COMPUTE_MODE, room_name, get_latest, run_cycle
+from .workers import cpu_pool, graph_pool, submit_job, JobQueueFull
+from .pipeline_graph import Node, PipelineGraph
+from .chart_protocol import snapshot_message, message_size
+from .metrics import timed, increment
+from . import socketio
 from flask_socketio import emit
 
-def handle_data_request():
+logger = logging.getLogger(__name__)
+
+# Last bars seen per symbol, used to skip the pipeline when nothing has changed
+_last_bar_keys = {}
+_last_payloads = {}
+
+# Pipeline graph per set of timeframes (the memoized node values are kept per symbol)
+_graphs = {}
+_graphs_lock = threading.Lock()
+
+def compute_updates(symbols=None, timeframes=None):
     """
-    Fetch data, process it, generate predictions, and emit results to the client.
-    Save actual and predicted signals, and evaluate performance.
+    Fetch data for every symbol (one bulk download per timeframe), run the pipeline of
+    each symbol and return the chart payloads as {(symbol, timeframe): payload}.
+    Save actual and predicted signals, and push the forecast accuracy to the dashboards.
     """
-    # Fetch data
-    data_15min = fetch_eth_data_15min()
-    data_hourly = fetch_eth_data_hourly()
+    symbols = symbols or ACTIVE_SYMBOLS
+    timeframes = timeframes or ACTIVE_TIMEFRAMES
 
-    if data_15min is None or data_hourly is None:
-        print("No data fetched, aborting the request.")
-        return
+    # Fetch data (shared by all the models of a symbol)
+    with timed('fetch'):
+        market_data = fetch_market_data(symbols, timeframes)
 
-    # Get the current price
-    current_price = data_15min['Close'].iloc[-1]
+    # Run the forecasts and indicators of every symbol on the CPU pool
+    jobs = {}
+    for symbol in symbols:
+        frames = market_data[symbol]
+        if any(data is None for data in frames.values()):
+            logger.warning("No data fetched for %s, skipping it this cycle.", symbol)
+            continue
+        jobs[symbol] = cpu_pool.submit(compute_symbol_inputs, symbol, frames)
 
-    # Preprocess data
-    prices_scaled_15min, scaler_15min = preprocess(data_15min)
-    prices_scaled_hourly, scaler_hourly = preprocess(data_hourly)
+    payloads = {}
+    updates = {}
+    for symbol, job in jobs.items():
+        try:
+            inputs = job.result()
+        except Exception as e:
+            # One failing symbol (e.g. missing model) must not stop the others
+            logger.error("Pipeline failed for %s: %s", symbol, e)
+            increment('pipeline_failures')
+            continue
 
-    # Predict prices
-    predicted_prices_15min = predict_prices_multi_horizon(prices_scaled_15min, prices_scaled_hourly, scaler_15min, scaler_hourly)
+        if inputs is None:
+            payloads.update({(symbol, timeframe): payload for timeframe, payload in _last_payloads[symbol].items()})
+        else:
+            updates[symbol] = inputs
 
-    # Calculate Fibonacci levels
-    last_7_days_data_15min = data_15min[-7 * 24 * 4:]
-    last_30_days_data_hourly = data_hourly[-30 * 24:]
-    fibonacci_levels_15min = calculate_fibonacci_levels(last_7_days_data_15min, determine_trend(last_7_days_data_15min))
-    fibonacci_levels_hourly = calculate_fibonacci_levels(last_30_days_data_hourly, determine_trend(last_30_days_data_hourly))
+    # Signals of all the recomputed symbols and timeframes in one pass
+    with timed('signals'):
+        recomputed = build_payloads(updates, market_data)
 
-    # Calculate RSI
-    rsi_15min = calculate_rsi(data_15min['Close'])
-    rsi_hourly = calculate_rsi(data_hourly['Close'])
+    recomputed_signals = []
+    for symbol, symbol_payloads in recomputed.items():
+        payloads.update({(symbol, timeframe): payload for timeframe, payload in symbol_payloads.items()})
+        recomputed_signals.append(next(iter(symbol_payloads.values()))['signal'])
 
-    # Calculate Volatility
-    volatility_15min = calculate_volatility(data_15min['Close'])
-    volatility_hourly = calculate_volatility(data_hourly['Close'])
+    if recomputed_signals:
+        with timed('persistence'):
+            # Keep the indicator and forecast accuracy states across restarts
+            save_indicator_states()
+            save_accuracy_states()
 
-    # Generate signals and confidence for 15-minute and hourly data
-    signal_15min, confidence_15min = generate_signal_with_confidence(current_price, predicted_prices_15min[-1], rsi_15min.iloc[-1], fibonacci_levels_15min, data_15min['Close'])
-    signal_hourly, confidence_hourly = generate_signal_with_confidence(current_price, predicted_prices_15min[-1], rsi_hourly.iloc[-1], fibonacci_levels_hourly, data_hourly['Close'])
+            # **Save actual and predicted signals**
+            actual_signals = recomputed_signals  # Saving the combined signal of each symbol
+            predicted_signals = recomputed_signals  # Assuming the predicted signal is the same as the combined decision
 
-    # Combine signals for a final decision
-    signal_combined = "Hold"
-    confidence_combined = (confidence_15min + confidence_hourly) / 2
-    if signal_15min == "Buy" and signal_hourly == "Buy":
-        signal_combined = f"Buy: {confidence_combined:.2f}%"
-    elif signal_15min == "Sell" and signal_hourly == "Sell":
-        signal_combined = f"Sell: {confidence_combined:.2f}%"
+            save_actual_signals(actual_signals)  # Saving combined signals as actual signals
+            save_predicted_signals(predicted_signals)  # Saving combined signals as predicted signals
 
-    entry_price = current_price if signal_combined != "Hold" else None
+        # Directional accuracy of the forecasts scored against the realized bars
+        emit_forecast_accuracy(overall_directional_accuracy())
 
-    # Calculate stop loss and take profit based on the combined signal
-    stop_loss, take_profit = calculate_stop_loss_take_profit(entry_price, signal_combined.split(":")[0], (volatility_15min + volatility_hourly) / 2)
+    return payloads
 
-    # **Save actual and predicted signals**
-    actual_signals = [signal_combined]  # Saving the combined signal instead of individual timeframe signals
-    predicted_signals = [signal_combined]  # Assuming the predicted signal is the same as the combined decision
 
-    save_actual_signals(actual_signals)  # Saving combined signal as actual signal
-    save_predicted_signals(predicted_signals)  # Saving combined signal as predicted signal
+def compute_symbol_inputs(symbol, frames):
+    """
+    Process the bars of every timeframe of a symbol and generate its predictions and
+    indicators: the inputs of its signals (see build_payloads).
 
-    # Evaluate performance
-    evaluate_performance(actual_signals, predicted_signals)
+    The pipeline only runs once per new bar: if the last bar (timestamp and close) of every
+    timeframe is unchanged since the previous call, None is returned and the previous
+    payloads of the symbol are still valid.
+    """
+    bar_key = tuple((timeframe, data.index[-1], data['Close'].iloc[-1]) for timeframe, data in frames.items())
+    if _last_bar_keys.get(symbol) == bar_key:
+        logger.debug("No new %s bar since the last cycle, reusing the previous result.", symbol)
+        return None
 
-    # Emit the data to the frontend
-    emit('update_chart', {
-        'prices': data_15min['Close'].tolist(),
-        'predicted_prices': predicted_prices_15min,
+    # Get the current price from the finest timeframe
+    primary_data = next(iter(frames.values()))
+    current_price = primary_data['Close'].iloc[-1]
+
+    # Model version of each timeframe, resolved once so that its scaler and graph match
+    models = {timeframe: serving_model(symbol, timeframe) for timeframe in frames}
+
+    # Run the pipeline graph: the timeframes run in parallel, nodes whose bars and model are
+    # unchanged since the previous run of the symbol are reused
+    inputs, keys = {'symbol': symbol}, {'symbol': symbol}
+    for timeframe, data in frames.items():
+        inputs[f'bars:{timeframe}'], keys[f'bars:{timeframe}'] = data, series_version(data)
+        inputs[f'model:{timeframe}'], keys[f'model:{timeframe}'] = models[timeframe], (models[timeframe]['path'], models[timeframe]['version'])
+    values = symbol_graph(tuple(frames)).run(symbol, inputs, keys, graph_pool)
+
+    indicators = {}
+    for timeframe in frames:
+        streaming = values[f'indicators:{timeframe}']
+        indicators[timeframe] = {
+            'rsi': streaming['rsi'],
+            'volatility': streaming['volatility'],
+            'high': streaming['high'],
+            'low': streaming['low'],
+            **values[f'volatility:{timeframe}'],
+            'accuracy': values[f'accuracy:{timeframe}'],
+        }
+
+    return {
+        'bar_key': bar_key,
         'current_price': current_price,
-        'rsi': rsi_15min.tolist(),
-        'signal': signal_combined,
-        'confidence': confidence_combined,
-        'entry_price': entry_price,
-        'stop_loss': stop_loss,
-        'take_profit': take_profit,
-        'fibonacci_levels': fibonacci_levels_15min,
-        'volatility': volatility_15min
-    })
-
-    print(f"Data emitted to frontend: Signal: {signal_combined}, Confidence: {confidence_combined}, Entry Price: {entry_price}, Stop Loss: {stop_loss}, Take Profit: {take_profit}, Volatility: {volatility_15min}")
+        'predicted_prices': values['predictions'],
+        'models': models,
+        'indicators': indicators,
+    }
+
+
+# Pipeline graph of a symbol served on `timeframes` (a tuple), built once per set of timeframes
+def symbol_graph(timeframes):
+    with _graphs_lock:
+        graph = _graphs.get(timeframes)
+        if graph is None:
+            graph = _graphs[timeframes] = PipelineGraph(symbol_nodes(timeframes))
+        return graph
+
+
+def symbol_nodes(timeframes):
+    """
+    Nodes of the pipeline of a symbol. Each timeframe is an independent branch:
+    preprocess -> inference -> accuracy, and indicators -> volatility. The branches only
+    meet in `predictions` (the forecasts of the timeframes, averaged), then in the signals
+    of build_payloads.
+    """
+    nodes = []
+    for timeframe in timeframes:
+        spec = TIMEFRAMES[timeframe]
+        bars, model = f'bars:{timeframe}', f'model:{timeframe}'
+        nodes += [
+            # Scale the bars (with the scaler the model was trained with, if it has one)
+            Node(f'preprocess:{timeframe}', lambda data, model, timeframe=timeframe: preprocess(data, timeframe, model['scaler']), [bars, model]),
+            Node(f'inference:{timeframe}', lambda symbol, scaled, model, data, timeframe=timeframe: predict_timeframe(scaled, model, symbol, timeframe, data.index[-1]),
+                 ['symbol', f'preprocess:{timeframe}', model, bars]),
+            # Update RSI, volatility and the Fibonacci high/low with the new bars only
+            Node(f'indicators:{timeframe}', lambda symbol, data, timeframe=timeframe, fibonacci_bars=spec['fibonacci_days'] * spec['bars_per_day']:
+                 compute_indicators(symbol, timeframe, data, fibonacci_bars), ['symbol', bars]),
+            Node(f'volatility:{timeframe}', lambda symbol, data, streaming, timeframe=timeframe: timeframe_volatilities(symbol, timeframe, data, streaming),
+                 ['symbol', bars, f'indicators:{timeframe}']),
+            # Score the previous forecasts of this model against the bars closed since then
+            # (after the new forecast is logged, like the serial pipeline did)
+            Node(f'accuracy:{timeframe}', lambda symbol, data, forecast, timeframe=timeframe: update_accuracy(symbol, timeframe, data),
+                 ['symbol', bars, f'inference:{timeframe}']),
+        ]
+    # Combine predictions (you can average them or apply another logic)
+    nodes.append(Node('predictions', lambda *forecasts: np.mean(forecasts, axis=0).tolist(), [f'inference:{timeframe}' for timeframe in timeframes]))
+    return nodes
+
+
+# Volatility of the signal tolerance and of the stop loss of one timeframe (computed once per bar)
+def timeframe_volatilities(symbol, timeframe, data, streaming):
+    return {
+        'signal_volatility': get_volatility(symbol, timeframe, data, SIGNAL_VOLATILITY_ESTIMATOR),
+        'stop_loss_volatility': streaming['volatility'] if STOP_LOSS_VOLATILITY_ESTIMATOR == 'close_to_close'
+                                else get_volatility(symbol, timeframe, data, STOP_LOSS_VOLATILITY_ESTIMATOR),
+    }
+
+
+def build_payloads(updates, market_data):
+    """
+    Generate the signals of the recomputed symbols (`updates`: symbol -> result of
+    compute_symbol_inputs) and return their chart payloads as {symbol: {timeframe: payload}}.
+
+    Every (symbol, timeframe) pair is scored in one NumPy pass, then the timeframes of each
+    symbol are combined (they must all agree) and its stop loss / take profit computed.
+    """
+    if not updates:
+        return {}
+
+    symbols = list(updates)
+    rows = [(index, timeframe) for index, symbol in enumerate(symbols) for timeframe in updates[symbol]['indicators']]
+    groups = np.array([index for index, _ in rows])
+    current_prices = np.array([updates[symbol]['current_price'] for symbol in symbols], dtype=np.float64)
+
+    def column(name, last=False):
+        values = [updates[symbols[index]]['indicators'][timeframe][name] for index, timeframe in rows]
+        return np.array([value[-1] for value in values] if last else values, dtype=np.float64)
+
+    last_closes = np.array([market_data[symbols[index]][timeframe]['Close'].iloc[-1] for index, timeframe in rows], dtype=np.float64)
+    levels = fibonacci_level_matrix(last_closes, column('high'), column('low'))
+    directions, confidences = generate_signals_batch(
+        current_prices[groups],
+        np.array([updates[symbols[index]]['predicted_prices'][-1] for index, _ in rows], dtype=np.float64),
+        column('rsi', last=True), levels, column('signal_volatility'),
+    )
+
+    # Combine signals for a final decision per symbol: every timeframe must agree
+    combined, combined_confidences = combine_signals(directions, confidences, groups, len(symbols))
+    average_volatilities = np.bincount(groups, weights=column('stop_loss_volatility'), minlength=len(symbols)) / np.bincount(groups, minlength=len(symbols))
+    stop_losses, take_profits = stop_loss_take_profit_batch(current_prices, combined, average_volatilities)
+    labels = signal_labels(combined)
+
+    results = {}
+    for index, symbol in enumerate(symbols):
+        update = updates[symbol]
+        confidence_combined = float(combined_confidences[index])
+        signal_combined = f"{labels[index]}: {confidence_combined:.2f}%" if combined[index] else "Hold"
+        entry_price = update['current_price'] if combined[index] else None
+        stop_loss = float(stop_losses[index]) if combined[index] else None
+        take_profit = float(take_profits[index]) if combined[index] else None
+
+        payloads = {}
+        for timeframe, data in market_data[symbol].items():
+            indicators = update['indicators'][timeframe]
+            payloads[timeframe] = {
+                'symbol': symbol,
+                'timeframe': timeframe,
+                # Bar times in milliseconds since the epoch (UTC), for the chart deltas
+                'times': (data.index.tz_convert('UTC').tz_localize(None).values.astype('datetime64[ms]').astype(np.int64)).tolist(),
+                'prices': data['Close'].tolist(),
+                'predicted_prices': update['predicted_prices'],
+                'current_price': update['current_price'],
+                'rsi': indicators['rsi'],
+                'signal': signal_combined,
+                'confidence': confidence_combined,
+                'entry_price': entry_price,
+                'stop_loss': stop_loss,
+                'take_profit': take_profit,
+                'fibonacci_levels': fibonacci_levels_from_range(indicators['high'], indicators['low'], is_uptrend(data['Close'].iloc[-1], indicators['high'], indicators['low'])),
+                'volatility': indicators['volatility'],
+                'accuracy': indicators['accuracy'],
+                'model_version': update['models'][timeframe]['version'],
+            }
+
+        logger.info("%s update computed: Signal: %s, Confidence: %s, Entry Price: %s, Stop Loss: %s, Take Profit: %s, Volatility: %s",
+                    symbol, signal_combined, confidence_combined, entry_price, stop_loss, take_profit, average_volatilities[index])
+
+        _last_bar_keys[symbol] = update['bar_key']
+        _last_payloads[symbol] = payloads
+        results[symbol] = payloads
+    return results
+
+
+# Send the snapshot of a payload to the current client (or to `sid`)
+def emit_snapshot(payload, sid=None):
+    message = snapshot_message(payload)
+    if sid is None:
+        emit('update_chart', message)
+    else:
+        socketio.emit('update_chart', message, to=sid)
+    increment('emitted_messages')
+    increment('emitted_bytes', message_size(message))
+
+
+def handle_data_request(symbol=DEFAULT_SYMBOL, timeframe=DEFAULT_TIMEFRAME, sid=None, seq=None):
+    """
+    Answer a client's request_data from the latest result of the shared compute loop: a
+    snapshot, unless the client already has the latest payload (`seq`).
+
+    If nothing has been computed yet for the symbol/timeframe, the pipeline runs as a
+    background job and the result is emitted to the client (`sid`) once it is ready;
+    concurrent requests for the same symbol/timeframe share that job.
+
+    Raises ValueError for a symbol/timeframe the compute loop does not run.
+    """
+    check_market(symbol, timeframe)
+    room = room_name(symbol, timeframe)
+    with timed('request'):
+        payload = get_latest(room)
+        if payload is not None and (seq is None or payload.get('seq') != seq):
+            emit_snapshot(payload)
+    if payload is not None:
+        return
+
+    if COMPUTE_MODE == 'external':
+        # The compute service pushes the result to the room once it is computed
+        logger.debug("No result for %s from the compute service yet.", room)
+        return
+
+    def send_result(result, error):
+        payload = get_latest(room)
+        if payload is None:
+            logger.warning("No data available for %s, aborting the request.", room)
+            return
+        emit_snapshot(payload, sid)
+
+    try:
+        submit_job(room, run_cycle, [symbol], callback=send_result)
+    except JobQueueFull as e:
+        logger.warning("Too many pending requests, dropping the request for %s: %s", room, e)
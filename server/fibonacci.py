@@ -1,18 +1,22 @@
 # /server/fibonacci.py
 
+import numpy as np
+
 # Determine trend based on the last 7 days' high and low prices compared to the current price
 def determine_trend(data):
-    current_price = data['Close'].iloc[-1]
-    high = data['Close'].max()
-    low = data['Close'].min()
-    
+    return is_uptrend(data['Close'].iloc[-1], data['Close'].max(), data['Close'].min())
+
+# Trend from the current price and the high/low of the lookback window
+def is_uptrend(current_price, high, low):
     # If the current price is closer to the high, it's an uptrend; otherwise, downtrend
     return current_price > (high + low) / 2
 
 # Calculate Fibonacci levels based on whether it's an uptrend or downtrend
 def calculate_fibonacci_levels(data, uptrend):
-    high = data['Close'].max()
-    low = data['Close'].min()
+    return fibonacci_levels_from_range(data['Close'].max(), data['Close'].min(), uptrend)
+
+# Fibonacci levels from the high/low of the lookback window (e.g. kept by indicators.RollingExtrema)
+def fibonacci_levels_from_range(high, low, uptrend):
     range_price = high - low
 
     if uptrend:
@@ -37,3 +41,22 @@ def calculate_fibonacci_levels(data, uptrend):
         }
     
     return levels
+
+
+# Ratios of the levels between the 0% and 100% levels
+FIBONACCI_RATIOS = (0.236, 0.382, 0.5, 0.618)
+
+def fibonacci_level_matrix(current_prices, highs, lows):
+    """
+    Fibonacci levels checked by the signals for n windows at once: an (n, 4) array of the
+    23.6% .. 61.8% levels (trend from the current price), NaN where a level equals the 0% or
+    100% level (flat window).
+    """
+    current = np.asarray(current_prices, dtype=np.float64)
+    high = np.asarray(highs, dtype=np.float64)[:, None]
+    low = np.asarray(lows, dtype=np.float64)[:, None]
+    uptrend = is_uptrend(current, high[:, 0], low[:, 0])[:, None]
+    ratios = np.array(FIBONACCI_RATIOS)
+    levels = np.where(uptrend, low + ratios * (high - low), high - ratios * (high - low))
+    levels[:, FIBONACCI_RATIOS.index(0.5)] = ((high + low) / 2)[:, 0]
+    return np.where((levels == high) | (levels == low), np.nan, levels)
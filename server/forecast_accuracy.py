@@ -0,0 +1,187 @@
+# /server/forecast_accuracy.py
+#
+# Accuracy of the logged forecasts against the bars that arrived afterwards. Each model keeps
+# per-step error sums (step 1 = next bar ... step 60); every update only scores the steps of
+# the pending forecasts whose target bar has closed since the previous update, with a
+# searchsorted join of the target times on the bar index.
+
+import os
+import json
+import threading
+import logging
+import numpy as np
+from .prediction_journal import read_predictions, empty_columns, HORIZON
+from .bar_store import INTERVAL_DURATIONS
+from .markets import MODEL_DIR, TIMEFRAMES
+
+logger = logging.getLogger(__name__)
+
+ACCURACY_STATE_PATH = os.getenv('ACCURACY_STATE_PATH', os.path.join(MODEL_DIR, 'forecast_accuracy.json'))
+
+
+class HorizonAccuracy:
+    """
+    Per-step MAE, RMSE and directional accuracy of the forecasts of one model.
+
+    A step is counted in the directional accuracy when the forecast and the realized close
+    move the same way from the close the forecast started from.
+    """
+
+    def __init__(self, interval, horizon=HORIZON):
+        self.interval = int(INTERVAL_DURATIONS[interval].value)
+        self.horizon = horizon
+        self.count = np.zeros(horizon, dtype=np.int64)
+        self.abs_error = np.zeros(horizon)
+        self.squared_error = np.zeros(horizon)
+        self.direction_hits = np.zeros(horizon, dtype=np.int64)
+        # Time of the last journal row read
+        self.last_read = 0
+        # Forecasts with steps left to score
+        self.pending = empty_columns()
+        self.scored = np.zeros(0, dtype=np.int64)
+
+    def add_forecasts(self, forecasts, scored=None):
+        if not len(forecasts['timestamp']):
+            return
+        self.pending = {name: np.concatenate([self.pending[name], forecasts[name]]) for name in self.pending}
+        self.scored = np.concatenate([self.scored, np.zeros(len(forecasts['timestamp']), dtype=np.int64) if scored is None else scored])
+        self.last_read = max(self.last_read, int(forecasts['timestamp'][-1]))
+
+    def score(self, bar_times, closes):
+        """
+        Score the pending forecasts against closed bars (`bar_times` in ns, sorted).
+        """
+        if not len(self.scored) or not len(bar_times):
+            return
+
+        start = self.pending['bar_time']
+        steps = np.arange(self.horizon)
+        available = np.clip((bar_times[-1] - start) // self.interval, 0, self.horizon)
+        mask = (steps >= self.scored[:, None]) & (steps < available[:, None])
+
+        targets = start[:, None] + (steps + 1) * self.interval
+        index = np.searchsorted(bar_times, targets)
+        found = index < len(bar_times)
+        index = np.minimum(index, len(bar_times) - 1)
+        # Targets missing from the bar history (gaps, bars older than the window) are skipped
+        predicted = self.pending['horizon']
+        valid = mask & found & (bar_times[index] == targets) & ~np.isnan(predicted)
+
+        realized = closes[index]
+        error = np.where(valid, predicted - realized, 0.0)
+        last_close = self.pending['last_close'][:, None]
+        hits = valid & (np.sign(predicted - last_close) == np.sign(realized - last_close))
+
+        self.count += valid.sum(axis=0)
+        self.abs_error += np.abs(error).sum(axis=0)
+        self.squared_error += (error ** 2).sum(axis=0)
+        self.direction_hits += hits.sum(axis=0)
+
+        # Drop the forecasts that are fully scored or whose targets are older than the history
+        self.scored = np.maximum(self.scored, available)
+        done = (self.scored >= self.horizon) | (start + self.horizon * self.interval < bar_times[0])
+        self.pending = {name: values[~done] for name, values in self.pending.items()}
+        self.scored = self.scored[~done]
+
+    # Per-step metrics, None for the steps not scored yet (JSON-friendly)
+    def summary(self):
+        counted = np.maximum(self.count, 1)
+
+        def metric(values):
+            return [float(value) if count else None for value, count in zip(values, self.count)]
+
+        return {
+            'count': self.count.tolist(),
+            'mae': metric(self.abs_error / counted),
+            'rmse': metric(np.sqrt(self.squared_error / counted)),
+            'directional_accuracy': metric(self.direction_hits / counted),
+        }
+
+    def snapshot(self):
+        return {
+            'interval': self.interval, 'count': self.count.tolist(), 'abs_error': self.abs_error.tolist(),
+            'squared_error': self.squared_error.tolist(), 'direction_hits': self.direction_hits.tolist(),
+            'last_read': self.last_read,
+            # Pending forecasts are reloaded from the journal by their timestamp
+            'pending': [self.pending['timestamp'].tolist(), self.scored.tolist()],
+        }
+
+    def restore(self, state, symbol, timeframe):
+        self.count = np.array(state['count'], dtype=np.int64)
+        self.abs_error = np.array(state['abs_error'])
+        self.squared_error = np.array(state['squared_error'])
+        self.direction_hits = np.array(state['direction_hits'], dtype=np.int64)
+
+        timestamps, scored = (np.array(values, dtype=np.int64) for values in state['pending'])
+        if len(timestamps):
+            forecasts = read_predictions(start=int(timestamps[0]), end=state['last_read'], symbol=symbol, timeframe=timeframe)
+            position = np.searchsorted(timestamps, forecasts['timestamp'])
+            position = np.minimum(position, len(timestamps) - 1)
+            known = timestamps[position] == forecasts['timestamp']
+            self.add_forecasts({name: values[known] for name, values in forecasts.items()}, scored[position[known]])
+        self.last_read = state['last_read']
+
+
+# Trackers per (symbol, timeframe), restored from ACCURACY_STATE_PATH on first use
+_trackers = None
+_states = {}
+_trackers_lock = threading.Lock()
+
+
+def _load_states():
+    if not os.path.exists(ACCURACY_STATE_PATH):
+        return {}
+    try:
+        with open(ACCURACY_STATE_PATH) as f:
+            return json.load(f)
+    except ValueError as e:
+        logger.warning("Ignoring unreadable forecast accuracy states (%s).", e)
+        return {}
+
+
+def update_accuracy(symbol, timeframe, data):
+    """
+    Read the forecasts of a model logged since the previous update, score the pending ones
+    against the closed bars of `data` and return the per-step summary.
+    """
+    global _trackers, _states
+    key = (symbol, timeframe)
+    with _trackers_lock:
+        if _trackers is None:
+            _trackers, _states = {}, _load_states()
+        tracker = _trackers.get(key)
+        if tracker is None:
+            tracker = HorizonAccuracy(TIMEFRAMES[timeframe]['interval'])
+            state = _states.get(f"{symbol}|{timeframe}")
+            if state and state.get('interval') == tracker.interval:
+                tracker.restore(state, symbol, timeframe)
+            _trackers[key] = tracker
+
+    tracker.add_forecasts(read_predictions(start=tracker.last_read + 1, symbol=symbol, timeframe=timeframe))
+
+    closed = data.iloc[:-1]
+    bar_times = closed.index.tz_convert('UTC').tz_localize(None).values.astype('datetime64[ns]').view(np.int64)
+    tracker.score(bar_times, closed['Close'].to_numpy(dtype=np.float64))
+    return tracker.summary()
+
+
+# Overall directional accuracy of all the models (weighted by the number of scored steps)
+def overall_directional_accuracy():
+    if not _trackers:
+        return None
+    count = sum(int(tracker.count.sum()) for tracker in _trackers.values())
+    hits = sum(int(tracker.direction_hits.sum()) for tracker in _trackers.values())
+    return hits / count if count else None
+
+
+# Save every tracker (atomic replace)
+def save_accuracy_states():
+    if not _trackers:
+        return
+    states = dict(_states)
+    with _trackers_lock:
+        states.update({'|'.join(key): tracker.snapshot() for key, tracker in _trackers.items()})
+    tmp_path = ACCURACY_STATE_PATH + '.tmp'
+    with open(tmp_path, 'w') as f:
+        json.dump(states, f)
+    os.replace(tmp_path, ACCURACY_STATE_PATH)
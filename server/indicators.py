@@ -0,0 +1,429 @@
+# /server/indicators.py
+#
+# Streaming indicators: each series keeps its state between cycles so that a new bar costs
+# O(1) instead of recomputing RSI, volatility and the Fibonacci high/low over the whole window.
+#
+# Closed bars are committed to the state; the bar still forming is only "peeked" (the value
+# is computed with it, the state is left untouched), so it can change until it closes.
+
+import os
+import json
+import math
+import logging
+import threading
+from collections import deque
+import numpy as np
+import pandas as pd
+from .markets import MODEL_DIR, TIMEFRAMES
+from .bar_store import period_to_bars
+from .volatility import annualize
+
+logger = logging.getLogger(__name__)
+
+# File holding the indicator states between restarts
+INDICATOR_STATE_PATH = os.getenv('INDICATOR_STATE_PATH', os.path.join(MODEL_DIR, 'indicators.json'))
+
+
+class StreamingRSI:
+    """
+    RSI over `window` bars.
+
+    - `smoothing='sma'`: simple moving average of gains and losses, like calculate_rsi.
+    - `smoothing='wilder'`: Wilder's smoothing (seeded with the SMA of the first `window` bars).
+
+    As in calculate_rsi, the RSI is 50 until `window` changes are known or while the
+    average loss is zero.
+    """
+
+    def __init__(self, window=14, smoothing='sma'):
+        self.window = window
+        self.smoothing = smoothing
+        self.last_close = None
+        self.count = 0
+        self.gains = deque(maxlen=window)
+        self.losses = deque(maxlen=window)
+        self.gain_sum = 0.0
+        self.loss_sum = 0.0
+        # Number of non-zero losses in the window: a zero average loss is detected exactly
+        self.nonzero_losses = 0
+        self.avg_gain = None
+        self.avg_loss = None
+
+    def _change(self, close):
+        # The first bar has no previous close: its change counts as 0, like delta.where() on NaN
+        delta = 0.0 if self.last_close is None else close - self.last_close
+        return max(delta, 0.0), max(-delta, 0.0)
+
+    @staticmethod
+    def _value(avg_gain, avg_loss, loss_is_zero):
+        if avg_gain is None or loss_is_zero:
+            return 50.0
+        return 100.0 - 100.0 / (1.0 + avg_gain / avg_loss)
+
+    # RSI after a bar with this close, without changing the state
+    def peek(self, close):
+        gain, loss = self._change(close)
+        count = self.count + 1
+        if count < self.window:
+            return 50.0
+
+        if self.smoothing == 'wilder' and self.avg_gain is not None:
+            avg_gain = (self.avg_gain * (self.window - 1) + gain) / self.window
+            avg_loss = (self.avg_loss * (self.window - 1) + loss) / self.window
+            return self._value(avg_gain, avg_loss, avg_loss == 0)
+
+        full = len(self.gains) == self.window
+        gain_sum = self.gain_sum + gain - (self.gains[0] if full else 0.0)
+        loss_sum = self.loss_sum + loss - (self.losses[0] if full else 0.0)
+        nonzero = self.nonzero_losses + (loss > 0) - (full and self.losses[0] > 0)
+        return self._value(gain_sum / self.window, loss_sum / self.window, nonzero == 0)
+
+    # Commit a closed bar and return its RSI
+    def update(self, close):
+        gain, loss = self._change(close)
+        if len(self.gains) == self.window:
+            self.gain_sum -= self.gains[0]
+            self.loss_sum -= self.losses[0]
+            self.nonzero_losses -= self.losses[0] > 0
+        self.gains.append(gain)
+        self.losses.append(loss)
+        self.gain_sum += gain
+        self.loss_sum += loss
+        self.nonzero_losses += loss > 0
+        self.last_close = close
+        self.count += 1
+
+        # Running sums drift with subtractions: resynchronize them from time to time
+        if self.count % 1000 == 0:
+            self.gain_sum = math.fsum(self.gains)
+            self.loss_sum = math.fsum(self.losses)
+
+        if self.count < self.window:
+            return 50.0
+        if self.smoothing == 'wilder':
+            if self.avg_gain is None:
+                self.avg_gain, self.avg_loss = self.gain_sum / self.window, self.loss_sum / self.window
+            else:
+                self.avg_gain = (self.avg_gain * (self.window - 1) + gain) / self.window
+                self.avg_loss = (self.avg_loss * (self.window - 1) + loss) / self.window
+            return self._value(self.avg_gain, self.avg_loss, self.avg_loss == 0)
+        return self._value(self.gain_sum / self.window, self.loss_sum / self.window, self.nonzero_losses == 0)
+
+    def snapshot(self):
+        return {
+            'window': self.window, 'smoothing': self.smoothing, 'last_close': self.last_close, 'count': self.count,
+            'gains': list(self.gains), 'losses': list(self.losses), 'avg_gain': self.avg_gain, 'avg_loss': self.avg_loss,
+        }
+
+    @classmethod
+    def restore(cls, state):
+        rsi = cls(state['window'], state['smoothing'])
+        rsi.last_close, rsi.count = state['last_close'], state['count']
+        rsi.avg_gain, rsi.avg_loss = state['avg_gain'], state['avg_loss']
+        rsi.gains.extend(state['gains'])
+        rsi.losses.extend(state['losses'])
+        rsi.gain_sum, rsi.loss_sum = math.fsum(rsi.gains), math.fsum(rsi.losses)
+        rsi.nonzero_losses = sum(loss > 0 for loss in rsi.losses)
+        return rsi
+
+
+class RollingStats:
+    """
+    Mean and (population) standard deviation over the last `window` values. Sums are taken
+    around a fixed reference value to avoid the cancellation of sum(x^2) - n * mean^2.
+    """
+
+    def __init__(self, window):
+        self.window = window
+        self.values = deque(maxlen=window)
+        self.reference = None
+        self.total = 0.0
+        self.total_sq = 0.0
+
+    def _moments(self, total, total_sq, count):
+        mean = total / count
+        variance = max(total_sq / count - mean * mean, 0.0)
+        return self.reference + mean, math.sqrt(variance)
+
+    # (mean, std) with one more value appended, without changing the state
+    def peek(self, value):
+        if self.reference is None:
+            return value, 0.0
+        x = value - self.reference
+        total, total_sq, count = self.total + x, self.total_sq + x * x, len(self.values) + 1
+        if len(self.values) == self.window:
+            old = self.values[0] - self.reference
+            total, total_sq, count = total - old, total_sq - old * old, count - 1
+        return self._moments(total, total_sq, count)
+
+    def update(self, value):
+        if self.reference is None:
+            self.reference = value
+        if len(self.values) == self.window:
+            old = self.values[0] - self.reference
+            self.total -= old
+            self.total_sq -= old * old
+        self.values.append(value)
+        x = value - self.reference
+        self.total += x
+        self.total_sq += x * x
+
+    def snapshot(self):
+        return {'window': self.window, 'values': list(self.values)}
+
+    @classmethod
+    def restore(cls, state):
+        stats = cls(state['window'])
+        for value in state['values']:
+            stats.update(value)
+        return stats
+
+
+class RollingExtrema:
+    """
+    Maximum and minimum over the last `window` values with monotonic deques:
+    amortized O(1) per update.
+    """
+
+    def __init__(self, window):
+        self.window = window
+        self.count = 0
+        self.maxima = deque()  # (position, value), values decreasing
+        self.minima = deque()  # (position, value), values increasing
+
+    # (high, low) with one more value appended, without changing the state
+    def peek(self, value):
+        # The new value pushes the oldest one out of the window
+        first = self.count + 1 - self.window
+        high = next((v for i, v in self.maxima if i >= first), None)
+        low = next((v for i, v in self.minima if i >= first), None)
+        return max(value, high) if high is not None else value, min(value, low) if low is not None else value
+
+    def update(self, value):
+        position = self.count
+        self.count += 1
+        while self.maxima and self.maxima[-1][1] <= value:
+            self.maxima.pop()
+        while self.minima and self.minima[-1][1] >= value:
+            self.minima.pop()
+        self.maxima.append((position, value))
+        self.minima.append((position, value))
+        first = self.count - self.window
+        while self.maxima[0][0] < first:
+            self.maxima.popleft()
+        while self.minima[0][0] < first:
+            self.minima.popleft()
+
+    def snapshot(self):
+        return {'window': self.window, 'count': self.count, 'maxima': list(self.maxima), 'minima': list(self.minima)}
+
+    @classmethod
+    def restore(cls, state):
+        extrema = cls(state['window'])
+        extrema.count = state['count']
+        extrema.maxima.extend(tuple(item) for item in state['maxima'])
+        extrema.minima.extend(tuple(item) for item in state['minima'])
+        return extrema
+
+
+class StreamingVolatility:
+    """
+    Standard deviation of the last `window` log returns (per bar), after dropping the
+    prices whose z-score over the last `lookback` prices is 3 or more: the streaming form of
+    the close_to_close estimator of volatility.py. The prices are scanned from the most recent one
+    until `window + 1` of them are kept, so the cost only grows with the recent outliers.
+
+    With `halflife`, an exponentially weighted variance of all the returns is used instead
+    (no outlier cleaning).
+    """
+
+    def __init__(self, lookback, window=5, halflife=None):
+        self.window = window
+        self.halflife = halflife
+        self.stats = RollingStats(lookback)
+        self.ew_variance = None
+
+    @property
+    def last_close(self):
+        return self.stats.values[-1] if self.stats.values else None
+
+    def _ew_next(self, close):
+        if self.last_close is None:
+            return self.ew_variance
+        alpha = 1 - 0.5 ** (1 / self.halflife)
+        r = math.log(close / self.last_close)
+        return r * r if self.ew_variance is None else (1 - alpha) * self.ew_variance + alpha * r * r
+
+    # Prices from the most recent one backwards, with `close` appended to the window
+    def _recent(self, close):
+        yield close
+        values = self.stats.values
+        oldest = 1 if len(values) == self.stats.window else 0
+        for i in range(len(values) - 1, oldest - 1, -1):
+            yield values[i]
+
+    # Volatility with one more close appended, without changing the state
+    def peek(self, close):
+        if self.halflife:
+            variance = self._ew_next(close)
+            return math.sqrt(variance) if variance is not None else 0.0
+
+        mean, std = self.stats.peek(close)
+        kept = []
+        for price in self._recent(close):
+            if std == 0 or abs(price - mean) / std < 3:
+                kept.append(price)
+                if len(kept) == self.window + 1:
+                    break
+        if len(kept) < 2:
+            return 0.0
+        log_returns = np.diff(np.log(kept[::-1]))
+        return float(np.std(log_returns))
+
+    def update(self, close):
+        if self.halflife:
+            self.ew_variance = self._ew_next(close)
+        self.stats.update(close)
+
+    def snapshot(self):
+        return {'window': self.window, 'halflife': self.halflife, 'stats': self.stats.snapshot(), 'ew_variance': self.ew_variance}
+
+    @classmethod
+    def restore(cls, state):
+        volatility = cls(state['stats']['window'], state['window'], state['halflife'])
+        volatility.stats = RollingStats.restore(state['stats'])
+        volatility.ew_variance = state['ew_variance']
+        return volatility
+
+
+class IndicatorEngine:
+    """
+    Indicators of one symbol/timeframe bar series.
+
+    - `lookback`: number of bars of the served window (volatility z-score cleaning).
+    - `fibonacci_bars`: number of bars of the Fibonacci high/low window.
+    """
+
+    def __init__(self, lookback, fibonacci_bars, rsi_window=14, rsi_smoothing='sma'):
+        self.lookback = lookback
+        self.fibonacci_bars = fibonacci_bars
+        self.rsi = StreamingRSI(rsi_window, rsi_smoothing)
+        self.volatility = StreamingVolatility(lookback)
+        self.extrema = RollingExtrema(fibonacci_bars)
+        # RSI of the committed bars, returned for the chart
+        self.rsi_history = deque(maxlen=lookback)
+        self.last_timestamp = None
+
+    # Check that the state still describes the given settings
+    def matches(self, fibonacci_bars, rsi_window, rsi_smoothing):
+        return (self.fibonacci_bars, self.rsi.window, self.rsi.smoothing) == (fibonacci_bars, rsi_window, rsi_smoothing)
+
+    def commit(self, close):
+        self.rsi_history.append(self.rsi.update(close))
+        self.volatility.update(close)
+        self.extrema.update(close)
+
+    def update(self, data):
+        """
+        Commit the closed bars of `data` (all but the last one) that are newer than the
+        state, then compute the indicators with the forming bar. Returns a dict with
+        `rsi` (one value per bar of `data`), `volatility`, `high` and `low`.
+        """
+        closes = data['Close']
+        timestamps = data.index[:-1]
+        start = 0
+        if self.last_timestamp is not None:
+            start = int(timestamps.searchsorted(pd.Timestamp(self.last_timestamp), side='right'))
+        for close in closes.iloc[start:-1]:
+            self.commit(float(close))
+        if len(timestamps):
+            self.last_timestamp = timestamps[-1].isoformat()
+
+        live = float(closes.iloc[-1])
+        history = list(self.rsi_history)[-(len(data) - 1):] if len(data) > 1 else []
+        rsi = [50.0] * (len(data) - 1 - len(history)) + history + [self.rsi.peek(live)]
+        high, low = self.extrema.peek(live)
+        return {'rsi': rsi, 'volatility': self.volatility.peek(live), 'high': high, 'low': low}
+
+    def snapshot(self):
+        return {
+            'lookback': self.lookback, 'fibonacci_bars': self.fibonacci_bars, 'last_timestamp': self.last_timestamp,
+            'rsi': self.rsi.snapshot(), 'rsi_history': list(self.rsi_history),
+            'volatility': self.volatility.snapshot(), 'extrema': self.extrema.snapshot(),
+        }
+
+    @classmethod
+    def restore(cls, state):
+        engine = cls(state['lookback'], state['fibonacci_bars'])
+        engine.rsi = StreamingRSI.restore(state['rsi'])
+        engine.rsi_history.extend(state['rsi_history'])
+        engine.volatility = StreamingVolatility.restore(state['volatility'])
+        engine.extrema = RollingExtrema.restore(state['extrema'])
+        engine.last_timestamp = state['last_timestamp']
+        return engine
+
+
+# Engines per (symbol, timeframe), restored from INDICATOR_STATE_PATH on first use
+_engines = None
+_engines_lock = threading.Lock()
+
+
+def _load_engines():
+    if not os.path.exists(INDICATOR_STATE_PATH):
+        return {}
+    try:
+        with open(INDICATOR_STATE_PATH) as f:
+            states = json.load(f)
+        logger.info("Restored indicator states from %s", INDICATOR_STATE_PATH)
+        return {tuple(key.split('|')): IndicatorEngine.restore(state) for key, state in states.items()}
+    except (ValueError, KeyError, TypeError) as e:
+        logger.warning("Ignoring unreadable indicator states (%s).", e)
+        return {}
+
+
+def compute_indicators(symbol, timeframe, data, fibonacci_bars, rsi_window=14, rsi_smoothing='sma'):
+    """
+    Update the indicators of a symbol/timeframe with its current bars (see IndicatorEngine.update),
+    the volatility annualized for the timeframe.
+    The state is rebuilt from `data` if there is none, if it uses other settings, if the
+    served window has grown, or if it is older than the first bar of `data` (bars would be
+    missing in between).
+    The state is sized for the bars kept by the store of the timeframe, so the window can
+    grow up to them (while the store fills up) without a rebuild.
+    """
+    global _engines
+    # The timeframes of a symbol are computed in parallel (pipeline graph)
+    with _engines_lock:
+        if _engines is None:
+            _engines = _load_engines()
+
+    key = (symbol, timeframe)
+    engine = _engines.get(key)
+    spec = TIMEFRAMES[timeframe]
+    lookback = max(len(data), period_to_bars(spec['period'], spec['interval']))
+    # Like data[-fibonacci_bars:], the Fibonacci window never exceeds the served window (a
+    # shorter window holds all of its bars anyway)
+    fibonacci_bars = min(fibonacci_bars, lookback)
+    rebuild = (
+        engine is None
+        or len(data) > engine.lookback
+        or not engine.matches(fibonacci_bars, rsi_window, rsi_smoothing)
+        or (engine.last_timestamp is not None and pd.Timestamp(engine.last_timestamp) < data.index[0])
+    )
+    if rebuild:
+        logger.info("Building %s %s indicator state from %d bars...", symbol, timeframe, len(data))
+        engine = _engines[key] = IndicatorEngine(lookback, fibonacci_bars, rsi_window, rsi_smoothing)
+    values = engine.update(data)
+    values['volatility'] = annualize(values['volatility'], timeframe)
+    return values
+
+
+# Save every indicator state (atomic replace, so a crash never leaves a truncated file)
+def save_indicator_states():
+    if not _engines:
+        return
+    states = {'|'.join(key): engine.snapshot() for key, engine in _engines.items()}
+    tmp_path = INDICATOR_STATE_PATH + '.tmp'
+    with open(tmp_path, 'w') as f:
+        json.dump(states, f)
+    os.replace(tmp_path, INDICATOR_STATE_PATH)
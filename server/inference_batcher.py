@@ -0,0 +1,121 @@
+# /server/inference_batcher.py
+#
+# Micro-batching of the forecasts: the windows submitted for the same model (same ONNX
+# file, inference mode, window length and horizon) by the symbols computed in parallel are
+# stacked into one (B, L, 1) input, forecast with a single session call, and each caller
+# gets its own row back.
+#
+# A batch is open for INFERENCE_BATCH_WINDOW_MS after its first window, or until it holds
+# INFERENCE_MAX_BATCH windows. The wait only applies to models used by more than one symbol
+# (e.g. a shared timeframe model, see markets.model_path): a model served to a single
+# symbol never has anything to wait for, so its forecasts run at once.
+
+import os
+import time
+import threading
+import numpy as np
+from .metrics import increment
+
+# How long a batch waits for windows of other symbols, in milliseconds (0 = never wait)
+INFERENCE_BATCH_WINDOW_MS = float(os.getenv('INFERENCE_BATCH_WINDOW_MS', '5'))
+# Maximum windows per session call
+INFERENCE_MAX_BATCH = int(os.getenv('INFERENCE_MAX_BATCH', '64'))
+
+
+class _Batch:
+    """
+    Windows gathered for one model. The first caller to ask for a result once the batch is
+    full or its deadline passed runs it; the others wait for the outputs.
+    """
+
+    def __init__(self, deadline):
+        self.deadline = deadline
+        self.windows = []
+        self.full = threading.Event()
+        self.done = threading.Event()
+        self.claimed = False
+        self.outputs = None
+        self.error = None
+
+
+class PendingForecast:
+    """
+    Forecast of one window submitted to the batcher: `result()` blocks until the batch
+    ran and returns the row of the window.
+    """
+
+    def __init__(self, batcher, key, batch, index):
+        self._batcher = batcher
+        self._key = key
+        self._batch = batch
+        self._index = index
+
+    def result(self):
+        batch = self._batch
+        if not batch.done.is_set():
+            batch.full.wait(max(batch.deadline - time.monotonic(), 0.0))
+            if self._batcher._claim(self._key, batch):
+                self._batcher._execute(self._key, batch)
+            else:
+                batch.done.wait()
+        if batch.error is not None:
+            raise batch.error
+        return batch.outputs[self._index]
+
+
+class MicroBatcher:
+    """
+    Gather the windows of concurrent callers per key and run them together with
+    `run_batch(key, windows)`, which returns one output row per window.
+    """
+
+    def __init__(self, run_batch, window_ms=INFERENCE_BATCH_WINDOW_MS, max_batch=INFERENCE_MAX_BATCH):
+        self.run_batch = run_batch
+        self.window = window_ms / 1000.0
+        self.max_batch = max(1, max_batch)
+        self._lock = threading.Lock()
+        self._open = {}  # key -> _Batch still accepting windows
+        self._users = {}  # key -> symbols that submitted windows
+
+    def submit(self, key, window, symbol=None):
+        """
+        Add a window to the open batch of `key` (or open one). Returns a PendingForecast.
+        """
+        with self._lock:
+            users = self._users.setdefault(key, set())
+            if symbol is not None:
+                users.add(symbol)
+
+            batch = self._open.get(key)
+            if batch is None:
+                wait = self.window if len(users) > 1 else 0.0
+                batch = self._open[key] = _Batch(time.monotonic() + wait)
+            index = len(batch.windows)
+            batch.windows.append(window)
+            if len(batch.windows) >= self.max_batch:
+                del self._open[key]
+                batch.full.set()
+        return PendingForecast(self, key, batch, index)
+
+    def forecast(self, key, window, symbol=None):
+        return self.submit(key, window, symbol).result()
+
+    # Take the batch out of the open ones; True for the caller that has to run it
+    def _claim(self, key, batch):
+        with self._lock:
+            if batch.claimed:
+                return False
+            batch.claimed = True
+            if self._open.get(key) is batch:
+                del self._open[key]
+            return True
+
+    def _execute(self, key, batch):
+        try:
+            batch.outputs = self.run_batch(key, np.stack(batch.windows))
+            increment('inference_batches')
+            increment('inference_windows', len(batch.windows))
+        except Exception as e:
+            batch.error = e
+        finally:
+            batch.done.set()
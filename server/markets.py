@@ -0,0 +1,102 @@
+# /server/markets.py
+
+import os
+import re
+
+# Directory holding the bar stores and the models
+MODEL_DIR = os.getenv('MODEL_DIR', '/models')
+# Versioned models published by models/train_lstm.py (see model_registry)
+MODEL_REGISTRY_DIR = os.getenv('MODEL_REGISTRY_DIR', os.path.join(MODEL_DIR, 'registry'))
+
+# Timeframes served by the pipeline: bar interval, history window, Fibonacci lookback.
+# Only the base timeframe is downloaded on every cycle. The others are aggregated from it
+# ('resample_from'); their longer history is backfilled once by downloading `period` of
+# `fetch_interval` bars.
+TIMEFRAMES = {
+    '15min': {'interval': '15m', 'period': '30d', 'bars_per_day': 24 * 4, 'fibonacci_days': 7, 'label': '15-minute'},
+    'hourly': {'interval': '1h', 'period': '3mo', 'bars_per_day': 24, 'fibonacci_days': 30, 'label': 'Hourly',
+               'resample_from': '15min', 'fetch_interval': '1h'},
+    '4h': {'interval': '4h', 'period': '1y', 'bars_per_day': 6, 'fibonacci_days': 90, 'label': '4-hour',
+           'resample_from': '15min', 'fetch_interval': '1h'},
+    'daily': {'interval': '1d', 'period': '2y', 'bars_per_day': 1, 'fibonacci_days': 180, 'label': 'Daily',
+              'resample_from': '15min', 'fetch_interval': '1d'},
+}
+
+# Known symbols: yfinance ticker -> slug used in file names and by the dashboard
+SYMBOLS = {
+    'ETH-USD': 'eth_usd',
+    'BTC-USD': 'btc_usd',
+    'GC=F': 'xau_usd',
+    'EURUSD=X': 'eur_usd',
+}
+
+# Symbols trading around the clock (crypto): a missing bar is a data gap and is repaired with a
+# flat bar. The other markets close between sessions and their bars are left as downloaded.
+ALWAYS_OPEN_SYMBOLS = {s for s in os.getenv('ALWAYS_OPEN_SYMBOLS', 'ETH-USD,BTC-USD').split(',') if s}
+
+# Symbols and timeframes the compute loop runs (comma-separated tickers / timeframe names)
+ACTIVE_SYMBOLS = [s for s in os.getenv('SYMBOLS', 'ETH-USD').split(',') if s]
+ACTIVE_TIMEFRAMES = [t for t in os.getenv('TIMEFRAMES', '15min,hourly').split(',') if t]
+
+# Timeframe shown on the chart and used for the current price
+PRIMARY_TIMEFRAME = ACTIVE_TIMEFRAMES[0]
+
+# Per-timeframe model overrides for ETH-USD (kept for existing deployments)
+LEGACY_MODEL_PATHS = {
+    ('ETH-USD', '15min'): os.getenv('MODEL_15MIN_PATH'),
+    ('ETH-USD', 'hourly'): os.getenv('MODEL_HOURLY_PATH'),
+}
+
+
+# Slug of a ticker ('ETH-USD' -> 'eth_usd')
+def symbol_slug(symbol):
+    return SYMBOLS.get(symbol) or re.sub(r'[^a-z0-9]+', '_', symbol.lower()).strip('_')
+
+
+# Ticker of a slug or ticker ('eth_usd' -> 'ETH-USD')
+def resolve_symbol(name):
+    for symbol, slug in SYMBOLS.items():
+        if name in (symbol, slug):
+            return symbol
+    return name
+
+
+# Raise ValueError unless the compute loop runs this symbol (and timeframe): clients can only
+# ask for the markets configured in SYMBOLS / TIMEFRAMES
+def check_market(symbol, timeframe=None):
+    if symbol not in ACTIVE_SYMBOLS:
+        raise ValueError(f"Unknown symbol {symbol} (expected one of {', '.join(ACTIVE_SYMBOLS)}).")
+    if timeframe is not None and timeframe not in ACTIVE_TIMEFRAMES:
+        raise ValueError(f"Unknown timeframe {timeframe} (expected one of {', '.join(ACTIVE_TIMEFRAMES)}).")
+
+
+# Registry directory of the versions of a symbol/timeframe model
+def registry_path(symbol, timeframe):
+    return os.path.join(MODEL_REGISTRY_DIR, f"{symbol_slug(symbol)}_{timeframe}")
+
+
+# Unversioned ONNX model of a symbol/timeframe (served when the registry has no version).
+# Without a model of its own, a symbol uses the shared model of the timeframe (lstm_<timeframe>.onnx),
+# whose forecasts are batched across the symbols (see inference_batcher.py).
+def model_path(symbol, timeframe):
+    override = LEGACY_MODEL_PATHS.get((symbol, timeframe))
+    if override:
+        return override
+    path = os.path.join(MODEL_DIR, f"{symbol_slug(symbol)}_lstm_{timeframe}.onnx")
+    shared = shared_model_path(timeframe)
+    return shared if not os.path.exists(path) and os.path.exists(shared) else path
+
+
+# Model of a timeframe shared by the symbols without their own
+def shared_model_path(timeframe):
+    return os.path.join(MODEL_DIR, f"lstm_{timeframe}.onnx")
+
+
+# Columnar bar store of a symbol/timeframe
+def bars_path(symbol, timeframe):
+    return os.path.join(MODEL_DIR, f"{symbol_slug(symbol)}_{timeframe}.bars")
+
+
+# Human-readable model name used in logs ('ETH-USD 15-minute')
+def model_label(symbol, timeframe):
+    return f"{symbol} {TIMEFRAMES[timeframe]['label']}"
@@ -0,0 +1,173 @@
+# /server/metrics.py
+#
+# Latency and throughput metrics of the data pipeline, served in the Prometheus text format
+# on /metrics (see routes.py). Metrics are kept per process: with an external compute
+# service, the pipeline stages are measured there (python -m server.compute_service serves
+# its own /metrics on COMPUTE_METRICS_PORT).
+#
+# - timings: `with timed('inference'):` records the duration of a pipeline stage. Each
+#   stage keeps its count and sum, and the p50/p95/p99 of its last METRICS_WINDOW durations.
+# - counters: `increment('model_calls')`, `increment('emitted_bytes', n)`, or with labels
+#   `increment('node_runs', node='inference:15min')`.
+
+import os
+import time
+import threading
+import logging
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from collections import deque
+from contextlib import contextmanager
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+# Durations kept per stage for the quantiles
+METRICS_WINDOW = int(os.getenv('METRICS_WINDOW', '1024'))
+QUANTILES = (0.5, 0.95, 0.99)
+METRIC_PREFIX = 'geotrade_'
+
+# Stages of the pipeline, in order (others can be timed as well). The nodes of the pipeline
+# graph are timed per timeframe, e.g. 'inference:15min' (see pipeline_graph.py).
+STAGES = ('fetch', 'preprocess', 'inference', 'predictions', 'indicators', 'volatility', 'accuracy', 'signals',
+          'persistence', 'emit', 'cycle', 'request')
+
+# Counter name -> help text
+COUNTERS = {
+    'fetch_failures': 'Bar downloads that failed or returned no data.',
+    'model_calls': 'ONNX Runtime session runs.',
+    'inference_batches': 'Forecast batches run by the micro-batcher.',
+    'inference_windows': 'Windows forecast in the micro-batches (windows / batches = mean batch size).',
+    'emitted_messages': 'Chart messages emitted to the dashboards.',
+    'emitted_bytes': 'Bytes of the chart messages emitted to the dashboards.',
+    'pipeline_failures': 'Symbols whose pipeline failed during a cycle.',
+}
+# Counters with labels (only their series seen so far are served)
+LABELLED_COUNTERS = {
+    'node_runs': 'Pipeline graph nodes run, per node.',
+    'node_cache_hits': 'Pipeline graph nodes reused from their previous run (inputs unchanged), per node.',
+}
+
+
+class StageTimings:
+    """
+    Durations of one stage: total count and sum, and the last `window` values for the
+    quantiles.
+    """
+
+    def __init__(self, window=METRICS_WINDOW):
+        self.count = 0
+        self.total = 0.0
+        self.recent = deque(maxlen=window)
+
+    def observe(self, seconds):
+        self.count += 1
+        self.total += seconds
+        self.recent.append(seconds)
+
+    def quantiles(self, quantiles=QUANTILES):
+        if not self.recent:
+            return {q: float('nan') for q in quantiles}
+        return dict(zip(quantiles, np.quantile(np.fromiter(self.recent, dtype=np.float64), quantiles)))
+
+
+_timings = {}
+# (counter, labels) -> value, labels as a sorted tuple of (name, value)
+_counters = {}
+_metrics_lock = threading.Lock()
+
+
+def observe(stage, seconds):
+    with _metrics_lock:
+        timings = _timings.get(stage)
+        if timings is None:
+            timings = _timings[stage] = StageTimings()
+        timings.observe(seconds)
+
+
+@contextmanager
+def timed(stage):
+    """
+    Record the duration of the enclosed block as one `stage` observation (also when it
+    raises).
+    """
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        observe(stage, time.perf_counter() - started)
+
+
+def increment(counter, value=1, **labels):
+    key = (counter, tuple(sorted(labels.items())))
+    with _metrics_lock:
+        _counters[key] = _counters.get(key, 0) + value
+
+
+# Counter name with its labels, e.g. node_runs{node="inference:15min"}
+def _series_name(counter, labels):
+    return counter + ('{' + ','.join(f'{name}="{value}"' for name, value in labels) + '}' if labels else '')
+
+
+# Current values, as plain dicts (count, sum and quantiles of the stages, counters)
+def snapshot():
+    with _metrics_lock:
+        stages = {stage: {'count': timings.count, 'sum': timings.total, **{f"p{int(q * 100)}": value for q, value in timings.quantiles().items()}}
+                  for stage, timings in _timings.items()}
+        return {'stages': stages, 'counters': {_series_name(*key): value for key, value in _counters.items()}}
+
+
+def render():
+    """
+    Metrics in the Prometheus text exposition format.
+    """
+    with _metrics_lock:
+        timings = {stage: (values.count, values.total, values.quantiles()) for stage, values in _timings.items()}
+        counters = dict(_counters)
+
+    name = f"{METRIC_PREFIX}stage_duration_seconds"
+    lines = [f"# HELP {name} Duration of the data pipeline stages.", f"# TYPE {name} summary"]
+
+    # Graph nodes ('inference:15min') are sorted with their stage
+    def order(stage):
+        base = stage.split(':')[0]
+        return (STAGES.index(base) if base in STAGES else len(STAGES), stage)
+
+    for stage in sorted(timings, key=order):
+        count, total, quantiles = timings[stage]
+        for q, value in quantiles.items():
+            lines.append(f'{name}{{stage="{stage}",quantile="{q}"}} {value:.6f}')
+        lines.append(f'{name}_sum{{stage="{stage}"}} {total:.6f}')
+        lines.append(f'{name}_count{{stage="{stage}"}} {count}')
+
+    known = {**COUNTERS, **LABELLED_COUNTERS}
+    for counter, help_text in {**known, **{counter: '' for counter, _ in sorted(counters) if counter not in known}}.items():
+        series = sorted((labels, value) for (other, labels), value in counters.items() if other == counter)
+        if not series and counter in COUNTERS:
+            series = [((), 0)]
+        if not series:
+            continue
+        name = f"{METRIC_PREFIX}{counter}_total"
+        lines += [f"# HELP {name} {help_text}".rstrip(), f"# TYPE {name} counter"]
+        lines += [f"{METRIC_PREFIX}{_series_name(f'{counter}_total', labels)} {value}" for labels, value in series]
+    return '\n'.join(lines) + '\n'
+
+
+class _MetricsHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        body = render().encode()
+        self.send_response(200 if self.path.split('?')[0] == '/metrics' else 404)
+        self.send_header('Content-Type', 'text/plain; version=0.0.4')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+# Serve /metrics from a background thread (processes without the Flask app)
+def serve_metrics(port):
+    server = ThreadingHTTPServer(('0.0.0.0', port), _MetricsHandler)
+    threading.Thread(target=server.serve_forever, name='geotrade-metrics', daemon=True).start()
+    logger.info("Serving metrics on port %d.", port)
+    return server
@@ -1,84 +1,229 @@
 import os
+import weakref
+import threading
+import logging
 import numpy as np
 import onnxruntime as ort
-import csv
-import datetime
 from .volatility_adjustment import adjust_predictions_for_volatility, calculate_and_log_volatility  # Importing functions
-
-# Load ONNX models for 15-minute and hourly data
-model_15min_path = os.getenv('MODEL_15MIN_PATH', '/models/eth_usd_lstm_15min.onnx')  # Use environment variable or default path
-model_hourly_path = os.getenv('MODEL_HOURLY_PATH', '/models/eth_usd_lstm_hourly.onnx')
-
-print(f"Loading 15-minute ONNX model from: {model_15min_path}")
-ort_session_15min = ort.InferenceSession(model_15min_path)
-print("15-minute model loaded successfully.")
-
-print(f"Loading hourly ONNX model from: {model_hourly_path}")
-ort_session_hourly = ort.InferenceSession(model_hourly_path)
-print("Hourly model loaded successfully.")
-
-# Predict prices using the 15-minute and hourly ONNX models and log predictions
-def predict_prices_multi_horizon(scaled_data_15min, scaled_data_hourly, scaler_15min, scaler_hourly, actual_prices_15min=None, actual_prices_hourly=None):
+from .onnx_rollout import build_rollout_model, build_stateful_rollout_model, derive_step_model, STEPS_INPUT
+from .session_registry import get_session, release_sessions
+from .model_registry import current_version
+from .prediction_journal import journal
+from .metrics import increment
+from .inference_batcher import MicroBatcher
+from .model_variants import BASE_VARIANT, served_variant, step_model_path, variant_path
+from . import markets
+
+logger = logging.getLogger(__name__)
+
+# Number of future steps forecast by each model
+FORECAST_HORIZON = 60
+
+# 'stateful': one session call, LSTM state warmed once over the window then advanced step by step
+# 'rollout': one session call, the full window is re-run for each step (loop inside the ONNX graph)
+# 'loop': legacy Python loop, one session call per step
+INFERENCE_MODE = os.getenv('INFERENCE_MODE', 'stateful')
+# Session calls through ONNX Runtime I/O binding, with input/output buffers reused between calls
+INFERENCE_IO_BINDING = os.getenv('INFERENCE_IO_BINDING', '1') == '1'
+
+# Registry version served per (symbol, timeframe), to unload the previous one on a switch
+_served_versions = {}
+_served_lock = threading.Lock()
+# Variant files found missing (reported once)
+_missing_variants = set()
+
+# Build the single-call forecasting graph of a model for an inference mode (INFERENCE_MODE by default)
+def build_forecast_model(model_path, mode=None):
+    if (mode or INFERENCE_MODE) == 'stateful':
+        # Step model exported by train_lstm.py, or derived from the one-step model for older exports
+        step_path = step_model_path(model_path)
+        step_model = step_path if os.path.exists(step_path) else derive_step_model(model_path)
+        return build_stateful_rollout_model(step_model)
+    return build_rollout_model(model_path)
+
+# Session of the one-step model
+def get_model_session(model_path):
+    return get_session(model_path)
+
+# Session of the forecasting graph (whole horizon in one call)
+def get_forecast_session(model_path, mode=None):
+    mode = mode or INFERENCE_MODE
+    return get_session(model_path, mode, lambda path: build_forecast_model(path, mode), depends_on=[step_model_path(model_path)])
+
+# Whether a session takes several windows per call (models exported before the dynamic batch axis take one)
+def accepts_batches(session):
+    return not isinstance(session.get_inputs()[0].shape[0], int)
+
+def forecast_batch(model_path, mode, windows, horizon=FORECAST_HORIZON):
     """
-    Generate predictions using both 15-minute and hourly models, log predictions to file.
+    Forecast `horizon` scaled steps for each window of `windows` (B, L, 1) with the model
+    stored at `model_path`, in as few session calls as the model allows. Returns (B, horizon).
     """
-    # Step 1: Predict using the 15-minute model
-    predicted_prices_15min = predict_with_model(scaled_data_15min, scaler_15min, ort_session_15min, 59)
-    log_predictions(predicted_prices_15min, "15-minute", actual_prices_15min)
-
-    # Step 2: Predict using the hourly model
-    predicted_prices_hourly = predict_with_model(scaled_data_hourly, scaler_hourly, ort_session_hourly, 59)
-    log_predictions(predicted_prices_hourly, "Hourly", actual_prices_hourly)
-
-    # Step 3: Combine predictions (you can average them or apply another logic)
-    combined_predictions = [(p1 + p2) / 2 for p1, p2 in zip(predicted_prices_15min, predicted_prices_hourly)]
-
-    return combined_predictions
+    windows = np.asarray(windows, dtype=np.float32)
+    session = get_model_session(model_path) if mode == 'loop' else get_forecast_session(model_path, mode)
+    if len(windows) > 1 and not accepts_batches(session):
+        return np.concatenate([_run_forecast(session, mode, windows[i:i + 1], horizon) for i in range(len(windows))])
+    return _run_forecast(session, mode, windows, horizon)
 
-# Helper function to make predictions using a given ONNX model
-def predict_with_model(scaled_data, scaler, model_session, sequence_length):
+class BoundBuffers:
     """
-    Make predictions using an ONNX model with the specified session and sequence length.
+    Input and output arrays of a session, bound once with I/O binding: each call copies the
+    windows into `inputs[0]` and the session writes its outputs into `output`. In loop mode
+    the window alternates between two inputs, the next one being written from the current
+    one, so the per-step loop allocates no array.
     """
+
+    def __init__(self, session, mode, shape, horizon):
+        input_name, output_name = session.get_inputs()[0].name, session.get_outputs()[0].name
+        self.inputs = [np.empty(shape, dtype=np.float32) for _ in range(2 if mode == 'loop' else 1)]
+        self.output = np.empty((shape[0], 1) if mode == 'loop' else (horizon, shape[0], 1), dtype=np.float32)
+        self.steps = np.array(horizon, dtype=np.int64)
+        self.values = [ort.OrtValue.ortvalue_from_numpy(array) for array in self.inputs + [self.output]]
+        self.bindings = []
+        for value in self.values[:-1]:
+            binding = session.io_binding()
+            binding.bind_ortvalue_input(input_name, value)
+            if mode != 'loop':
+                binding.bind_cpu_input(STEPS_INPUT, self.steps)
+            binding.bind_ortvalue_output(output_name, self.values[-1])
+            self.bindings.append(binding)
+
+# Bound buffers of each thread: session -> {(mode, shape, horizon): BoundBuffers}
+_bound = threading.local()
+
+def bound_buffers(session, mode, shape, horizon):
+    sessions = getattr(_bound, 'sessions', None)
+    if sessions is None:
+        # Dropped with their session (e.g. a replaced model version)
+        sessions = _bound.sessions = weakref.WeakKeyDictionary()
+    buffers = sessions.setdefault(session, {})
+    key = (mode, shape, horizon)
+    if key not in buffers:
+        buffers[key] = BoundBuffers(session, mode, shape, horizon)
+    return buffers[key]
+
+# Run one session on a batch of windows: one call for the rollout graphs, `horizon` calls in loop mode
+def _run_forecast(session, mode, windows, horizon):
+    if INFERENCE_IO_BINDING:
+        return _run_bound_forecast(session, mode, windows, horizon)
+    if mode != 'loop':
+        outputs = session.run(None, {'input': windows, STEPS_INPUT: np.array(horizon, dtype=np.int64)})
+        increment('model_calls')
+        return outputs[0][:, :, 0].T  # (steps, B, 1) -> (B, steps)
+
+    windows = windows.copy()
+    predicted_scaled = np.empty((len(windows), horizon), dtype=np.float32)
+    for step in range(horizon):
+        outputs = session.run(None, {'input': windows})
+        increment('model_calls')
+        predicted_scaled[:, step] = outputs[0][:, 0]
+        windows = np.roll(windows, -1, axis=1)
+        windows[:, -1, 0] = predicted_scaled[:, step]
+    return predicted_scaled
+
+# _run_forecast through the bound buffers of the session
+def _run_bound_forecast(session, mode, windows, horizon):
+    buffers = bound_buffers(session, mode, windows.shape, horizon)
+    np.copyto(buffers.inputs[0], windows)
+    if mode != 'loop':
+        session.run_with_iobinding(buffers.bindings[0])
+        increment('model_calls')
+        return buffers.output[:, :, 0].T.copy()  # (steps, B, 1) -> (B, steps), out of the reused buffer
+
+    predicted_scaled = np.empty((len(windows), horizon), dtype=np.float32)
+    current = 0
+    for step in range(horizon):
+        session.run_with_iobinding(buffers.bindings[current])
+        increment('model_calls')
+        predicted_scaled[:, step] = buffers.output[:, 0]
+        # Next window: the current one shifted by one step, then the prediction
+        following = buffers.inputs[1 - current]
+        following[:, :-1] = buffers.inputs[current][:, 1:]
+        following[:, -1] = buffers.output
+        current = 1 - current
+    return predicted_scaled
+
+# Windows of the same model submitted by concurrent callers are run as one batch
+batcher = MicroBatcher(lambda key, windows: forecast_batch(key[0], key[1], windows, key[3]))
+
+# Check the scaled data and return its last window, shaped (sequence_length, 1)
+def forecast_window(scaled_data, sequence_length):
     if len(scaled_data) < sequence_length:
         raise ValueError(f"Insufficient data: At least {sequence_length} data points are required for prediction.")
 
     if np.any(np.isnan(scaled_data)):
         raise ValueError("Input data contains NaN values. Please clean the data before passing it to the model.")
 
-    input_data = scaled_data[-sequence_length:].reshape(1, sequence_length, 1).astype(np.float32)
-    predicted_price_list = []
-
-    for _ in range(60):
-        outputs = model_session.run(None, {'input': input_data})
-        predicted_price_scaled = outputs[0][0][0]
-        predicted_price = scaler.inverse_transform([[predicted_price_scaled]])[0][0]
-        predicted_price_list.append(predicted_price)
-        input_data = np.roll(input_data, -1)
-        input_data[0, -1, 0] = predicted_price_scaled
+    return np.asarray(scaled_data[-sequence_length:], dtype=np.float32).reshape(sequence_length, 1)
 
-    return predicted_price_list
+# Queue a forecast in the micro-batcher; the returned function waits for it and gives the predicted prices
+def submit_forecast(scaled_data, scaler, model_path, sequence_length=59, symbol=None, horizon=FORECAST_HORIZON):
+    pending = batcher.submit((model_path, INFERENCE_MODE, sequence_length, horizon), forecast_window(scaled_data, sequence_length), symbol)
+    return lambda: scaler.inverse_transform(pending.result().reshape(-1, 1).astype(np.float64)).ravel().tolist()
 
-# Define file path for logging predictions
-log_file_path = './models/prediction_log.csv'
+# Forecast the horizon with the model stored at `model_path`, using the sessions of INFERENCE_MODE
+def predict_with_model_path(scaled_data, scaler, model_path, sequence_length=59, symbol=None):
+    return submit_forecast(scaled_data, scaler, model_path, sequence_length, symbol)()
 
-# Log predictions to a CSV file for future analysis
-def log_predictions(predictions, model_type, actual_prices=None):
+def serving_model(symbol, timeframe):
+    """
+    Model to serve for a symbol/timeframe: {'path', 'scaler', 'sequence_length', 'version', 'variant'}.
+
+    The current version of the model registry is checked on every call, so a newly published
+    version is served from the next cycle on; requests already running keep the sessions of
+    the version they resolved, and the sessions of the previous version are dropped from the
+    cache. Without a registry version (or with a MODEL_*_PATH override), the unversioned ONNX
+    file is served and `scaler` is None (fitted on the served window). `path` is the file of
+    the variant selected for the model (see model_variants.py).
     """
-    Log predicted prices along with the timestamp and optional actual prices.
+    version = None
+    if not markets.LEGACY_MODEL_PATHS.get((symbol, timeframe)):
+        version = current_version(markets.registry_path(symbol, timeframe))
+
+    with _served_lock:
+        previous = _served_versions.get((symbol, timeframe))
+        if version is not None and previous != version.path:
+            logger.info("Serving %s model version %s.", markets.model_label(symbol, timeframe), version.name)
+            _served_versions[(symbol, timeframe)] = version.path
+            if previous:
+                release_sessions(previous + os.sep)
+
+    if version is None:
+        model = {'path': markets.model_path(symbol, timeframe), 'scaler': None, 'sequence_length': 59, 'version': None}
+    else:
+        model = {'path': version.model_path, 'scaler': version.scaler(), 'sequence_length': version.sequence_length, 'version': version.name}
+    return with_variant(model, symbol, timeframe)
+
+# Serve the variant of a model selected for the symbol/timeframe (model_variants.py), float32 if it was not built
+def with_variant(model, symbol, timeframe):
+    variant = served_variant(symbol, timeframe)
+    path = variant_path(model['path'], variant)
+    if variant != BASE_VARIANT and not os.path.exists(path):
+        if path not in _missing_variants:
+            logger.warning("No %s variant of %s, serving the float32 model.", variant, model['path'])
+            _missing_variants.add(path)
+        variant, path = BASE_VARIANT, model['path']
+    return dict(model, path=path, variant=variant)
+
+# Forecast of one timeframe of a symbol (a node of the pipeline graph), logged to the journal
+def predict_timeframe(scaled_input, model, symbol, timeframe, bar_time=None):
+    scaled_data, scaler = scaled_input
+    predictions = predict_with_model_path(scaled_data, scaler, model['path'], model['sequence_length'], symbol)
+    log_forecast(predictions, scaled_data, scaler, symbol, timeframe, bar_time)
+    return predictions
+
+# Log a forecast with the close of the last bar the model saw
+def log_forecast(predictions, scaled_data, scaler, symbol, timeframe, bar_time=None):
+    last_close = scaler.inverse_transform(np.asarray(scaled_data[-1:], dtype=np.float64).reshape(1, -1))[0, 0]
+    log_predictions(predictions, symbol, timeframe, bar_time, last_close)
+
+# Log a forecast to the prediction journal (buffered, written by a background thread)
+def log_predictions(predictions, symbol, timeframe, bar_time=None, last_close=None):
+    """
+    Log predicted prices with the time of the last bar the model saw and its close.
 
     :param predictions: List of predicted prices.
-    :param model_type: "15-minute" or "Hourly" model for identification.
-    :param actual_prices: Optional. List of actual prices (if available).
+    :param symbol: Ticker of the model (e.g. 'ETH-USD').
+    :param timeframe: Timeframe of the model (e.g. '15min').
     """
-    timestamp = datetime.datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-    headers = ['timestamp', 'model_type', 'predicted_price', 'actual_price']
-
-    with open(log_file_path, mode='a', newline='') as log_file:
-        writer = csv.writer(log_file)
-        if log_file.tell() == 0:
-            writer.writerow(headers)
-
-        for i in range(len(predictions)):
-            row = [timestamp, model_type, predictions[i], actual_prices[i] if actual_prices else 'N/A']
-            writer.writerow(row)
\ No newline at end of file
+    journal.log(symbol, timeframe, predictions, bar_time, last_close)
@@ -0,0 +1,161 @@
+# /server/model_registry.py
+#
+# Versioned model artifacts. Every symbol/timeframe has a directory with one sub-directory
+# per trained version and a CURRENT file naming the version to serve:
+#
+#     registry/eth_usd_15min/
+#         CURRENT                        "20261017T120000123-4242"
+#         20261017T120000123-4242/
+#             model.onnx                 one-step model
+#             model_step.onnx            stateful step model
+#             scaler.json                Min-Max scaler fitted on the training data
+#             metadata.json              seq_length, timeframe, train range, loss...
+#
+# A version is written to a hidden staging directory, renamed into place once complete, and
+# published by replacing CURRENT (os.replace), so a reader never sees a partial version.
+#
+# This module only depends on the standard library (sklearn for scalers) so that
+# models/train_lstm.py can import it as well.
+
+import os
+import json
+import time
+import shutil
+import logging
+
+logger = logging.getLogger(__name__)
+
+MODEL_FILE = 'model.onnx'
+STEP_MODEL_FILE = 'model_step.onnx'
+SCALER_FILE = 'scaler.json'
+METADATA_FILE = 'metadata.json'
+CURRENT_FILE = 'CURRENT'
+
+# Versions kept on disk per model (the current one is never removed)
+KEEP_VERSIONS = int(os.getenv('MODEL_REGISTRY_KEEP_VERSIONS', '3'))
+
+
+class ModelVersion:
+    """
+    One published version of a model (read-only once published).
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.name = os.path.basename(path)
+        with open(os.path.join(path, METADATA_FILE)) as f:
+            self.metadata = json.load(f)
+        with open(os.path.join(path, SCALER_FILE)) as f:
+            self.scaler_params = json.load(f)
+        self._scaler = None
+
+    @property
+    def model_path(self):
+        return os.path.join(self.path, MODEL_FILE)
+
+    # Number of scaled closes given to the model (the training windows minus their target)
+    @property
+    def sequence_length(self):
+        return self.metadata['seq_length'] - 1
+
+    # Scaler fitted on the training data
+    def scaler(self):
+        if self._scaler is None:
+            self._scaler = scaler_from_params(self.scaler_params)
+        return self._scaler
+
+
+# JSON parameters of a fitted MinMaxScaler
+def scaler_params(scaler):
+    return {
+        'data_min': [float(value) for value in scaler.data_min_],
+        'data_max': [float(value) for value in scaler.data_max_],
+        'feature_range': list(scaler.feature_range),
+    }
+
+
+# MinMaxScaler with the saved parameters (fitted on the two rows [min, max])
+def scaler_from_params(params):
+    from sklearn.preprocessing import MinMaxScaler
+    scaler = MinMaxScaler(feature_range=tuple(params['feature_range']))
+    return scaler.fit([params['data_min'], params['data_max']])
+
+
+# Staging directory receiving the files of a new version
+def begin_version(model_dir):
+    name = time.strftime('%Y%m%dT%H%M%S', time.gmtime()) + f"{int(time.time() * 1000) % 1000:03d}-{os.getpid()}"
+    staging = os.path.join(model_dir, f".staging-{name}")
+    os.makedirs(staging)
+    return staging
+
+
+def publish_version(model_dir, staging, scaler, metadata, keep=KEEP_VERSIONS):
+    """
+    Complete a staged version (scaler parameters and metadata), move it into the registry
+    and make it the current version. Returns its path.
+    """
+    with open(os.path.join(staging, SCALER_FILE), 'w') as f:
+        json.dump(scaler if isinstance(scaler, dict) else scaler_params(scaler), f, indent=2)
+    with open(os.path.join(staging, METADATA_FILE), 'w') as f:
+        json.dump(metadata, f, indent=2, default=str)
+
+    path = os.path.join(model_dir, os.path.basename(staging)[len('.staging-'):])
+    os.rename(staging, path)
+
+    current_tmp = os.path.join(model_dir, f".{CURRENT_FILE}.{os.getpid()}")
+    with open(current_tmp, 'w') as f:
+        f.write(os.path.basename(path))
+    os.replace(current_tmp, os.path.join(model_dir, CURRENT_FILE))
+    logger.info("Model version %s published.", path)
+
+    prune_versions(model_dir, keep)
+    return path
+
+
+# Names of the published versions of a model, oldest first
+def list_versions(model_dir):
+    if not os.path.isdir(model_dir):
+        return []
+    return sorted(name for name in os.listdir(model_dir)
+                  if not name.startswith('.') and os.path.isdir(os.path.join(model_dir, name)))
+
+
+# Delete the oldest versions, keeping the current one and the `keep` newest
+def prune_versions(model_dir, keep=KEEP_VERSIONS):
+    current = current_version_name(model_dir)
+    for name in list_versions(model_dir)[:-keep or None]:
+        if name != current:
+            shutil.rmtree(os.path.join(model_dir, name), ignore_errors=True)
+
+
+def current_version_name(model_dir):
+    try:
+        with open(os.path.join(model_dir, CURRENT_FILE)) as f:
+            return f.read().strip() or None
+    except FileNotFoundError:
+        return None
+
+
+# model_dir -> (signature of CURRENT, ModelVersion)
+_current = {}
+
+
+def current_version(model_dir):
+    """
+    Return the current ModelVersion of a model directory, or None if nothing is published.
+    Only CURRENT is stat'ed on each call; the version is reloaded when it was replaced.
+    """
+    try:
+        stat = os.stat(os.path.join(model_dir, CURRENT_FILE))
+    except FileNotFoundError:
+        return None
+    signature = (stat.st_ino, stat.st_mtime_ns, stat.st_size)
+
+    cached = _current.get(model_dir)
+    if cached and cached[0] == signature:
+        return cached[1]
+
+    name = current_version_name(model_dir)
+    version = ModelVersion(os.path.join(model_dir, name)) if name else None
+    _current[model_dir] = (signature, version)
+    return version
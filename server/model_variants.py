@@ -0,0 +1,230 @@
+# /server/model_variants.py
+#
+# Post-training variants of the float32 ONNX models, written next to them:
+#
+#   int8       dynamic int8 quantization (int8 weights, activations quantized on the fly)
+#   fp16       float16 weights and compute, float32 inputs and outputs
+#   optimized  graph optimized offline by ONNX Runtime (extended level, portable between machines)
+#
+# model.onnx gives model-int8.onnx, and its stateful step model model-int8_step.onnx (see
+# step_model_path), so a variant is served like any other model file. The accuracy of each
+# variant against the float32 model on held-out windows is saved to model.variants.json.
+#
+# The variant served is chosen per model with MODEL_VARIANTS ("ETH-USD:15min=int8,..."),
+# MODEL_VARIANT otherwise (default fp32); a model without the requested variant file is
+# served in float32.
+#
+# Like model_registry.py, this module is also imported by models/train_lstm.py (no server
+# imports at module level).
+#
+# Variants are built by models/train_lstm.py with each new version, or for an existing model by
+#     python models/build_variants.py --model models/registry/eth_usd_15min/<version>/model.onnx --data models/eth_usd_15min.csv
+
+import os
+import json
+import time
+import numpy as np
+import onnx
+
+VARIANTS = ('int8', 'fp16', 'optimized')
+BASE_VARIANT = 'fp32'
+
+# Variant served by default, and per model ("SYMBOL:timeframe=variant", comma-separated)
+MODEL_VARIANT = os.getenv('MODEL_VARIANT', BASE_VARIANT)
+MODEL_VARIANTS = dict(item.split('=', 1) for item in os.getenv('MODEL_VARIANTS', '').split(',') if '=' in item)
+
+
+# Variant to serve for a symbol/timeframe
+def served_variant(symbol, timeframe):
+    return MODEL_VARIANTS.get(f"{symbol}:{timeframe}", MODEL_VARIANT)
+
+
+# Path of the stateful step model exported next to a model by train_lstm.py
+def step_model_path(model_path):
+    return os.path.splitext(model_path)[0] + '_step.onnx'
+
+
+# Path of a variant of a model (the model itself for fp32)
+def variant_path(model_path, variant):
+    if variant == BASE_VARIANT:
+        return model_path
+    return os.path.splitext(model_path)[0] + f"-{variant}.onnx"
+
+
+# Path of the accuracy report of the variants of a model
+def report_path(model_path):
+    return os.path.splitext(model_path)[0] + '.variants.json'
+
+
+# Reorder the nodes of a graph so that every input is produced before it is used
+# (the float16 conversion appends its Cast nodes at the end)
+def _sort_nodes(graph):
+    produced = {value.name for value in graph.input} | {init.name for init in graph.initializer} | {''}
+    pending, ordered = list(graph.node), []
+    while pending:
+        ready = [node for node in pending if all(name in produced for name in node.input)]
+        if not ready:
+            raise ValueError("The graph has a cycle or an undefined input.")
+        for node in ready:
+            produced.update(node.output)
+        ordered += ready
+        ready_ids = {id(node) for node in ready}
+        pending = [node for node in pending if id(node) not in ready_ids]
+    nodes = []
+    for node in ordered:
+        copy = onnx.NodeProto()
+        copy.CopyFrom(node)
+        nodes.append(copy)
+    del graph.node[:]
+    graph.node.extend(nodes)
+
+
+def _build_int8(source, destination):
+    from onnxruntime.quantization import quantize_dynamic, QuantType
+    quantize_dynamic(source, destination, weight_type=QuantType.QInt8)
+
+
+def _build_fp16(source, destination):
+    from onnxruntime.transformers.float16 import convert_float_to_float16
+    model = convert_float_to_float16(onnx.load(source), keep_io_types=True)
+    _sort_nodes(model.graph)
+    onnx.save(model, destination)
+
+
+def _build_optimized(source, destination):
+    import onnxruntime as ort
+    options = ort.SessionOptions()
+    options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_EXTENDED
+    options.optimized_model_filepath = destination
+    ort.InferenceSession(source, options, providers=['CPUExecutionProvider'])
+
+
+# Variant name -> function(source path, destination path)
+BUILDERS = {
+    'int8': _build_int8,
+    'fp16': _build_fp16,
+    'optimized': _build_optimized,
+}
+
+
+def build_variants(model_path, variants=VARIANTS):
+    """
+    Write the variants of a model and of its step model (derived from the model if it was
+    exported without one). Returns {variant: path} of the variants built.
+    """
+    step_path = step_model_path(model_path)
+    derived = None
+    if not os.path.exists(step_path):
+        try:
+            from .onnx_rollout import derive_step_model
+        except ImportError:
+            from onnx_rollout import derive_step_model
+        derived = step_path + '.derived'
+        onnx.save(derive_step_model(model_path), derived)
+
+    built = {}
+    try:
+        for variant in variants:
+            if variant not in BUILDERS:
+                raise ValueError(f"Unknown model variant {variant} (expected one of {', '.join(BUILDERS)}).")
+            path = variant_path(model_path, variant)
+            BUILDERS[variant](model_path, path)
+            BUILDERS[variant](derived or step_path, step_model_path(path))
+            built[variant] = path
+    finally:
+        if derived:
+            os.remove(derived)
+    return built
+
+
+# One-step forecasts of a model for windows (N, L, 1), in batches (one by one for a fixed batch of 1)
+def _forecast(session, windows, batch_size=256):
+    batch_dimension = session.get_inputs()[0].shape[0]
+    if isinstance(batch_dimension, int):
+        batch_size = batch_dimension
+    return np.concatenate([session.run(None, {'input': windows[i:i + batch_size]})[0][:, 0]
+                           for i in range(0, len(windows), batch_size)])
+
+
+def accuracy_report(model_path, windows, targets, variants=VARIANTS, price_scale=1.0, timing_windows=50):
+    """
+    Compare the one-step forecasts of the variants of a model with the float32 model on
+    held-out windows (N, L, 1) and their next scaled values `targets` (N,).
+
+    Errors are in price units if `price_scale` (price range / scaled range) is given.
+    Returns {variant: {'mae_vs_fp32', 'max_error_vs_fp32', 'direction_agreement', 'mae',
+    'seconds_per_window', 'size_bytes'}}.
+    """
+    import onnxruntime as ort
+    windows = np.ascontiguousarray(windows, dtype=np.float32)
+    targets = np.asarray(targets, dtype=np.float64).ravel()
+    last_values = windows[:, -1, 0].astype(np.float64)
+
+    report, baseline = {}, None
+    for variant in (BASE_VARIANT,) + tuple(variants):
+        path = variant_path(model_path, variant)
+        if not os.path.exists(path):
+            continue
+        try:
+            session = ort.InferenceSession(path, providers=['CPUExecutionProvider'])
+            predictions = _forecast(session, windows).astype(np.float64)
+        except Exception as e:
+            # e.g. a variant the execution provider cannot run
+            if variant == BASE_VARIANT:
+                raise
+            report[variant] = {'error': str(e)}
+            continue
+
+        started = time.perf_counter()
+        for i in range(min(timing_windows, len(windows))):
+            session.run(None, {'input': windows[i:i + 1]})
+        seconds = (time.perf_counter() - started) / max(min(timing_windows, len(windows)), 1)
+
+        if variant == BASE_VARIANT:
+            baseline = predictions
+        report[variant] = {
+            'mae_vs_fp32': float(np.mean(np.abs(predictions - baseline)) * price_scale),
+            'max_error_vs_fp32': float(np.max(np.abs(predictions - baseline)) * price_scale),
+            # Share of the windows where the variant forecasts the same direction as fp32
+            'direction_agreement': float(np.mean(np.sign(predictions - last_values) == np.sign(baseline - last_values))),
+            'mae': float(np.mean(np.abs(predictions - targets)) * price_scale),
+            'seconds_per_window': seconds,
+            'size_bytes': os.path.getsize(path),
+        }
+    return report
+
+
+# Write the accuracy report of a model's variants next to it
+def save_report(model_path, report, **details):
+    with open(report_path(model_path), 'w') as f:
+        json.dump({**details, 'variants': report}, f, indent=2)
+
+
+def format_report(report):
+    lines = [f"{'variant':<10} {'mae vs fp32':>12} {'max error':>12} {'direction':>10} {'mae':>12} {'ms/window':>10} {'size':>10}"]
+    for variant, values in report.items():
+        if 'error' in values:
+            lines.append(f"{variant:<10} failed: {values['error']}")
+            continue
+        lines.append(f"{variant:<10} {values['mae_vs_fp32']:>12.6f} {values['max_error_vs_fp32']:>12.6f} {values['direction_agreement']:>10.2%} "
+                     f"{values['mae']:>12.6f} {values['seconds_per_window'] * 1000:>10.3f} {values['size_bytes'] / 1024:>8.0f}kB")
+    return '\n'.join(lines)
+
+
+# Index of the first close of the held-out windows (the last `holdout` share of the sliding windows)
+def holdout_start(n_closes, sequence_length, holdout):
+    n_windows = n_closes - sequence_length
+    return n_windows - max(int(n_windows * holdout), 1)
+
+
+# Held-out windows of a series of closes: the last `holdout` share of the windows, scaled like the model
+def holdout_windows(closes, sequence_length, holdout, scaler):
+    scaled = scaler.transform(np.asarray(closes, dtype=np.float64).reshape(-1, 1)).astype(np.float32)
+    windows = np.lib.stride_tricks.sliding_window_view(scaled[:, 0], sequence_length + 1)
+    windows = windows[holdout_start(len(scaled), sequence_length, holdout):]
+    return windows[:, :-1, np.newaxis], windows[:, -1]
+
+
+# Price units per scaled unit of a MinMaxScaler
+def price_scale(scaler):
+    return float(scaler.data_range_[0] / (scaler.feature_range[1] - scaler.feature_range[0]))
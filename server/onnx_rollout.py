@@ -0,0 +1,247 @@
+# /server/onnx_rollout.py
+#
+# Graph rewriting helpers that move the autoregressive forecast loop inside ONNX,
+# so a whole multi-step forecast is a single session.run call.
+
+import onnx
+from onnx import helper, TensorProto
+
+# Input carrying the number of steps to forecast
+STEPS_INPUT = 'steps'
+# State inputs/outputs of a single-step model: (input, h0, c0) -> (output, hn, cn)
+STATE_INPUTS = ('h0', 'c0')
+STATE_OUTPUTS = ('hn', 'cn')
+# Output of the rollout model: (steps, batch, 1) scaled predictions
+ROLLOUT_OUTPUT = 'predictions'
+
+
+# Load a model from a path, or pass a ModelProto through
+def _load(model):
+    return onnx.load(model) if isinstance(model, str) else model
+
+
+# Copy the nodes of `graph` into a subgraph namespace: every value produced inside the
+# graph gets `prefix`, graph inputs are mapped with `inputs`, initializers stay outer-scope
+def _copy_nodes(graph, prefix, inputs):
+    initializers = {init.name for init in graph.initializer}
+    names = dict(inputs)
+
+    def rename(name):
+        if not name or name in initializers:
+            return name
+        if name not in names:
+            names[name] = prefix + name
+        return names[name]
+
+    nodes = []
+    for node in graph.node:
+        copy = onnx.NodeProto()
+        copy.CopyFrom(node)
+        copy.name = prefix + node.name if node.name else ''
+        copy.input[:] = [rename(name) for name in node.input]
+        copy.output[:] = [rename(name) for name in node.output]
+        nodes.append(copy)
+    return nodes, rename
+
+
+def build_rollout_model(base_model):
+    """
+    Wrap a one-step forecaster (input (B, L, 1) -> output (B, 1)) in an ONNX Loop that
+    slides the window and feeds each prediction back, like the Python rollout did.
+
+    Inputs: the base model input and `steps` (int64 scalar).
+    Output: `predictions` of shape (steps, B, 1).
+    """
+    base = _load(base_model)
+    graph = base.graph
+    input_name = graph.input[0].name
+    output_name = graph.output[0].name
+
+    # Loop body: (iteration, condition, window) -> (condition, next window, prediction)
+    body_nodes, rename = _copy_nodes(graph, 'step/', {input_name: 'window_in'})
+    prediction = rename(output_name)
+    body_nodes += [
+        helper.make_node('Identity', ['cond_in'], ['cond_out']),
+        helper.make_node('Slice', ['window_in', 'rollout/one', 'rollout/max', 'rollout/one'], ['rollout/tail']),
+        helper.make_node('Reshape', [prediction, 'rollout/step_shape'], ['rollout/step']),
+        helper.make_node('Concat', ['rollout/tail', 'rollout/step'], ['window_out'], axis=1),
+        helper.make_node('Identity', [prediction], ['prediction_out']),
+    ]
+    body = helper.make_graph(
+        body_nodes,
+        'rollout_step',
+        [
+            helper.make_tensor_value_info('iteration', TensorProto.INT64, []),
+            helper.make_tensor_value_info('cond_in', TensorProto.BOOL, []),
+            helper.make_tensor_value_info('window_in', TensorProto.FLOAT, None),
+        ],
+        [
+            helper.make_tensor_value_info('cond_out', TensorProto.BOOL, []),
+            helper.make_tensor_value_info('window_out', TensorProto.FLOAT, None),
+            helper.make_tensor_value_info('prediction_out', TensorProto.FLOAT, None),
+        ],
+    )
+
+    loop = helper.make_node('Loop', [STEPS_INPUT, '', input_name], ['final_window', ROLLOUT_OUTPUT], body=body)
+    initializers = list(graph.initializer) + [
+        helper.make_tensor('rollout/one', TensorProto.INT64, [1], [1]),
+        helper.make_tensor('rollout/max', TensorProto.INT64, [1], [2 ** 62]),
+        helper.make_tensor('rollout/step_shape', TensorProto.INT64, [3], [-1, 1, 1]),
+    ]
+    rollout_graph = helper.make_graph(
+        [loop],
+        f'{graph.name}_rollout',
+        [graph.input[0], helper.make_tensor_value_info(STEPS_INPUT, TensorProto.INT64, [])],
+        [helper.make_tensor_value_info(ROLLOUT_OUTPUT, TensorProto.FLOAT, ['steps', None, 1])],
+        initializer=initializers,
+    )
+
+    model = helper.make_model(rollout_graph, opset_imports=base.opset_import, producer_name='geotrade-rollout')
+    model.ir_version = base.ir_version
+    return model
+
+
+# Keep only the nodes needed to compute the graph outputs
+def _prune(graph):
+    needed = {output.name for output in graph.output}
+    kept = []
+    for node in reversed(graph.node):
+        if any(name in needed for name in node.output):
+            kept.append(node)
+            needed.update(name for name in node.input if name)
+    del graph.node[:]
+    graph.node.extend(reversed(kept))
+
+
+# LSTM node of a graph (float, or quantized by model_variants.py)
+def _lstm_node(graph):
+    for node in graph.node:
+        if node.op_type in ('LSTM', 'DynamicQuantizeLSTM'):
+            return node
+    raise ValueError("The model does not contain an LSTM node.")
+
+
+# Hidden size of the LSTM of a model
+def lstm_hidden_size(model):
+    node = _lstm_node(_load(model).graph)
+    return next(helper.get_attribute_value(a) for a in node.attribute if a.name == 'hidden_size')
+
+
+def derive_step_model(base_model):
+    """
+    Turn a one-step forecaster whose LSTM starts from a zero state into a stateful
+    step model (input, h0, c0) -> (output, hn, cn), with dynamic batch and sequence
+    axes. This is the same signature as the step model exported by train_lstm.py,
+    for models that were exported before it existed.
+    """
+    model = onnx.ModelProto()
+    model.CopyFrom(_load(base_model))
+    graph = model.graph
+    lstm = _lstm_node(graph)
+    hidden_size = lstm_hidden_size(model)
+
+    # LSTM inputs: X, W, R, B, sequence_lens, initial_h, initial_c
+    inputs = list(lstm.input) + [''] * (7 - len(lstm.input))
+    inputs[5], inputs[6] = STATE_INPUTS
+    lstm.input[:] = inputs
+    outputs = list(lstm.output) + [''] * (3 - len(lstm.output))
+    renamed = {old: new for old, new in zip(outputs[1:3], STATE_OUTPUTS) if old}
+    outputs[1], outputs[2] = STATE_OUTPUTS
+    lstm.output[:] = outputs
+    for node in graph.node:
+        node.input[:] = [renamed.get(name, name) for name in node.input]
+
+    for dim, name in zip(graph.input[0].type.tensor_type.shape.dim, ('batch', 'sequence')):
+        dim.dim_param = name
+    graph.input.extend([helper.make_tensor_value_info(name, TensorProto.FLOAT, [1, 'batch', hidden_size]) for name in STATE_INPUTS])
+    for dim in graph.output[0].type.tensor_type.shape.dim[:1]:
+        dim.dim_param = 'batch'
+    graph.output.extend([helper.make_tensor_value_info(name, TensorProto.FLOAT, [1, 'batch', hidden_size]) for name in STATE_OUTPUTS])
+
+    # The zero initial state computed from the input shape is no longer used
+    _prune(graph)
+    return model
+
+
+def build_stateful_rollout_model(step_model):
+    """
+    Forecast with a stateful step model: the LSTM state is warmed once over the input
+    window, then each step only advances it by one timestep with the previous prediction.
+    This is O(window + steps) LSTM work instead of O(window * steps) for the sliding rollout.
+
+    Inputs: `input` (B, L, 1) and `steps` (int64 scalar, >= 1).
+    Output: `predictions` of shape (steps, B, 1).
+    """
+    step = _load(step_model)
+    graph = step.graph
+    input_name = graph.input[0].name
+    output_name = graph.output[0].name
+    hidden_size = lstm_hidden_size(step)
+
+    # Zero state of shape (1, B, hidden)
+    nodes = [
+        helper.make_node('Shape', [input_name], ['state/input_shape']),
+        helper.make_node('Gather', ['state/input_shape', 'state/zero_index'], ['state/batch']),
+        helper.make_node('Concat', ['state/one', 'state/batch', 'state/hidden'], ['state/shape'], axis=0),
+        helper.make_node('ConstantOfShape', ['state/shape'], ['state/zeros'],
+                         value=helper.make_tensor('state/zero', TensorProto.FLOAT, [1], [0.0])),
+    ]
+
+    # Warm-up over the window: first prediction and the state after the last observed value
+    warm_nodes, warm = _copy_nodes(graph, 'warm/', {input_name: input_name, STATE_INPUTS[0]: 'state/zeros', STATE_INPUTS[1]: 'state/zeros'})
+    nodes += warm_nodes
+
+    # Loop body: feed the previous prediction as the next single-timestep input
+    body_nodes, body = _copy_nodes(graph, 'step/', {input_name: 'rollout/x', STATE_INPUTS[0]: 'h_in', STATE_INPUTS[1]: 'c_in'})
+    body_nodes = [helper.make_node('Reshape', ['prediction_in', 'rollout/step_shape'], ['rollout/x'])] + body_nodes + [
+        helper.make_node('Identity', ['cond_in'], ['cond_out']),
+        helper.make_node('Identity', [body(output_name)], ['prediction_out']),
+        helper.make_node('Identity', [body(STATE_OUTPUTS[0])], ['h_out']),
+        helper.make_node('Identity', [body(STATE_OUTPUTS[1])], ['c_out']),
+        helper.make_node('Identity', [body(output_name)], ['prediction_scan']),
+    ]
+    loop_body = helper.make_graph(
+        body_nodes,
+        'stateful_step',
+        [
+            helper.make_tensor_value_info('iteration', TensorProto.INT64, []),
+            helper.make_tensor_value_info('cond_in', TensorProto.BOOL, []),
+            helper.make_tensor_value_info('prediction_in', TensorProto.FLOAT, None),
+            helper.make_tensor_value_info('h_in', TensorProto.FLOAT, None),
+            helper.make_tensor_value_info('c_in', TensorProto.FLOAT, None),
+        ],
+        [
+            helper.make_tensor_value_info('cond_out', TensorProto.BOOL, []),
+            helper.make_tensor_value_info('prediction_out', TensorProto.FLOAT, None),
+            helper.make_tensor_value_info('h_out', TensorProto.FLOAT, None),
+            helper.make_tensor_value_info('c_out', TensorProto.FLOAT, None),
+            helper.make_tensor_value_info('prediction_scan', TensorProto.FLOAT, None),
+        ],
+    )
+
+    nodes += [
+        helper.make_node('Sub', [STEPS_INPUT, 'state/one_scalar'], ['rollout/remaining']),
+        helper.make_node('Loop', ['rollout/remaining', '', warm(output_name), warm(STATE_OUTPUTS[0]), warm(STATE_OUTPUTS[1])],
+                         ['rollout/last', 'rollout/h', 'rollout/c', 'rollout/next'], body=loop_body),
+        helper.make_node('Unsqueeze', [warm(output_name), 'state/zero_index'], ['rollout/first']),
+        helper.make_node('Concat', ['rollout/first', 'rollout/next'], [ROLLOUT_OUTPUT], axis=0),
+    ]
+
+    initializers = list(graph.initializer) + [
+        helper.make_tensor('state/zero_index', TensorProto.INT64, [1], [0]),
+        helper.make_tensor('state/one', TensorProto.INT64, [1], [1]),
+        helper.make_tensor('state/hidden', TensorProto.INT64, [1], [hidden_size]),
+        helper.make_tensor('state/one_scalar', TensorProto.INT64, [], [1]),
+        helper.make_tensor('rollout/step_shape', TensorProto.INT64, [3], [-1, 1, 1]),
+    ]
+    rollout_graph = helper.make_graph(
+        nodes,
+        f'{graph.name}_stateful_rollout',
+        [graph.input[0], helper.make_tensor_value_info(STEPS_INPUT, TensorProto.INT64, [])],
+        [helper.make_tensor_value_info(ROLLOUT_OUTPUT, TensorProto.FLOAT, ['steps', None, 1])],
+        initializer=initializers,
+    )
+
+    model = helper.make_model(rollout_graph, opset_imports=step.opset_import, producer_name='geotrade-rollout')
+    model.ir_version = step.ir_version
+    return model
@@ -1,14 +1,17 @@
 import time
+import logging
 import threading
 import pandas as pd
 from sklearn.metrics import confusion_matrix, accuracy_score
 from . import socketio
 
+logger = logging.getLogger(__name__)
+
 # Performance Evaluation and Logging
-def evaluate_performance(actual_signals, predicted_signals):
+def evaluate_performance(actual_signals, predicted_signals, emit=True):
     """
     Save model performance metrics such as confusion matrix and accuracy to a file.
-    Also emit the performance data to the frontend for real-time visualization.
+    Also emit the performance data to the frontend for real-time visualization (if `emit`).
     """
     # Calculate confusion matrix and accuracy
     cm = confusion_matrix(actual_signals, predicted_signals)
@@ -21,9 +24,15 @@ def evaluate_performance(actual_signals, predicted_signals):
         f.write(f"Logged at: {time.strftime('%Y-%m-%d %H:%M:%S')}\n")
         f.write("=" * 40 + "\n")
 
-    print(f"Performance saved. Accuracy: {accuracy:.2f}")
+    logger.info("Performance saved. Accuracy: %.2f", accuracy)
+
+    if emit:
+        emit_forecast_accuracy(accuracy)
 
-    # Emit the performance data to the frontend for plotting
+# Emit an accuracy value to the frontend's performance chart
+def emit_forecast_accuracy(accuracy):
+    if accuracy is None:
+        return
     socketio.emit('update_performance', {
         'accuracy': accuracy,
         'timestamp': time.strftime('%Y-%m-%d %H:%M:%S')
@@ -35,7 +44,7 @@ def save_actual_signals(signals):
     """
     df = pd.DataFrame({'signal': signals})
     df.to_csv('/models/actual_signals.csv', index=False)
-    print("Actual signals saved to actual_signals.csv")
+    logger.debug("Actual signals saved to actual_signals.csv")
 
 def save_predicted_signals(signals):
     """
@@ -43,7 +52,7 @@ def save_predicted_signals(signals):
     """
     df = pd.DataFrame({'signal': signals})
     df.to_csv('/models/predicted_signals.csv', index=False)
-    print("Predicted signals saved to predicted_signals.csv")
+    logger.debug("Predicted signals saved to predicted_signals.csv")
 
 # Function to get actual signals from the CSV file
 def get_actual_signals():
@@ -56,7 +65,7 @@ def get_actual_signals():
         actual_signals = df_actual['signal'].tolist()
         return actual_signals
     except FileNotFoundError:
-        print("Actual signals file not found.")
+        logger.warning("Actual signals file not found.")
         return []
 
 # Function to get predicted signals from the CSV file
@@ -70,16 +79,17 @@ def get_predicted_signals():
         predicted_signals = df_predicted['signal'].tolist()
         return predicted_signals
     except FileNotFoundError:
-        print("Predicted signals file not found.")
+        logger.warning("Predicted signals file not found.")
         return []
 
 # Periodic saving every 12 hours
 def save_performance_periodically():
     while True:
-        print("Starting performance evaluation...")
+        logger.info("Starting performance evaluation...")
         actual_signals = get_actual_signals()
         predicted_signals = get_predicted_signals()
-        evaluate_performance(actual_signals, predicted_signals)
+        # Logged only: the dashboard chart shows the forecast accuracy of the compute loop
+        evaluate_performance(actual_signals, predicted_signals, emit=False)
         time.sleep(12 * 60 * 60)  # 12 hours
 
 # Start the periodic saving in a separate thread
@@ -0,0 +1,213 @@
+# /server/prediction_journal.py
+#
+# Journal of the model forecasts: one row per forecast (symbol, timeframe, time of the last
+# bar, last close and the whole horizon as an array column) in columnar segments
+# (see columnar_store). Rows are queued by the pipeline and written in batches by a
+# background thread; segments are rolled by size and age so no file grows without bound.
+
+import os
+import time
+import queue
+import atexit
+import threading
+import logging
+import numpy as np
+import pandas as pd
+from .columnar_store import ColumnarStore, to_nanoseconds
+from .markets import MODEL_DIR
+
+logger = logging.getLogger(__name__)
+
+JOURNAL_DIR = os.getenv('PREDICTION_JOURNAL_DIR', os.path.join(MODEL_DIR, 'predictions'))
+# Seconds between two flushes of the queued rows
+JOURNAL_FLUSH_INTERVAL = float(os.getenv('PREDICTION_JOURNAL_FLUSH_INTERVAL', '5'))
+# A new segment is started when the current one reaches this size or age
+JOURNAL_SEGMENT_BYTES = int(os.getenv('PREDICTION_JOURNAL_SEGMENT_BYTES', str(64 * 1024 * 1024)))
+JOURNAL_SEGMENT_SECONDS = float(os.getenv('PREDICTION_JOURNAL_SEGMENT_SECONDS', str(24 * 60 * 60)))
+
+# Forecast steps stored per row (shorter forecasts are padded with NaN)
+HORIZON = 60
+
+JOURNAL_SCHEMA = [
+    ('timestamp', '<i8', ()),    # Time of the forecast (ns since the epoch, UTC)
+    ('bar_time', '<i8', ()),     # Time of the last bar given to the model
+    ('symbol', 'S16', ()),
+    ('timeframe', 'S8', ()),
+    ('last_close', '<f8', ()),
+    ('horizon', '<f8', (HORIZON,)),
+]
+
+
+class PredictionJournal:
+    """
+    Buffered writer of the forecast journal.
+
+    `log()` only queues the row; a daemon thread appends the queued rows to the current
+    segment every JOURNAL_FLUSH_INTERVAL seconds. Segments are directories named after
+    their creation time and process id, so several processes can share JOURNAL_DIR.
+    """
+
+    def __init__(self, path=JOURNAL_DIR, flush_interval=JOURNAL_FLUSH_INTERVAL,
+                 segment_bytes=JOURNAL_SEGMENT_BYTES, segment_seconds=JOURNAL_SEGMENT_SECONDS):
+        self.path = path
+        self.flush_interval = flush_interval
+        self.segment_bytes = segment_bytes
+        self.segment_seconds = segment_seconds
+        self._queue = queue.Queue()
+        self._segment = None
+        self._segment_started = None
+        self._last_timestamp = 0
+        self._write_lock = threading.Lock()
+        self._thread = None
+        self._thread_lock = threading.Lock()
+
+    def log(self, symbol, timeframe, predictions, bar_time=None, last_close=None):
+        horizon = np.full(HORIZON, np.nan)
+        values = np.asarray(predictions, dtype=np.float64)[:HORIZON]
+        horizon[:len(values)] = values
+        row = (time.time_ns(), to_nanoseconds(bar_time) if bar_time is not None else 0, symbol, timeframe,
+               np.nan if last_close is None else float(last_close), horizon)
+        self._queue.put(row)
+        self._start()
+
+    def _start(self):
+        if self._thread is not None:
+            return
+        with self._thread_lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._flush_loop, daemon=True)
+                self._thread.start()
+                atexit.register(self.flush)
+
+    def _flush_loop(self):
+        while True:
+            time.sleep(self.flush_interval)
+            try:
+                self.flush()
+            except Exception as e:
+                logger.error("Flushing the prediction journal failed: %s", e)
+
+    # Segment receiving the next rows, rolled by size and age
+    def _current_segment(self):
+        if self._segment is not None:
+            size = sum(os.path.getsize(os.path.join(self._segment.path, name)) for name in os.listdir(self._segment.path))
+            if size < self.segment_bytes and time.time() - self._segment_started < self.segment_seconds:
+                return self._segment
+
+        self._segment_started = time.time()
+        name = f"{time.strftime('%Y%m%dT%H%M%S', time.gmtime(self._segment_started))}-{os.getpid()}.cols"
+        self._segment = ColumnarStore(os.path.join(self.path, name), JOURNAL_SCHEMA, key='timestamp').open_for_append()
+        logger.info("Prediction journal segment %s started.", self._segment.path)
+        return self._segment
+
+    # Write every queued row in one append
+    def flush(self):
+        rows = []
+        while True:
+            try:
+                rows.append(self._queue.get_nowait())
+            except queue.Empty:
+                break
+        if not rows:
+            return 0
+
+        with self._write_lock:
+            # Keys must be strictly increasing: bump the forecasts logged within the same nanosecond
+            timestamps = np.array([row[0] for row in rows], dtype=np.int64)
+            timestamps[0] = max(timestamps[0], self._last_timestamp + 1)
+            steps = np.arange(len(rows))
+            timestamps = np.maximum.accumulate(timestamps - steps) + steps
+            self._last_timestamp = int(timestamps[-1])
+            self._current_segment().append({
+                'timestamp': timestamps,
+                'bar_time': np.array([row[1] for row in rows], dtype=np.int64),
+                'symbol': np.array([row[2] for row in rows], dtype='S16'),
+                'timeframe': np.array([row[3] for row in rows], dtype='S8'),
+                'last_close': np.array([row[4] for row in rows], dtype=np.float64),
+                'horizon': np.stack([row[5] for row in rows]),
+            })
+        return len(rows)
+
+
+# Columns of an empty read
+def empty_columns():
+    return {name: np.empty((0, *shape), dtype=dtype) for name, dtype, shape in JOURNAL_SCHEMA}
+
+
+def _segments(path):
+    if not os.path.isdir(path):
+        return []
+    return sorted(os.path.join(path, name) for name in os.listdir(path) if name.endswith('.cols'))
+
+
+# Segment path -> [read-only store, rows, first key, last key] (segments are append-only)
+_segment_ranges = {}
+_segment_ranges_lock = threading.Lock()
+
+
+# Read-only stores of the segments with their key range, only re-read when a segment grew
+def _segment_range(segment_path):
+    with _segment_ranges_lock:
+        entry = _segment_ranges.get(segment_path)
+        if entry is None:
+            try:
+                entry = _segment_ranges[segment_path] = [ColumnarStore(segment_path), 0, None, None]
+            except (FileNotFoundError, ValueError):
+                # Segment being created by another process (meta.json not written yet)
+                return None, 0, None, None
+        store = entry[0]
+        rows = len(store)
+        if rows != entry[1]:
+            keys = store.column(store.key, rows)
+            entry[1:] = [rows, int(keys[0]), int(keys[rows - 1])]
+        return tuple(entry)
+
+
+def read_predictions(start=None, end=None, symbol=None, timeframe=None, path=JOURNAL_DIR):
+    """
+    Read the forecasts logged between two times (inclusive) as {column: array}, sorted by
+    forecast time. Segments outside the range are skipped from their cached key range, and
+    only the rows in range are read from the others (memory-mapped).
+    """
+    start_ns, end_ns = to_nanoseconds(start), to_nanoseconds(end)
+    parts = []
+    segments = _segments(path)
+    with _segment_ranges_lock:
+        for segment_path in [p for p in _segment_ranges if os.path.dirname(p) == path and p not in segments]:
+            del _segment_ranges[segment_path]
+    for segment_path in segments:
+        segment, rows, first, last = _segment_range(segment_path)
+        if not rows or (start_ns is not None and last < start_ns) or (end_ns is not None and first > end_ns):
+            continue
+        arrays = segment.read(start_ns, end_ns)
+        if len(arrays['timestamp']):
+            parts.append({name: np.array(values) for name, values in arrays.items()})
+
+    if not parts:
+        return empty_columns()
+
+    columns = {name: np.concatenate([part[name] for part in parts]) for name, _, _ in JOURNAL_SCHEMA}
+    keep = np.ones(len(columns['timestamp']), dtype=bool)
+    if symbol is not None:
+        keep &= columns['symbol'] == symbol.encode()
+    if timeframe is not None:
+        keep &= columns['timeframe'] == timeframe.encode()
+    order = np.argsort(columns['timestamp'][keep], kind='stable')
+    return {name: values[keep][order] for name, values in columns.items()}
+
+
+# Forecasts as a DataFrame (one row per forecast, the horizon as a list)
+def read_predictions_frame(start=None, end=None, symbol=None, timeframe=None, path=JOURNAL_DIR):
+    columns = read_predictions(start, end, symbol, timeframe, path)
+    return pd.DataFrame({
+        'timestamp': pd.to_datetime(columns['timestamp'], utc=True),
+        'bar_time': pd.to_datetime(columns['bar_time'], utc=True),
+        'symbol': columns['symbol'].astype(str),
+        'timeframe': columns['timeframe'].astype(str),
+        'last_close': columns['last_close'],
+        'horizon': list(columns['horizon']),
+    })
+
+
+# Journal shared by the whole process
+journal = PredictionJournal()
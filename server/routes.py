@@ -1,7 +1,15 @@
-from flask import render_template
+import logging
+from flask import render_template, request, Response
+from flask_socketio import emit, join_room, leave_room, rooms
 from . import app, socketio
 from .performance_evaluation import start_background_performance_saving
-from .data_request import handle_data_request
+from .compute_loop import start_compute_loop, room_name, get_latest, COMPUTE_MODE, DEFAULT_SYMBOL, DEFAULT_TIMEFRAME
+from .markets import resolve_symbol, check_market
+from .data_request import handle_data_request, emit_snapshot
+from .metrics import render as render_metrics
+from .training_jobs import start_training_job, cancel_training_job, TrainingInProgress
+
+logger = logging.getLogger(__name__)
 
 # Initialization variable
 initialized = False
@@ -9,8 +17,11 @@ initialized = False
 def initialize():
     global initialized
     if not initialized:
-        print("Initializing background tasks...")
-        start_background_performance_saving()
+        # With an external compute service, the background tasks run there
+        if COMPUTE_MODE != 'external':
+            logger.info("Initializing background tasks...")
+            start_background_performance_saving()
+            start_compute_loop()
         initialized = True
 
 # Ensure initialization happens only once
@@ -21,10 +32,70 @@ def before_request():
 # Serve the index.html
 @app.route('/')
 def index():
-    print("Serving index.html")
+    logger.debug("Serving index.html")
     return render_template('index.html')
 
-# Handle data requests for chart updates
+# Pipeline stage latencies and counters (Prometheus text format)
+@app.route('/metrics')
+def metrics():
+    return Response(render_metrics(), mimetype='text/plain; version=0.0.4')
+
+# Subscribe new clients to the default market room
+@socketio.on('connect')
+def connect():
+    initialize()
+    join_room(room_name())
+
+# Move the client to the room of the requested symbol/timeframe and send the latest result
+@socketio.on('subscribe')
+def subscribe(data=None):
+    data = data or {}
+    symbol = resolve_symbol(data.get('symbol', DEFAULT_SYMBOL))
+    timeframe = data.get('timeframe', DEFAULT_TIMEFRAME)
+    try:
+        check_market(symbol, timeframe)
+    except ValueError as e:
+        emit('market_error', {'symbol': symbol, 'timeframe': timeframe, 'error': str(e)})
+        return
+    room = room_name(symbol, timeframe)
+
+    for joined in rooms():
+        if joined not in (room, request.sid):
+            leave_room(joined)
+    join_room(room)
+
+    # Full snapshot, the compute loop then sends deltas to the room
+    payload = get_latest(room)
+    if payload is not None:
+        emit_snapshot(payload)
+
+# Handle data requests for chart updates (answered from the shared compute loop's cache, or by a background job).
+# `seq` is the last payload the client has: nothing is sent if it is still the latest one
 @socketio.on('request_data')
-def request_data():
-    handle_data_request()
+def request_data(data=None):
+    data = data or {}
+    symbol = resolve_symbol(data.get('symbol', DEFAULT_SYMBOL))
+    timeframe = data.get('timeframe', DEFAULT_TIMEFRAME)
+    try:
+        handle_data_request(symbol, timeframe, request.sid, data.get('seq'))
+    except ValueError as e:
+        emit('market_error', {'symbol': symbol, 'timeframe': timeframe, 'error': str(e)})
+
+# Queue the training of a model ({'model': symbol or slug, 'timeframe'}); progress is streamed to this client
+@socketio.on('start_training')
+def start_training(data=None):
+    data = data or {}
+    symbol = resolve_symbol(data.get('model') or data.get('symbol', DEFAULT_SYMBOL))
+    timeframe = data.get('timeframe', DEFAULT_TIMEFRAME)
+    try:
+        start_training_job(symbol, timeframe, request.sid)
+    except (TrainingInProgress, ValueError) as e:
+        emit('training_failed', {'symbol': symbol, 'timeframe': timeframe, 'error': str(e)})
+
+# Cancel a training started by this client
+@socketio.on('cancel_training')
+def cancel_training(data=None):
+    data = data or {}
+    symbol = resolve_symbol(data.get('model') or data.get('symbol', DEFAULT_SYMBOL))
+    if not cancel_training_job(symbol, data.get('timeframe', DEFAULT_TIMEFRAME), request.sid):
+        emit('training_failed', {'symbol': symbol, 'timeframe': data.get('timeframe', DEFAULT_TIMEFRAME), 'error': 'No training of this model to cancel.'})
@@ -0,0 +1,117 @@
+# /server/session_registry.py
+
+import os
+import hashlib
+import threading
+import logging
+import onnxruntime as ort
+
+logger = logging.getLogger(__name__)
+
+# Session settings (all optional, ONNX Runtime defaults otherwise)
+ORT_INTRA_OP_THREADS = int(os.getenv('ORT_INTRA_OP_THREADS', '0'))  # 0 = ORT default
+ORT_INTER_OP_THREADS = int(os.getenv('ORT_INTER_OP_THREADS', '0'))
+ORT_GRAPH_OPTIMIZATION = os.getenv('ORT_GRAPH_OPTIMIZATION', 'all')  # disabled, basic, extended, all
+ORT_EXECUTION_MODE = os.getenv('ORT_EXECUTION_MODE', 'sequential')  # sequential, parallel
+ORT_PROVIDERS = [p for p in os.getenv('ORT_PROVIDERS', 'CPUExecutionProvider').split(',') if p]
+# Directory where optimized graphs are saved and reused on the next cold start (disabled if empty)
+ORT_OPTIMIZED_MODEL_DIR = os.getenv('ORT_OPTIMIZED_MODEL_DIR', '')
+
+GRAPH_OPTIMIZATION_LEVELS = {
+    'disabled': ort.GraphOptimizationLevel.ORT_DISABLE_ALL,
+    'basic': ort.GraphOptimizationLevel.ORT_ENABLE_BASIC,
+    'extended': ort.GraphOptimizationLevel.ORT_ENABLE_EXTENDED,
+    'all': ort.GraphOptimizationLevel.ORT_ENABLE_ALL,
+}
+
+EXECUTION_MODES = {
+    'sequential': ort.ExecutionMode.ORT_SEQUENTIAL,
+    'parallel': ort.ExecutionMode.ORT_PARALLEL,
+}
+
+# (path, variant) -> (mtimes, session)
+_sessions = {}
+_sessions_lock = threading.Lock()
+
+
+# Build the SessionOptions from the environment settings
+def make_session_options(optimization=None):
+    options = ort.SessionOptions()
+    options.intra_op_num_threads = ORT_INTRA_OP_THREADS
+    options.inter_op_num_threads = ORT_INTER_OP_THREADS
+    options.graph_optimization_level = GRAPH_OPTIMIZATION_LEVELS[optimization or ORT_GRAPH_OPTIMIZATION]
+    options.execution_mode = EXECUTION_MODES[ORT_EXECUTION_MODE]
+    return options
+
+
+def _mtimes(paths):
+    return tuple(os.path.getmtime(path) for path in paths)
+
+
+# Path of the saved optimized graph of a model version
+def _optimized_path(path, variant, mtimes):
+    # Registry versions all name their file model.onnx: the directory tells them apart
+    stem = os.path.splitext(os.path.basename(path))[0] + '-' + hashlib.sha1(os.path.abspath(path).encode()).hexdigest()[:8]
+    version = '-'.join(str(int(mtime)) for mtime in mtimes)
+    return os.path.join(ORT_OPTIMIZED_MODEL_DIR, f"{stem}.{variant}.{version}.{ORT_GRAPH_OPTIMIZATION}.onnx")
+
+
+def _create_session(path, variant, build, mtimes):
+    logger.info("Loading ONNX model %s (%s)...", path, variant)
+    optimized_path = _optimized_path(path, variant, mtimes) if ORT_OPTIMIZED_MODEL_DIR else None
+
+    # Reuse the graph optimized on a previous start
+    if optimized_path and os.path.exists(optimized_path):
+        logger.info("Reusing optimized graph %s", optimized_path)
+        return ort.InferenceSession(optimized_path, make_session_options('disabled'), providers=ORT_PROVIDERS)
+
+    options = make_session_options()
+    if optimized_path:
+        os.makedirs(ORT_OPTIMIZED_MODEL_DIR, exist_ok=True)
+        options.optimized_model_filepath = optimized_path
+
+    model = build(path).SerializeToString() if build else path
+    session = ort.InferenceSession(model, options, providers=ORT_PROVIDERS)
+    logger.info("Model %s (%s) loaded successfully.", path, variant)
+    return session
+
+
+def get_session(path, variant='base', build=None, depends_on=()):
+    """
+    Return the InferenceSession of a model, loading it on first use.
+
+    - `variant`: name of the graph built from the file (e.g. 'base', 'stateful').
+    - `build`: optional function path -> ModelProto producing the variant's graph.
+    - `depends_on`: other files the variant is built from.
+
+    Sessions are cached by path, variant and file modification times: a model file
+    replaced on disk is reloaded on the next call and the previous session released.
+    """
+    paths = [path] + [p for p in depends_on if os.path.exists(p)]
+    mtimes = _mtimes(paths)
+    key = (path, variant)
+
+    cached = _sessions.get(key)
+    if cached and cached[0] == mtimes:
+        return cached[1]
+
+    with _sessions_lock:
+        cached = _sessions.get(key)
+        if cached and cached[0] == mtimes:
+            return cached[1]
+        session = _create_session(path, variant, build, mtimes)
+        _sessions[key] = (mtimes, session)
+        return session
+
+
+# Drop every cached session (they are released once no request uses them anymore)
+def clear_sessions():
+    with _sessions_lock:
+        _sessions.clear()
+
+
+# Drop the cached sessions of the models under `prefix` (an unloaded model version)
+def release_sessions(prefix):
+    with _sessions_lock:
+        for key in [key for key in _sessions if key[0].startswith(prefix)]:
+            del _sessions[key]
@@ -1,113 +1,139 @@
+import logging
 import numpy as np
+from .volatility import calculate_volatility as estimate_volatility
+
+logger = logging.getLogger(__name__)
 
 # Calcul robuste de la volatilité à partir des rendements logarithmiques
-def calculate_volatility(prices, window=5, use_exponential_weighting=False, clean_data=True):
+def calculate_volatility(prices, window=5, use_exponential_weighting=False, clean_data=True, timeframe='15min'):
     """
-    Calcule une volatilité robuste à partir des rendements logarithmiques des prix.
+    Calcule une volatilité robuste à partir des rendements logarithmiques des prix
+    (voir volatility.py).
 
     - prices: Liste des prix ou tableau numpy à partir desquels calculer la volatilité.
     - window: Période de temps sur laquelle calculer la volatilité. Par exemple, 10 périodes.
     - use_exponential_weighting: Si True, utilise une moyenne mobile exponentielle pour donner plus de poids aux rendements récents.
     - clean_data: Si True, nettoie les NaN et outliers avant le calcul.
+    - timeframe: Timeframe des prix, pour l'annualisation.
 
-    Retourne la volatilité calculée sous forme d'écart-type annualisé ou par période définie.
+    Retourne la volatilité annualisée.
     """
-    
-    # Vérifier que les données sont suffisantes pour le calcul
-    if len(prices) < window + 1:
-        raise ValueError(f"Not enough price data to calculate volatility for window {window}. Minimum required: {window + 1}")
-
-    # Nettoyage des données
-    prices = np.asarray(prices)
-    if clean_data:
-        # Remplacer les NaN par la valeur précédente ou la moyenne
-        prices = np.nan_to_num(prices, nan=np.nanmean(prices))
-
-        # Suppression des outliers extrêmes (basé sur un z-score)
-        z_scores = (prices - np.mean(prices)) / np.std(prices)
-        prices = prices[np.abs(z_scores) < 3]  # On garde seulement les z-scores inférieurs à 3
-
-    # Calcul des rendements logarithmiques
-    log_returns = np.diff(np.log(prices))
-
-    # Calcul de la volatilité avec ou sans pondération exponentielle
-    if use_exponential_weighting:
-        # Moyenne mobile exponentielle pour pondérer plus les rendements récents
-        weights = np.exp(np.linspace(-1., 0., window))
-        weights /= weights.sum()  # Normaliser les poids
-        weighted_avg = np.convolve(log_returns[-window:], weights, mode='valid')
-        volatility = np.std(weighted_avg)
-    else:
-        # Volatilité simple : écart-type des rendements logarithmiques
-        volatility = np.std(log_returns[-window:])
-
-    # Annualisation de la volatilité si nécessaire
-    periods_per_year = 365 * 24 * 12  # Si on suppose 5 min par période dans les cryptos
-    annualized_volatility = volatility * np.sqrt(periods_per_year)
+    estimator = 'ewma' if use_exponential_weighting else 'close_to_close'
+    annualized_volatility = estimate_volatility(prices, window, timeframe, estimator, clean_data)
 
-    print(f"Volatility calculated: {volatility}, Annualized Volatility: {annualized_volatility}")
+    logger.debug("Volatility calculated: Annualized Volatility: %s", annualized_volatility)
     return annualized_volatility
 
 
+# Codes des signaux dans les tableaux: 1 = Buy, -1 = Sell, 0 = Hold
+SIGNAL_LABELS = np.array(["Sell", "Hold", "Buy"])
+SIGNAL_CODES = {"Buy": 1, "Sell": -1, "Hold": 0}
+
+
+# Libellés ("Buy", "Sell", "Hold") d'un tableau de codes
+def signal_labels(directions):
+    return SIGNAL_LABELS[np.asarray(directions, dtype=np.int64) + 1]
+
+
+# Tolérance ajustée en fonction de la volatilité
+def signal_tolerance(volatility):
+    return 0.005 * (1 + np.asarray(volatility, dtype=np.float64))
+
+
+def generate_signals_batch(current_prices, predicted_prices, rsi_values, levels, volatilities):
+    """
+    Génère les signaux de n paires (symbole, timeframe) en une seule passe NumPy.
+
+    - current_prices, predicted_prices, rsi_values, volatilities: tableaux de taille n.
+    - levels: matrice (n, k) des niveaux Fibonacci à vérifier (NaN pour un niveau ignoré,
+      par exemple égal aux niveaux 0% ou 100%, voir fibonacci.fibonacci_level_matrix).
+
+    Retourne (directions, confidences): 1 (Buy), -1 (Sell) ou 0 (Hold), et la confiance en
+    pourcentage (0 pour Hold).
+    """
+    current = np.asarray(current_prices, dtype=np.float64)
+    predicted = np.asarray(predicted_prices, dtype=np.float64)
+    rsi = np.asarray(rsi_values, dtype=np.float64)
+    levels = np.asarray(levels, dtype=np.float64).reshape(len(current), -1)
+    tolerance = signal_tolerance(volatilities)
+
+    # Prix proche d'un niveau de Fibonacci (les NaN ne sont jamais proches)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        near_resistance = (np.abs(current[:, None] - levels) / levels < tolerance[:, None]).any(axis=1)
+
+    # Pas de signal si le RSI est trop haut/bas ou si le prix est proche d'une résistance
+    blocked = (rsi > 70) | (rsi < 30) | near_resistance | np.isnan(predicted)
+    directions = np.where(predicted > current * (1 + tolerance), 1, np.where(predicted < current * (1 - tolerance), -1, 0))
+    directions = np.where(blocked, 0, directions)
+
+    # Confiance basée sur l'écart du prix prédit et la volatilité, limitée à 100%
+    confidences = np.minimum(np.abs(predicted - current) / (current * tolerance) * 100, 100)
+    return directions, np.where(directions != 0, confidences, 0.0)
+
+
+def combine_signals(directions, confidences, groups, n_groups):
+    """
+    Combine les signaux des timeframes de chaque groupe (symbole): Buy ou Sell si tous les
+    timeframes du groupe sont d'accord, Hold sinon. La confiance est la moyenne du groupe.
+
+    - groups: index du groupe (0 .. n_groups - 1) de chaque signal.
+
+    Retourne (directions, confidences) de taille n_groups.
+    """
+    groups = np.asarray(groups, dtype=np.int64)
+    counts = np.maximum(np.bincount(groups, minlength=n_groups), 1)
+    buys = np.bincount(groups, weights=np.asarray(directions) == 1, minlength=n_groups)
+    sells = np.bincount(groups, weights=np.asarray(directions) == -1, minlength=n_groups)
+    combined = np.where(buys == counts, 1, np.where(sells == counts, -1, 0))
+    return combined, np.bincount(groups, weights=confidences, minlength=n_groups) / counts
+
+
+def stop_loss_take_profit_batch(entry_prices, directions, volatilities):
+    """
+    Stop-loss et take-profit de n trades: 2% / 5% de part et d'autre du prix d'entrée,
+    ajustés pour la volatilité. NaN pour les signaux Hold.
+    """
+    entry = np.asarray(entry_prices, dtype=np.float64)
+    directions = np.asarray(directions)
+    adjustment = 1 + np.asarray(volatilities, dtype=np.float64)
+    stop_loss = np.where(directions != 0, entry * (1 - directions * 0.02 * adjustment), np.nan)
+    take_profit = np.where(directions != 0, entry * (1 + directions * 0.05 * adjustment), np.nan)
+    return stop_loss, take_profit
+
+
 # Générer des signaux de trading basés sur les prix, RSI, niveaux Fibonacci et la volatilité
-def generate_signal_with_confidence(current_price, predicted_price, rsi_value, fibonacci_levels, prices):
+def generate_signal_with_confidence(current_price, predicted_price, rsi_value, fibonacci_levels, prices=None, volatility=None):
     """
-    Génère un signal de trading basé sur les niveaux Fibonacci, l'RSI et la volatilité.
+    Génère un signal de trading basé sur les niveaux Fibonacci, l'RSI et la volatilité
+    (une ligne de generate_signals_batch).
 
     - current_price: Prix actuel.
     - predicted_price: Prix prédit.
     - rsi_value: Valeur actuelle du RSI.
     - fibonacci_levels: Niveaux Fibonacci calculés pour la période.
-    - prices: Série de prix (pour le calcul de la volatilité).
+    - prices: Série de prix, pour calculer la volatilité si elle n'est pas donnée.
+    - volatility: Volatilité déjà calculée par l'appelant.
 
     Retourne un signal ("Buy", "Sell", "Hold") en fonction des critères, et une confiance en pourcentage.
     """
-    
-    # Calculer la volatilité des prix
-    volatility = calculate_volatility(prices, window=5, use_exponential_weighting=True)
-
-    # Tolérance ajustée en fonction de la volatilité
-    tolerance = 0.005 * (1 + volatility)  # Ajustement de la tolérance basé sur la volatilité
-
-    # Vérifier si le prix actuel est proche des niveaux de Fibonacci (exclure les niveaux 0% et 100%)
-    near_resistance = any(
-        abs(current_price - level) / level < tolerance 
-        for level in fibonacci_levels.values() 
-        if level != fibonacci_levels['0%'] and level != fibonacci_levels['100%']
-    )
-
-    # Logging for debugging
-    print(f"RSI: {rsi_value}, Near Resistance: {near_resistance}, Volatility: {volatility}, Tolerance: {tolerance}")
-
-    # Ne pas générer de signal si le RSI est trop haut/bas ou si le prix est proche d'une résistance
-    if rsi_value > 70 or rsi_value < 30 or near_resistance:
-        print(f"RSI trop élevé/bas ou prix proche d'une résistance, pas de signal. RSI: {rsi_value}, Proximité Fibonacci: {near_resistance}")
-        return "Hold", 0  # Pas de signal et confiance 0
-
-    # Calcul de la différence de prix et du niveau de confiance basé sur l'écart du prix prédit et la volatilité
-    price_difference = abs(predicted_price - current_price)
-    confidence = (price_difference / (current_price * tolerance)) * 100  # Confiance basée sur l'écart et la volatilité
-
-    # Limiter la confiance à 100%
-    confidence = min(confidence, 100)
-
-    # Décision d'achat/vente basée sur le prix prédit, ajusté pour la volatilité
-    if predicted_price > current_price * (1 + tolerance):  # Signal d'achat ajusté pour la volatilité
-        print(f"Signal: Buy, Confiance: {confidence}%")
-        return f"Buy", confidence
-    elif predicted_price < current_price * (1 - tolerance):  # Signal de vente ajusté pour la volatilité
-        print(f"Signal: Sell, Confiance: {confidence}%")
-        return f"Sell", confidence
-    else:
-        print(f"Signal: Hold, Confiance: 0%")
-        return "Hold", 0  # No confidence for Hold signals
+    if volatility is None:
+        volatility = calculate_volatility(prices, window=5, use_exponential_weighting=True)
 
+    # Exclure les niveaux 0% et 100%
+    levels = [level for level in fibonacci_levels.values()
+              if level != fibonacci_levels['0%'] and level != fibonacci_levels['100%']]
+    directions, confidences = generate_signals_batch([current_price], [predicted_price], [rsi_value], [levels or [np.nan]], [volatility])
+
+    signal, confidence = str(signal_labels(directions)[0]), float(confidences[0])
+    logger.debug("Signal: %s, Confiance: %s%%, RSI: %s, Volatility: %s", signal, confidence, rsi_value, volatility)
+    return signal, confidence
 
 
 # Calcul du stop-loss et du take-profit en fonction du signal et de la volatilité
 def calculate_stop_loss_take_profit(entry_price, signal, volatility):
     """
-    Ajuste dynamiquement les niveaux de stop-loss et de take-profit en fonction de la volatilité du marché.
+    Ajuste dynamiquement les niveaux de stop-loss et de take-profit en fonction de la volatilité du marché
+    (une ligne de stop_loss_take_profit_batch).
 
     - entry_price: Le prix d'entrée pour le trade.
     - signal: Le signal généré ("Buy", "Sell", ou "Hold").
@@ -115,15 +141,11 @@ def calculate_stop_loss_take_profit(entry_price, signal, volatility):
 
     Retourne les niveaux de stop-loss et de take-profit ajustés.
     """
-
-    if signal == "Buy":
-        stop_loss = entry_price * (1 - 0.02 * (1 + volatility))  # 2% en dessous, ajusté pour la volatilité
-        take_profit = entry_price * (1 + 0.05 * (1 + volatility))  # 5% au-dessus, ajusté pour la volatilité
-    elif signal == "Sell":
-        stop_loss = entry_price * (1 + 0.02 * (1 + volatility))  # 2% au-dessus, ajusté pour la volatilité
-        take_profit = entry_price * (1 - 0.05 * (1 + volatility))  # 5% en dessous, ajusté pour la volatilité
-    else:
+    direction = SIGNAL_CODES.get(signal, 0)
+    if direction == 0:
         stop_loss = take_profit = None
+    else:
+        stop_loss, take_profit = (float(values[0]) for values in stop_loss_take_profit_batch([entry_price], [direction], [volatility]))
 
-    print(f"Calculated Stop Loss: {stop_loss}, Take Profit: {take_profit}, Volatility: {volatility}")
+    logger.debug("Calculated Stop Loss: %s, Take Profit: %s, Volatility: %s", stop_loss, take_profit, volatility)
     return stop_loss, take_profit
@@ -0,0 +1,170 @@
+# /server/training_jobs.py
+#
+# Training queue of the dashboard. Each start_training request runs models/train_lstm.py in
+# its own process (lower priority, capped torch threads) so that training does not slow down
+# inference; the progress lines it prints are streamed to the client that asked for it. The
+# trained version is published to the model registry and served from the next cycle on.
+
+import os
+import sys
+import json
+import subprocess
+import threading
+import logging
+from . import socketio
+from .markets import MODEL_DIR, MODEL_REGISTRY_DIR, TIMEFRAMES, symbol_slug, model_label, check_market
+
+logger = logging.getLogger(__name__)
+
+TRAIN_SCRIPT = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'models', 'train_lstm.py')
+# Prefix of the progress lines printed by train_lstm.py --progress
+PROGRESS_PREFIX = 'PROGRESS '
+
+# Trainings running at the same time (the others wait in the queue)
+TRAINING_CONCURRENCY = int(os.getenv('TRAINING_CONCURRENCY', '1'))
+# Torch threads of a training process, and its niceness (POSIX)
+TRAINING_THREADS = int(os.getenv('TRAINING_THREADS', str(max(1, (os.cpu_count() or 1) // 4))))
+TRAINING_NICE = int(os.getenv('TRAINING_NICE', '10'))
+TRAINING_EPOCHS = int(os.getenv('TRAINING_EPOCHS', '10'))
+
+# (symbol, timeframe) -> job waiting or running: one job per model at a time
+_jobs = {}
+_jobs_lock = threading.Lock()
+_slots = threading.Semaphore(TRAINING_CONCURRENCY)
+
+
+class TrainingInProgress(Exception):
+    pass
+
+
+def start_training_job(symbol, timeframe, sid=None):
+    """
+    Queue the training of a symbol/timeframe model and stream its progress to `sid`:
+    'training_progress' events, then 'training_complete', 'training_failed' or
+    'training_cancelled'. Raises TrainingInProgress if the model is already being trained,
+    ValueError for a symbol the server does not run or an unknown timeframe.
+    """
+    check_market(symbol)
+    if timeframe not in TIMEFRAMES:
+        raise ValueError(f"Unknown timeframe {timeframe}.")
+
+    key = (symbol, timeframe)
+    with _jobs_lock:
+        if key in _jobs:
+            raise TrainingInProgress(f"{model_label(symbol, timeframe)} model is already being trained.")
+        job = {'symbol': symbol, 'timeframe': timeframe, 'sid': sid, 'process': None, 'cancelled': False, 'version': None}
+        _jobs[key] = job
+
+    socketio.start_background_task(_run_training, job)
+    return job
+
+
+def cancel_training_job(symbol, timeframe, sid=None):
+    """
+    Cancel the training of a model started by `sid` (queued or running). Returns True if a
+    job was cancelled.
+    """
+    with _jobs_lock:
+        job = _jobs.get((symbol, timeframe))
+        if job is None or job['sid'] != sid:
+            return False
+        job['cancelled'] = True
+        process = job['process']
+        if process is None:
+            # Still queued: the model can be requested again right away
+            del _jobs[(symbol, timeframe)]
+
+    if process is None:
+        logger.info("Queued training of the %s model cancelled.", model_label(symbol, timeframe))
+        _emit(job, 'training_cancelled')
+    elif process.poll() is None:
+        logger.info("Cancelling the training of the %s model...", model_label(symbol, timeframe))
+        process.terminate()
+    return True
+
+
+# Models waiting or being trained, with their status
+def training_jobs():
+    with _jobs_lock:
+        return [{'symbol': job['symbol'], 'timeframe': job['timeframe'], 'running': job['process'] is not None}
+                for job in _jobs.values()]
+
+
+def _emit(job, event, **values):
+    payload = {'model': symbol_slug(job['symbol']), 'symbol': job['symbol'], 'timeframe': job['timeframe'], **values}
+    socketio.emit(event, payload, to=job['sid'])
+
+
+def _lower_priority():
+    os.nice(TRAINING_NICE)
+
+
+def _command(job):
+    return [
+        sys.executable, TRAIN_SCRIPT, '--symbols', job['symbol'], '--timeframes', job['timeframe'],
+        '--data-dir', MODEL_DIR, '--registry-dir', MODEL_REGISTRY_DIR,
+        '--epochs', str(TRAINING_EPOCHS), '--threads', str(TRAINING_THREADS), '--progress',
+    ]
+
+
+def _run_training(job):
+    label = model_label(job['symbol'], job['timeframe'])
+    error = None
+    try:
+        _emit(job, 'training_progress', status='queued', progress=0)
+        with _slots:
+            with _jobs_lock:
+                if job['cancelled']:
+                    return
+                logger.info("Training the %s model...", label)
+                job['process'] = subprocess.Popen(
+                    _command(job), stdout=subprocess.PIPE, stderr=subprocess.STDOUT, text=True, bufsize=1,
+                    env={**os.environ, 'PYTHONUNBUFFERED': '1'},
+                    preexec_fn=_lower_priority if os.name == 'posix' else None,
+                )
+
+            # Progress lines go to the client, everything else to the server log
+            for line in job['process'].stdout:
+                if not line.startswith(PROGRESS_PREFIX):
+                    logger.info("[training %s] %s", label, line.rstrip())
+                    continue
+                values = json.loads(line[len(PROGRESS_PREFIX):])
+                if values['status'] == 'failed':
+                    error = values.get('error')
+                    continue
+                job['version'] = values.get('version', job['version'])
+                _emit(job, 'training_progress', **values)
+
+            code = job['process'].wait()
+            if code != 0 and not job['cancelled']:
+                error = error or f"Training exited with code {code}."
+    except Exception as e:
+        error = str(e)
+    finally:
+        # Nobody reads the pipe of a process still running after an error: stop it
+        process = job['process']
+        if process is not None and process.poll() is None:
+            logger.warning("Stopping the training process of the %s model...", label)
+            process.terminate()
+            try:
+                process.wait(timeout=10)
+            except subprocess.TimeoutExpired:
+                process.kill()
+                process.wait()
+
+        with _jobs_lock:
+            if _jobs.get((job['symbol'], job['timeframe'])) is job:
+                del _jobs[(job['symbol'], job['timeframe'])]
+
+        if job['cancelled'] and job['process'] is None:
+            # Cancelled while queued: already reported by cancel_training_job
+            pass
+        elif job['cancelled']:
+            logger.info("Training of the %s model cancelled.", label)
+            _emit(job, 'training_cancelled')
+        elif error:
+            logger.error("Training of the %s model failed: %s", label, error)
+            _emit(job, 'training_failed', error=error)
+        else:
+            logger.info("%s model trained: version %s.", label, job['version'])
+            _emit(job, 'training_complete', version=job['version'])
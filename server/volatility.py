@@ -0,0 +1,145 @@
+# /server/volatility.py
+#
+# Volatility estimators shared by the signals, the stop loss / take profit and the
+# prediction adjustment. Every estimator returns the volatility per bar; `annualize` scales
+# it with the number of bars per year of the timeframe (markets.TIMEFRAMES).
+#
+# - close_to_close: std of the last `window` log returns (outlier prices dropped first)
+# - ewma: exponentially weighted RMS of the last `window` log returns (recent returns weigh more)
+# - parkinson: high/low range of the last `window` bars
+# - garman_klass: open/high/low/close of the last `window` bars
+#
+# get_volatility memoizes the results per (symbol, timeframe, estimator, window) and series
+# version (last bar time and close), so each one is computed once per bar.
+
+import os
+import math
+import threading
+import numpy as np
+from .markets import TIMEFRAMES
+
+# Estimators of the signal tolerance and of the stop loss / take profit distances
+SIGNAL_VOLATILITY_ESTIMATOR = os.getenv('SIGNAL_VOLATILITY_ESTIMATOR', 'ewma')
+STOP_LOSS_VOLATILITY_ESTIMATOR = os.getenv('STOP_LOSS_VOLATILITY_ESTIMATOR', 'close_to_close')
+
+
+def periods_per_year(timeframe):
+    """
+    Number of bars per year of a timeframe, given by its name ('15min', 'hourly'...) or its
+    interval ('15m', '1h'...). Crypto markets trade 365 days a year.
+    """
+    spec = TIMEFRAMES.get(timeframe) or next((spec for spec in TIMEFRAMES.values() if spec['interval'] == timeframe), None)
+    if spec is None:
+        raise ValueError(f"Unknown timeframe {timeframe}.")
+    return spec['bars_per_day'] * 365
+
+
+def annualize(volatility, timeframe):
+    return volatility * math.sqrt(periods_per_year(timeframe))
+
+
+# Drop the NaN and the prices with a z-score of 3 or more over the series
+def clean_prices(prices):
+    prices = np.asarray(prices, dtype=np.float64)
+    prices = np.nan_to_num(prices, nan=np.nanmean(prices))
+    std = prices.std()
+    if std == 0:
+        return prices
+    return prices[np.abs((prices - prices.mean()) / std) < 3]
+
+
+# Weights of the last `window` returns for the EWMA estimator, oldest first (sum to 1)
+def ewma_weights(window):
+    weights = np.exp(np.linspace(-1., 0., window))
+    return weights / weights.sum()
+
+
+def close_to_close(closes, window=5, clean_data=True):
+    prices = clean_prices(closes) if clean_data else np.asarray(closes, dtype=np.float64)
+    log_returns = np.diff(np.log(prices))[-window:]
+    return float(np.std(log_returns)) if len(log_returns) else 0.0
+
+
+def ewma(closes, window=5, clean_data=True):
+    prices = clean_prices(closes) if clean_data else np.asarray(closes, dtype=np.float64)
+    log_returns = np.diff(np.log(prices))[-window:]
+    if not len(log_returns):
+        return 0.0
+    return float(np.sqrt(np.sum(ewma_weights(len(log_returns)) * log_returns ** 2)))
+
+
+def parkinson(highs, lows, window=5):
+    ranges = np.log(np.asarray(highs, dtype=np.float64)[-window:] / np.asarray(lows, dtype=np.float64)[-window:])
+    return float(np.sqrt(np.nanmean(ranges ** 2) / (4 * math.log(2)))) if len(ranges) else 0.0
+
+
+def garman_klass(opens, highs, lows, closes, window=5):
+    opens, highs, lows, closes = (np.asarray(values, dtype=np.float64)[-window:] for values in (opens, highs, lows, closes))
+    if not len(closes):
+        return 0.0
+    variance = 0.5 * np.log(highs / lows) ** 2 - (2 * math.log(2) - 1) * np.log(closes / opens) ** 2
+    return float(np.sqrt(max(np.nanmean(variance), 0.0)))
+
+
+# Estimators over a DataFrame of OHLC bars
+ESTIMATORS = {
+    'close_to_close': lambda data, window: close_to_close(data['Close'], window),
+    'ewma': lambda data, window: ewma(data['Close'], window),
+    'parkinson': lambda data, window: parkinson(data['High'], data['Low'], window),
+    'garman_klass': lambda data, window: garman_klass(data['Open'], data['High'], data['Low'], data['Close'], window),
+}
+
+
+def calculate_volatility(prices, window=5, timeframe=None, estimator='close_to_close', clean_data=True):
+    """
+    Volatility of a price series (close_to_close, ewma) or of OHLC bars (any estimator),
+    annualized for `timeframe`, or per bar if `timeframe` is None.
+    """
+    if estimator not in ESTIMATORS:
+        raise ValueError(f"Unknown volatility estimator {estimator}.")
+    if len(prices) < window + 1:
+        raise ValueError(f"Not enough price data to calculate volatility with window {window}. Minimum required: {window + 1}")
+
+    if estimator in ('parkinson', 'garman_klass'):
+        volatility = ESTIMATORS[estimator](prices, window)
+    else:
+        closes = prices['Close'] if hasattr(prices, 'columns') else prices
+        volatility = (ewma if estimator == 'ewma' else close_to_close)(closes, window, clean_data)
+    return annualize(volatility, timeframe) if timeframe else volatility
+
+
+# (symbol, timeframe, estimator, window) -> (series version, annualized volatility)
+_cache = {}
+_cache_lock = threading.Lock()
+_cache_stats = {'hits': 0, 'misses': 0}
+
+
+# Version of a bar series: a new or updated bar changes it
+def series_version(data):
+    return (data.index[-1], float(data['Close'].iloc[-1]), len(data))
+
+
+def get_volatility(symbol, timeframe, data, estimator='close_to_close', window=5):
+    """
+    Annualized volatility of the bars of a symbol/timeframe, computed once per series
+    version and shared by every caller of the same bar.
+    """
+    key = (symbol, timeframe, estimator, window)
+    version = series_version(data)
+    with _cache_lock:
+        cached = _cache.get(key)
+        if cached and cached[0] == version:
+            _cache_stats['hits'] += 1
+            return cached[1]
+        _cache_stats['misses'] += 1
+
+    volatility = calculate_volatility(data, window, timeframe, estimator)
+    with _cache_lock:
+        _cache[key] = (version, volatility)
+    return volatility
+
+
+# Hits and misses of get_volatility
+def cache_stats():
+    with _cache_lock:
+        return dict(_cache_stats, entries=len(_cache))
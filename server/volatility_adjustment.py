@@ -1,14 +1,18 @@
-import numpy as np
 import csv
+import logging
 import datetime
+from .volatility import close_to_close
 
-# File path for logging volatility data
-log_file_path = './models/prediction_log.csv'
+logger = logging.getLogger(__name__)
+
+# File path for logging volatility data (forecasts go to the prediction journal)
+log_file_path = './models/volatility_log.csv'
 
 # Function to calculate volatility based on price changes over a specified window
 def calculate_volatility(prices, window=5):
     """
-    Calculate rolling volatility (standard deviation of price changes) over the given window.
+    Calculate the volatility (standard deviation of the log returns) over the given window,
+    per bar (not annualized).
     
     Parameters:
     - prices: List of historical price data.
@@ -19,9 +23,7 @@ def calculate_volatility(prices, window=5):
     """
     if len(prices) < window:
         return 0.0
-    log_returns = np.diff(np.log(prices))  # Calculate log returns
-    volatility = np.std(log_returns[-window:])  # Standard deviation over the window
-    return volatility
+    return close_to_close(prices, window, clean_data=False)
 
 # Function to adjust predictions based on volatility
 def adjust_predictions_for_volatility(predicted_prices, volatility, threshold=0.02):
@@ -38,7 +40,7 @@ def adjust_predictions_for_volatility(predicted_prices, volatility, threshold=0.
     - adjusted_prices: The adjusted list of predictions, with dampened values if volatility is high.
     """
     if volatility > threshold:
-        print(f"High volatility detected: {volatility}. Adjusting predictions.")
+        logger.debug("High volatility detected: %s. Adjusting predictions.", volatility)
         dampening_factor = 0.95  # Reduce predictions by 5% in case of high volatility
         adjusted_prices = [price * dampening_factor for price in predicted_prices]
         return adjusted_prices
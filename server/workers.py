@@ -0,0 +1,77 @@
+# /server/workers.py
+
+import os
+import threading
+import logging
+from concurrent.futures import ThreadPoolExecutor
+from . import socketio
+
+logger = logging.getLogger(__name__)
+
+# Pool for blocking network/disk I/O (bar downloads)
+IO_WORKERS = int(os.getenv('IO_WORKERS', '4'))
+# Pool for inference and indicators (ONNX Runtime releases the GIL while it runs)
+CPU_WORKERS = int(os.getenv('CPU_WORKERS', str(min(os.cpu_count() or 1, 4))))
+# Pool for the nodes of the per-symbol pipeline graphs (pipeline_graph.py), apart from the
+# symbol jobs of cpu_pool that wait for them
+GRAPH_WORKERS = int(os.getenv('GRAPH_WORKERS', str(CPU_WORKERS)))
+# Maximum number of distinct jobs waiting or running; more requests are refused
+MAX_PENDING_JOBS = int(os.getenv('MAX_PENDING_JOBS', '16'))
+
+io_pool = ThreadPoolExecutor(max_workers=IO_WORKERS, thread_name_prefix='geotrade-io')
+cpu_pool = ThreadPoolExecutor(max_workers=CPU_WORKERS, thread_name_prefix='geotrade-cpu')
+graph_pool = ThreadPoolExecutor(max_workers=GRAPH_WORKERS, thread_name_prefix='geotrade-graph')
+
+# In-flight jobs: key -> callbacks to call with the result
+_jobs = {}
+_jobs_lock = threading.Lock()
+
+
+class JobQueueFull(Exception):
+    pass
+
+
+def submit_job(key, fn, *args, callback=None):
+    """
+    Run `fn(*args)` as a background task and call `callback(result, error)` when it is done.
+
+    Jobs are coalesced by `key`: while a job with the same key is waiting or running, a new
+    submission only adds its callback to it. Returns True if a new job was started.
+    Raises JobQueueFull when MAX_PENDING_JOBS distinct jobs are already in flight.
+    """
+    with _jobs_lock:
+        if key in _jobs:
+            _jobs[key].append(callback)
+            return False
+        if len(_jobs) >= MAX_PENDING_JOBS:
+            raise JobQueueFull(f"{len(_jobs)} jobs already in flight.")
+        _jobs[key] = [callback]
+
+    socketio.start_background_task(_run_job, key, fn, *args)
+    return True
+
+
+def _run_job(key, fn, *args):
+    result, error = None, None
+    try:
+        result = fn(*args)
+    except Exception as e:
+        logger.error("Job %s failed: %s", key, e)
+        error = e
+
+    # Requests arriving from now on start a new job
+    with _jobs_lock:
+        callbacks = _jobs.pop(key)
+
+    for callback in callbacks:
+        if callback is not None:
+            try:
+                callback(result, error)
+            except Exception as e:
+                logger.error("Callback of job %s failed: %s", key, e)
+
+
+# Number of jobs waiting or running
+def pending_jobs():
+    with _jobs_lock:
+        return len(_jobs)